@@ -1,13 +1,24 @@
 import os
+import json
+import asyncio
+import argparse
 import uvicorn
 import logging
+import time
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Depends, HTTPException
+from typing import Dict, Optional
+from fastapi import FastAPI, Depends, HTTPException, Header, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from cognition.llms.ollama import OllamaModel
+import settings
+from cognition.llms.registry import LLMRegistry
+from cognition.llms import metrics
 from cognition.engines.chat_engine import ChatEngine, Conversation
+from cognition.engines.admission import AdmissionController, AdmissionRejected
 from cognition.models.chat_models import ChatMessage, ChatHistory
+from memory.session_store import BaseSessionStore, SessionLeaseLost, create_session_store
+from memory.response_cache import ResponseCache
 from personality.k3nn import system_prompt as k3nn
 
 logging.basicConfig(level=logging.INFO)
@@ -18,22 +29,99 @@ CERTS_DIR = "/Users/kenneth/Desktop/lab/k3nn.computer/certs"
 ssl_keyfile = os.getenv('SSL_KEYFILE', CERTS_DIR + '/key.pem')
 ssl_certfile = os.getenv('SSL_CERTFILE', CERTS_DIR + '/cert.pem')
 
+def llm_options() -> dict:
+    options = {}
+    if settings.LLM_TEMPERATURE is not None:
+        options["temperature"] = settings.LLM_TEMPERATURE
+    return options
+
 # globals
-chat_engine = None
+llm_registry = None
+session_store = None
+response_cache = None
+admission_controllers: Dict[str, AdmissionController] = {}
 system_prompt = k3nn
+ready = False
+startup_task = None
+
+def new_conversation() -> Conversation:
+    conversation = Conversation()
+    conversation.add_message(ChatMessage(role="system", content=system_prompt))
+    return conversation
+
+def summaries_enabled() -> bool:
+    # Never fall back to the chat model: summaries would compete with live turns for it.
+    return settings.SUMMARY_ENABLED and bool(settings.SUMMARY_MODEL)
+
+def new_chat_engine(llm, conversation: Conversation) -> ChatEngine:
+    """A ChatEngine for one turn, with the summarizer backend when rolling summaries are enabled."""
+    summarizer = llm_registry.get(settings.SUMMARY_BACKEND, settings.SUMMARY_MODEL) if summaries_enabled() else None
+    return ChatEngine(llm, conversation, summarizer=summarizer)
+
+async def warm_up(llm):
+    """Run the backend's warm-up with the persona prompt; a failed warm-up is logged, not fatal."""
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(llm.warmup(system_prompt, settings.WARMUP_PROMPT), settings.WARMUP_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning(f"Warm-up timed out after {settings.WARMUP_TIMEOUT_SECONDS}s")
+    except Exception as e:
+        logger.warning(f"Warm-up failed: {str(e)}")
+    else:
+        logger.info(f"Warm-up finished in {time.perf_counter() - started:.2f}s")
+
+async def load_backend():
+    """Import, construct and warm up the configured backend off the event loop, then mark the app ready."""
+    global ready
+    started = time.perf_counter()
+    try:
+        llm = await asyncio.to_thread(llm_registry.get, settings.LLM_BACKEND, settings.LLM_MODEL, **llm_options())
+    except Exception as e:
+        logger.error(f"Failed to load {settings.LLM_BACKEND} backend: {str(e)}")
+        raise
+    if summaries_enabled():
+        await asyncio.to_thread(llm_registry.get, settings.SUMMARY_BACKEND, settings.SUMMARY_MODEL)
+    elif settings.SUMMARY_ENABLED:
+        logger.warning("SUMMARY_ENABLED is set but SUMMARY_MODEL is not; rolling summaries are off")
+    if settings.WARMUP_ENABLED:
+        await warm_up(llm)
+    ready = True
+    logger.info(f"{settings.LLM_BACKEND} backend ready in {time.perf_counter() - started:.2f}s")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting up...")
-    global chat_engine
-    llm = OllamaModel()
-    conversation = Conversation()
-    conversation.add_message(ChatMessage(role="system", content=system_prompt))
-    chat_engine = ChatEngine(llm, conversation)
+    global llm_registry, session_store, response_cache, startup_task
+    llm_registry = LLMRegistry()
+    if settings.API_FAST_START:
+        # Serve /health immediately; /ready flips once the backend has loaded and warmed up.
+        startup_task = asyncio.create_task(load_backend())
+    else:
+        await load_backend()
+    session_store = create_session_store(
+        settings.SESSION_BACKEND,
+        new_conversation,
+        db_path=settings.SESSION_DB_PATH,
+        max_sessions=settings.SESSION_MAX_SESSIONS,
+        ttl=settings.SESSION_TTL_SECONDS,
+        max_bytes=settings.SESSION_MAX_BYTES,
+    )
+    if settings.RESPONSE_CACHE_ENABLED:
+        response_cache = ResponseCache(
+            max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+            ttl=settings.RESPONSE_CACHE_TTL_SECONDS,
+            cache_dir=settings.RESPONSE_CACHE_DIR,
+            max_disk_bytes=settings.RESPONSE_CACHE_MAX_DISK_BYTES,
+            allow_sampled=settings.RESPONSE_CACHE_ALLOW_SAMPLED,
+        )
     yield
     # Shutdown
     logger.info("Shutting down...")
+    if startup_task is not None and not startup_task.done():
+        startup_task.cancel()
+    await llm_registry.aclose()
+    await session_store.aclose()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -52,25 +140,245 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def get_chat_engine():
-    global chat_engine
-    return chat_engine
+class MetricsMiddleware:
+    """Times each HTTP request until its last body chunk, so streamed responses are measured in full."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            endpoint = route.path if route is not None else "unmatched"
+            metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+            metrics.HTTP_REQUESTS.inc(endpoint=endpoint, status=status)
+            if status >= 500:
+                metrics.HTTP_ERRORS.inc(endpoint=endpoint)
+
+app.add_middleware(MetricsMiddleware)
+
+def get_llm_registry():
+    return llm_registry
+
+def get_llm(registry: LLMRegistry = Depends(get_llm_registry)):
+    if not ready:
+        raise HTTPException(status_code=503, detail="Model is still loading", headers={"Retry-After": "5"})
+    return registry.get(settings.LLM_BACKEND, settings.LLM_MODEL, **llm_options())
+
+def get_session_store():
+    return session_store
+
+def get_response_cache():
+    return response_cache
+
+def get_admission(llm=Depends(get_llm)):
+    # One controller per backend class, so a saturated backend never starves another.
+    backend = type(llm).__name__
+    controller = admission_controllers.get(backend)
+    if controller is None:
+        controller = admission_controllers[backend] = AdmissionController(
+            max_concurrency=settings.ADMISSION_MAX_CONCURRENCY,
+            max_queue=settings.ADMISSION_MAX_QUEUE,
+            max_queue_per_client=settings.ADMISSION_MAX_QUEUE_PER_CLIENT,
+        )
+    return controller
+
+def get_client_id(request: Request, x_client_id: Optional[str] = Header(default=None)) -> str:
+    return x_client_id or (request.client.host if request.client else "anonymous")
+
+class ClientDisconnected(Exception):
+    pass
+
+async def until_disconnected(request: Request, awaitable, poll_interval: float = 0.25):
+    """
+    Await `awaitable`, cancelling it as soon as the client goes away. The
+    cancellation propagates into the backend call (closing Ollama's HTTP
+    request, or stopping HuggingFace generation) and frees queued admission slots.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info(f"Client disconnected from {request.url.path}; cancelling generation")
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except BaseException:
+                pass
+
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected):
+    # 499 (client closed request); nobody is left to read it, but it shows up in metrics.
+    return Response(status_code=499)
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(SessionLeaseLost)
+async def session_lease_lost_handler(request: Request, exc: SessionLeaseLost):
+    # The turn ran but its reply wasn't saved; the client should resend it.
+    return JSONResponse(status_code=409, content={"detail": str(exc), "session_id": exc.session_id})
 
 class ChatRequest(BaseModel):
     message: str
+    session_id: Optional[str] = None
+
+class DeltaChatRequest(BaseModel):
+    message: str
+    session_id: Optional[str] = None
+    # Index of the last message the client already holds; -1 for a new session.
+    last_seen_index: int = -1
 
 @app.post("/chat-engine")
-async def chat_engine(request: ChatRequest, chat_engine: ChatEngine = Depends(get_chat_engine)):
+async def chat_with_engine(
+    request: ChatRequest,
+    http_request: Request,
+    response: Response,
+    x_session_id: Optional[str] = Header(default=None),
+    llm=Depends(get_llm),
+    sessions: BaseSessionStore = Depends(get_session_store),
+    admission: AdmissionController = Depends(get_admission),
+    client_id: str = Depends(get_client_id),
+):
     logger.info(f"Received chat request: {request}")
+    session_id = request.session_id or x_session_id
+
+    async def turn():
+        async with admission.admit(client_id):
+            try:
+                async with sessions.session(session_id) as session:
+                    chat_engine = new_chat_engine(llm, session.conversation)
+                    reply = await chat_engine.achat(request.message)
+                    logger.info(f"Chat response for session {session.session_id}: {reply}")
+                return reply, session.session_id
+            except Exception as e:
+                logger.error(f"Error in chat endpoint: {str(e)}")
+                raise HTTPException(status_code=500, detail="Internal server error")
+
+    reply, session_id = await until_disconnected(http_request, turn())
+    response.headers["X-Session-ID"] = session_id
+    return {"response": reply, "session_id": session_id}
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    http_request: Request,
+    x_session_id: Optional[str] = Header(default=None),
+    llm=Depends(get_llm),
+    sessions: BaseSessionStore = Depends(get_session_store),
+    admission: AdmissionController = Depends(get_admission),
+    client_id: str = Depends(get_client_id),
+):
+    session_id = request.session_id or x_session_id or BaseSessionStore.new_session_id()
+    # Admit before the response starts so an overloaded server can still answer 429, and
+    # stop queueing if the client gives up first.
+    slot = await until_disconnected(http_request, admission.acquire(client_id))
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def turn():
+        try:
+            async with sessions.session(session_id) as session:
+                chat_engine = new_chat_engine(llm, session.conversation)
+                async for delta in chat_engine.stream(request.message):
+                    events.put_nowait(sse_event({"delta": delta}))
+            events.put_nowait(sse_event({"session_id": session_id}, event="done"))
+        except Exception as e:
+            logger.error(f"Error in chat stream: {str(e)}")
+            events.put_nowait(sse_event({"detail": "Internal server error"}, event="error"))
+
+    async def run_turn():
+        try:
+            await until_disconnected(http_request, turn())
+        except ClientDisconnected:
+            pass
+
+    def finished(_):
+        # The one place the slot is released: runs however the turn ended, even if it never started.
+        slot.release()
+        events.put_nowait(None)
+
+    # The turn runs as its own task, cancelled as soon as the client goes away, so the
+    # backend stream, the session and the slot are freed without waiting for the response.
+    running = asyncio.ensure_future(run_turn())
+    running.add_done_callback(finished)
+
+    async def body():
+        try:
+            while (event := await events.get()) is not None:
+                yield event
+        finally:
+            running.cancel()
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"X-Session-ID": session_id, "Cache-Control": "no-cache"},
+    )
+
+@app.websocket("/chat/ws")
+async def chat_websocket(
+    websocket: WebSocket,
+    llm=Depends(get_llm),
+    sessions: BaseSessionStore = Depends(get_session_store),
+    admission: AdmissionController = Depends(get_admission),
+):
+    """
+    Each client frame is {"message": ..., "session_id": ...}; the reply is a run of
+    {"type": "delta"} frames followed by one {"type": "done"} frame.
+    """
+    await websocket.accept()
+    session_id = websocket.headers.get("x-session-id")
+    client_id = websocket.headers.get("x-client-id") or (websocket.client.host if websocket.client else "anonymous")
     try:
-        response = chat_engine.chat(request.message)
-        logger.info(f"Chat response: {response}")
-        logger.info(f"Conversation history: {chat_engine.conversation.conversation_history}")
-        return {"response": response}
-    except Exception as e:
-        logger.error(f"Error in chat endpoint: {str(e)}")
-        raise HTTPException(status_code=500, detail="Internal server error")
-    
+        while True:
+            data = await websocket.receive_json()
+            try:
+                request = ChatRequest(**data)
+                session_id = request.session_id or session_id or BaseSessionStore.new_session_id()
+                async with admission.admit(client_id), sessions.session(session_id) as session:
+                    chat_engine = new_chat_engine(llm, session.conversation)
+                    async for delta in chat_engine.stream(request.message):
+                        await websocket.send_json({"type": "delta", "content": delta})
+                await websocket.send_json({"type": "done", "session_id": session_id})
+            except WebSocketDisconnect:
+                raise
+            except AdmissionRejected as e:
+                await websocket.send_json({"type": "error", "detail": str(e), "retry_after": e.retry_after})
+            except Exception as e:
+                logger.error(f"Error in chat websocket: {str(e)}")
+                await websocket.send_json({"type": "error", "detail": "Internal server error"})
+    except WebSocketDisconnect:
+        logger.info(f"WebSocket client for session {session_id} disconnected")
+
 # @app.post("/chat")
 # async def chat(request: ChatRequest):
 #     llm = OllamaModel(model="llama3.1")
@@ -86,10 +394,61 @@ async def chat_engine(request: ChatRequest, chat_engine: ChatEngine = Depends(ge
 #     except Exception as e:
 #         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/chat")
-async def chat(chat_history: ChatHistory):
-    llm = OllamaModel(model="llama3.1")
+@app.post("/chat/delta")
+async def chat_delta(
+    request: DeltaChatRequest,
+    http_request: Request,
+    llm=Depends(get_llm),
+    sessions: BaseSessionStore = Depends(get_session_store),
+    admission: AdmissionController = Depends(get_admission),
+    client_id: str = Depends(get_client_id),
+):
+    """
+    Incremental variant of /chat: the server keeps the history, the client sends
+    only its new message and gets back only the messages it hasn't seen yet.
+    """
+    return await until_disconnected(http_request, delta_turn(request, llm, sessions, admission, client_id))
 
+async def delta_turn(request: DeltaChatRequest, llm, sessions: BaseSessionStore, admission: AdmissionController, client_id: str):
+    async with admission.admit(client_id):
+        async with sessions.session(request.session_id) as session:
+            messages = session.conversation.conversation_history.messages
+            if request.last_seen_index >= len(messages):
+                # The server lost (or never had) what the client holds, e.g. after eviction.
+                raise HTTPException(
+                    status_code=409,
+                    detail={"message": "Session history is behind the client; resend the full history to /chat",
+                            "session_id": session.session_id,
+                            "history_length": len(messages)},
+                )
+            user_index = len(messages)
+            try:
+                await new_chat_engine(llm, session.conversation).achat(request.message)
+            except Exception as e:
+                logger.error(f"Error in delta chat endpoint: {str(e)}")
+                raise HTTPException(status_code=500, detail="Internal server error")
+            new_messages = [
+                {"index": index, "role": msg.role, "content": msg.content}
+                for index, msg in enumerate(messages[request.last_seen_index + 1:], start=request.last_seen_index + 1)
+                if index != user_index and msg.role != "system"
+            ]
+            return {
+                "session_id": session.session_id,
+                "messages": new_messages,
+                "last_index": len(messages) - 1,
+            }
+
+# Tool-call fields are left out of messages that don't use them.
+@app.post("/chat", response_model=ChatHistory, response_model_exclude_none=True)
+async def chat(
+    chat_history: ChatHistory,
+    http_request: Request,
+    response: Response,
+    llm=Depends(get_llm),
+    admission: AdmissionController = Depends(get_admission),
+    client_id: str = Depends(get_client_id),
+    cache: Optional[ResponseCache] = Depends(get_response_cache),
+):
     # make sure the object is a chat history object with chat messages
     if not isinstance(chat_history, ChatHistory):
         raise HTTPException(status_code=400, detail="Invalid chat history object")
@@ -97,15 +456,33 @@ async def chat(chat_history: ChatHistory):
     # Ensure system prompt is at the beginning
     if not chat_history.messages or chat_history.messages[0].role != "system":
         chat_history.messages.insert(0, ChatMessage(role="system", content=system_prompt))
-    
-    try:
-        response = llm.generate(chat_history.messages)
-        # response is a string, wrap it in a ChatMessage
-        ai_message = ChatMessage(role="assistant", content=response)
-        chat_history.messages.append(ai_message)
-        return chat_history
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+
+    # Cache hits are answered before admission; they never touch the backend.
+    cache_key = None
+    params = llm.generation_params()
+    if cache is not None and cache.is_cacheable(params):
+        cache_key = cache.key(chat_history.messages, params)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            response.headers["X-Cache"] = "HIT"
+            chat_history.messages.append(ChatMessage(role="assistant", content=cached))
+            return chat_history
+
+    async def generate():
+        async with admission.admit(client_id):
+            try:
+                return await llm.generate(chat_history.messages)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=str(e))
+
+    reply = await until_disconnected(http_request, generate())
+    if cache_key is not None:
+        cache.set(cache_key, reply)
+        response.headers["X-Cache"] = "MISS"
+    # reply is a string, wrap it in a ChatMessage
+    ai_message = ChatMessage(role="assistant", content=reply)
+    chat_history.messages.append(ai_message)
+    return chat_history
 
 @app.get("/")
 async def root():
@@ -113,13 +490,39 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    """Liveness: the process is up and serving."""
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: the backend is loaded and requests can be served."""
+    if not ready:
+        return JSONResponse(status_code=503, content={"status": "loading"})
+    return {"status": "ready"}
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    for backend, controller in admission_controllers.items():
+        metrics.QUEUE_DEPTH.set(controller.queued, backend=backend, queue="admission")
+    for llm in llm_registry:
+        scheduler = getattr(llm, "scheduler", None)
+        if scheduler is not None:
+            metrics.QUEUE_DEPTH.set(scheduler.queue_depth, backend=type(llm).__name__, queue="batch")
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the chat API")
+    parser.add_argument("--workers", type=int, default=settings.API_WORKERS, help="Number of uvicorn worker processes")
+    args = parser.parse_args()
+
+    if args.workers > 1 and settings.SESSION_BACKEND == "memory":
+        logger.warning("Running several workers with SESSION_BACKEND=memory; sessions will not be shared between them. Use SESSION_BACKEND=sqlite.")
+
     uvicorn.run(
         "api:app",
         host="0.0.0.0",
         port=1337,
+        workers=args.workers,
         # Comment out SSL for now
         # ssl_keyfile=ssl_keyfile,
         # ssl_certfile=ssl_certfile
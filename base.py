@@ -23,13 +23,15 @@ class BaseConfig:
                 api_key=api_key or settings.OPENAI_API_KEY
             )  # Return the asynchronous client
 
-    def get_async_openai_client(self, base_url: Optional[str] = None, api_key: Optional[str] = None):
+    def get_async_openai_client(self, base_url: Optional[str] = None, api_key: Optional[str] = None, http_client=None):
         if base_url is not None:
             return AsyncOpenAI(
                 base_url=base_url,
-                api_key=api_key or settings.OPENAI_API_KEY
+                api_key=api_key or settings.OPENAI_API_KEY,
+                http_client=http_client
             )
         else:
             return AsyncOpenAI(
-                api_key=api_key or settings.OPENAI_API_KEY
+                api_key=api_key or settings.OPENAI_API_KEY,
+                http_client=http_client
             )  # Return the asynchronous client
\ No newline at end of file
@@ -0,0 +1,114 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, AsyncIterator, Optional
+
+
+class AdmissionRejected(Exception):
+    """Raised when the wait queue is full; `retry_after` is a hint in whole seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Server busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Admission:
+    """A held concurrency slot. Releasing it more than once is harmless."""
+
+    def __init__(self, controller: "AdmissionController"):
+        self.controller = controller
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(time.monotonic() - self.started)
+
+
+class AdmissionController:
+    """
+    Bounded admission in front of one LLM backend.
+
+    At most `max_concurrency` requests run at once. Up to `max_queue` more
+    wait, no more than `max_queue_per_client` of them from any one client,
+    and freed slots are handed out round-robin across waiting clients.
+    Anything beyond that is rejected immediately instead of being left to
+    time out inside the backend.
+    """
+
+    def __init__(self, max_concurrency: int = 4, max_queue: int = 32, max_queue_per_client: int = 4):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client
+        self.active = 0
+        self.queued = 0
+        self._waiting: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._avg_service_time = 1.0
+
+    def retry_after(self) -> int:
+        """Estimate how long until a newly queued request would be admitted."""
+        backlog = (self.queued + 1) / max(self.max_concurrency, 1)
+        return max(1, math.ceil(backlog * self._avg_service_time))
+
+    async def acquire(self, client_id: str) -> Admission:
+        if self.active < self.max_concurrency and not self.queued:
+            self.active += 1
+            return Admission(self)
+
+        waiters = self._waiting.get(client_id)
+        if self.queued >= self.max_queue or (waiters and len(waiters) >= self.max_queue_per_client):
+            raise AdmissionRejected(self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        if waiters is None:
+            waiters = self._waiting[client_id] = deque()
+        waiters.append(future)
+        self.queued += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self._remove_waiter(client_id, future)
+            else:
+                # The slot was handed over just as the caller went away; pass it on.
+                self._release(None)
+            raise
+        return Admission(self)
+
+    @asynccontextmanager
+    async def admit(self, client_id: str) -> AsyncIterator[Admission]:
+        admission = await self.acquire(client_id)
+        try:
+            yield admission
+        finally:
+            admission.release()
+
+    def _remove_waiter(self, client_id: str, future: asyncio.Future):
+        waiters = self._waiting.get(client_id)
+        if waiters is None or future not in waiters:
+            return
+        waiters.remove(future)
+        self.queued -= 1
+        if not waiters:
+            del self._waiting[client_id]
+
+    def _release(self, service_time: Optional[float]):
+        if service_time is not None:
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * service_time
+        while self._waiting:
+            client_id, waiters = next(iter(self._waiting.items()))
+            future = waiters.popleft()
+            self.queued -= 1
+            if waiters:
+                # Round-robin: this client goes to the back of the line.
+                self._waiting.move_to_end(client_id)
+            else:
+                del self._waiting[client_id]
+            if not future.done():
+                # The slot passes straight to the waiter, so `active` is unchanged.
+                future.set_result(None)
+                return
+        self.active -= 1
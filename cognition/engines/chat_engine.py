@@ -1,8 +1,22 @@
 import settings
 import json
+import asyncio
+import logging
+from contextlib import aclosing
+from typing import Dict, List, Optional
 # from pydantic import BaseModel
 # from typing import List, Dict, Optional
 from cognition.models.chat_models import ChatMessage, ChatHistory
+from cognition.engines.context_window import ContextWindow, pinned_count, tool_call_start
+from cognition.llms.tool_calls import ToolCall, ToolCallDelta
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation. Merge the new messages into the "
+    "summary so far. Keep names, facts, preferences, decisions and open questions; drop "
+    "small talk. Reply with the updated summary only."
+)
 
 # # create a chat message object that is a dictionary of role and content and tools
 # class ChatMessage(BaseModel):
@@ -17,6 +31,14 @@ from cognition.models.chat_models import ChatMessage, ChatHistory
 class Conversation:
     def __init__(self):
         self.conversation_history = ChatHistory(messages=[])
+        # Set by the session store; lets backends keep prompt state for this conversation.
+        self.session_id: Optional[str] = None
+        self.context_window = ContextWindow(settings.CONTEXT_MAX_TOKENS)
+        # Running summary of the turns before `summarized_upto`, which are no longer sent.
+        self.summary: Optional[str] = None
+        self.summary_message: Optional[ChatMessage] = None
+        self.summarized_upto = 0
+        self._summary_task: Optional[asyncio.Task] = None
 
     def add_message(self, message: ChatMessage):
         self.conversation_history.messages.append(message)
@@ -34,6 +56,73 @@ class Conversation:
         # print("conversation_history:")
         # print(self.conversation_history)
 
+    def prompt_messages(self) -> List[ChatMessage]:
+        """History as it should be sent: system prompt, running summary if any, then the unsummarized turns."""
+        messages = self.conversation_history.messages
+        if self.summary_message is None:
+            return messages
+        pinned = pinned_count(messages)
+        return messages[:pinned] + [self.summary_message] + messages[max(self.summarized_upto, pinned):]
+
+    def summarize_in_background(self, llm, count_tokens):
+        """
+        Fold older turns into the running summary once the unsummarized history
+        passes SUMMARY_TRIGGER_TOKENS, keeping the newest SUMMARY_KEEP_TOKENS verbatim.
+
+        Summarization runs as a task on the event loop; turns sent before it
+        finishes use the previous summary, so no caller ever waits on it.
+        """
+        if self.summarizing:
+            return
+        messages = self.conversation_history.messages
+        start = max(self.summarized_upto, pinned_count(messages))
+        counts = self.context_window.token_counts(messages[start:], count_tokens)
+        if sum(counts) <= settings.SUMMARY_TRIGGER_TOKENS:
+            return
+        end, kept = len(messages), 0
+        while end > start and kept + counts[end - start - 1] <= settings.SUMMARY_KEEP_TOKENS:
+            kept += counts[end - start - 1]
+            end -= 1
+        if end < len(messages):
+            # Don't fold a tool call into the summary while keeping its results.
+            end = tool_call_start(messages, end, start)
+        if end == start:
+            return
+        self._summary_task = asyncio.get_running_loop().create_task(self._summarize(llm, messages[start:end], end))
+
+    async def _summarize(self, llm, folded: List[ChatMessage], upto: int):
+        transcript = "\n".join([f"{msg.role}: {msg.content}" for msg in folded])
+        prompt = [
+            ChatMessage(role="system", content=SUMMARY_PROMPT),
+            ChatMessage(role="user", content=f"Summary so far:\n{self.summary or 'None'}\n\nNew messages:\n{transcript}"),
+        ]
+        try:
+            summary = (await llm.generate(prompt)).strip()
+        except Exception as e:
+            logger.warning(f"Conversation summarization failed: {str(e)}")
+            return
+        messages = self.conversation_history.messages
+        if len(messages) < upto or messages[upto - 1] is not folded[-1]:
+            # The history was rewritten while we were summarizing.
+            return
+        self.restore_summary(summary, upto)
+
+    def restore_summary(self, summary: Optional[str], upto: int):
+        """Set the running summary of the first `upto` messages, e.g. as loaded from a session store."""
+        self.summary = summary
+        self.summary_message = None if summary is None else ChatMessage(
+            role="system", content=f"Summary of the earlier conversation:\n{summary}")
+        self.summarized_upto = upto if summary is not None else 0
+
+    @property
+    def summarizing(self) -> bool:
+        return self._summary_task is not None and not self._summary_task.done()
+
+    async def wait_for_summary(self):
+        """Wait for a background summarization, if one is running, without cancelling it if the wait is."""
+        if self.summarizing:
+            await asyncio.shield(self._summary_task)
+
     async def async_add_message(self, message_json):
         self.conversation_history.messages.append(message_json)
     
@@ -43,95 +132,125 @@ class Conversation:
 
 # create a chat engine class that is initialized with an llm and a conversration object
 class ChatEngine:
-    def __init__(self, llm, conversation: Conversation):
+    def __init__(self, llm, conversation: Conversation, summarizer=None):
         self.llm = llm
         self.conversation = conversation
+        # A (cheap) model that folds old turns into a running summary; None disables summarization.
+        self.summarizer = summarizer
 
     def chat(self, message: str):
-        self.conversation.add_message(ChatMessage(role="user", content=message))
-        response = self.llm.generate(self.conversation.conversation_history.messages)
+        """Blocking wrapper around achat for scripts; async callers should await achat directly."""
+        return asyncio.run(self.achat(message))
+
+    async def achat(self, message: str):
+        user_message = ChatMessage(role="user", content=message)
+        self.conversation.add_message(user_message)
+        try:
+            response = await self.llm.generate(self._context(), **self._session())
+        except BaseException:
+            self._discard_turn(user_message)
+            raise
         self.conversation.add_message(ChatMessage(role="assistant", content=response))
+        self._summarize()
         return response
 
-    async def _arun(self):
-        accumulated_arguments = ""  # Accumulate JSON string parts
-        current_tool_call_id = None
-        current_tool_call_name = None
-        non_tool_call_accumulated_response = ""
-
-        # print('Starting sequence...')
-        async for chunk in self.llm._arun(self.conversation.conversation_history.messages):
-            # print(f'Processing chunk: {chunk} \n---')
-            choice = chunk.choices[0]
-            delta = choice.delta
-
-            # Handle tool call initialization and continuation
-            if delta.tool_calls:
-                for tool_call in delta.tool_calls:
-                    current_tool_call_id = tool_call.id or current_tool_call_id
-                    current_tool_call_name = tool_call.function.name or current_tool_call_name
-                    accumulated_arguments += tool_call.function.arguments
-
-                    # Try parsing the accumulated JSON arguments
-                    try:
-                        json_args = json.loads(accumulated_arguments)
-                        # print(f'Complete JSON arguments received: {json_args}')
-                        function_result = await self.llm._afunction_call(current_tool_call_name, json_args)
-                        # print(f'Function result: {function_result}')
-
-                        # add the tool details per opeAI API requirements
-                        await self.conversation.async_add_message(
-                            ChatMessage(
-                                role="assistant",
-                                content={
-                                    "tool_calls": [{
-                                        "id": current_tool_call_id,
-                                        "type": "function",
-                                        "function": {
-                                            "name": current_tool_call_name,
-                                            "arguments": str(json_args)
-                                        }
-                                    }]
-                                }
-                            )
-                        )
-                        # add the tool results
-                        await self.conversation.async_add_message(
-                            ChatMessage(
-                                role="tool",
-                                name=current_tool_call_name,
-                                content=str(function_result)
-                            )
-                        )
-
-                        # generate the response now that we have context
-                        non_tool_call_accumulated_response = ""
-                        async for new_chunk in self.llm._arun(self.conversation.conversation_history.messages):
-                            # print(f'Processing new chunk after tool call: {new_chunk}')
-                            # yield new_chunk
-                            new_choice = new_chunk.choices[0]
-                            new_delta = new_choice.delta
-                            content = new_delta.content
-
-                            if content is not None:
-                                yield new_delta.content
-                                non_tool_call_accumulated_response += new_chunk.choices[0].delta.content
-
-                    except json.JSONDecodeError:
-                        print('Incomplete JSON string, waiting for more data...')
-
-            else:
-                # Non-tool call content handling
-                if delta.content:
-                    non_tool_call_accumulated_response += delta.content or ''
-                    #print('Yielding content for non-tool call:', delta.content)
-                    yield delta.content
-
-        # Final addition to the conversation if there is any accumulated content from non-tool calls
-        if non_tool_call_accumulated_response:
-            await self.conversation.async_add_message(
-                ChatMessage(
-                    role="assistant",
-                    content=str(non_tool_call_accumulated_response)
-                )
-            )
\ No newline at end of file
+    async def stream(self, message: str):
+        """Yield the reply as it is generated; the full assistant message is added once the stream ends."""
+        user_message = ChatMessage(role="user", content=message)
+        self.conversation.add_message(user_message)
+        response = ""
+        try:
+            # aclosing makes an abandoned stream shut down the backend request right away.
+            async with aclosing(self.llm.stream(self._context(), **self._session())) as deltas:
+                async for delta in deltas:
+                    if delta:
+                        response += delta
+                        yield delta
+        except BaseException:
+            self._discard_turn(user_message)
+            raise
+        self.conversation.add_message(ChatMessage(role="assistant", content=response))
+        self._summarize()
+
+    def _summarize(self):
+        if self.summarizer is not None:
+            self.conversation.summarize_in_background(self.summarizer, self.llm.count_tokens)
+
+    def _session(self) -> dict:
+        # Only passed when known, so backends without prompt-state reuse needn't accept it.
+        return {"session_id": self.conversation.session_id} if self.conversation.session_id else {}
+
+    def _context(self):
+        """The part of the history that fits the context budget: system prompt, summary and the most recent turns."""
+        return self.conversation.context_window.select(self.conversation.prompt_messages(), self.llm.count_tokens)
+
+    def _discard_turn(self, user_message: ChatMessage):
+        """Drop a user message whose reply failed or was cancelled, so the history stays well-formed."""
+        messages = self.conversation.conversation_history.messages
+        if messages and messages[-1] is user_message:
+            messages.pop()
+
+    async def _arun(self, max_tool_rounds: int = 5):
+        """
+        Stream a reply, running any tools the model calls.
+
+        Tool-call arguments are parsed incrementally as they stream in and each
+        call is dispatched as soon as its arguments are complete, so several
+        calls in one turn run concurrently while the rest of the response is
+        still arriving. When the model's turn ends, the calls and their results
+        are added to the history and the model continues with them in context.
+        """
+        for _ in range(max_tool_rounds + 1):
+            calls: Dict[int, ToolCall] = {}
+            tasks: Dict[int, asyncio.Task] = {}
+            response = ""
+            try:
+                async with aclosing(self.llm._arun(self._context())) as events:
+                    async for event in events:
+                        if isinstance(event, ToolCallDelta):
+                            call = calls.setdefault(event.index, ToolCall(event.index))
+                            if call.feed(event) and event.index not in tasks:
+                                tasks[event.index] = asyncio.create_task(self._call_tool(call))
+                        elif event:
+                            response += event
+                            yield event
+                for index, call in calls.items():
+                    # Calls whose arguments never closed (e.g. empty arguments) run once the stream ends.
+                    if index not in tasks:
+                        tasks[index] = asyncio.create_task(self._call_tool(call))
+                order = sorted(calls)
+                results = await asyncio.gather(*(tasks[index] for index in order))
+            except BaseException:
+                for task in tasks.values():
+                    task.cancel()
+                raise
+
+            if not calls:
+                if response:
+                    self.conversation.add_message(ChatMessage(role="assistant", content=response))
+                return
+            self.conversation.add_message(ChatMessage(
+                role="assistant",
+                content=response,
+                tool_calls=[calls[index].to_dict() for index in order],
+            ))
+            for index, result in zip(order, results):
+                self.conversation.add_message(ChatMessage(
+                    role="tool",
+                    content=result,
+                    tool_call_id=calls[index].id,
+                    name=calls[index].name,
+                ))
+        logger.warning(f"Stopped after {max_tool_rounds} rounds of tool calls")
+
+    async def _call_tool(self, call: ToolCall) -> str:
+        """Run one tool call; failures are returned to the model as the tool's result."""
+        try:
+            arguments = call.parser.value()
+        except json.JSONDecodeError as e:
+            return f"Error: invalid arguments for {call.name}: {str(e)}"
+        try:
+            return str(await self.llm._afunction_call(call.name, arguments))
+        except Exception as e:
+            logger.error(f"Tool call {call.name} failed: {str(e)}")
+            return f"Error: {call.name} failed: {str(e)}"
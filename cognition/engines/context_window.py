@@ -0,0 +1,70 @@
+from typing import Callable, List, Optional
+from cognition.llms.rendering import MessageCache
+from cognition.models.chat_models import ChatMessage
+
+# Tokens spent on role markers and separators around each message's content.
+MESSAGE_OVERHEAD = 4
+
+
+def pinned_count(messages: List[ChatMessage]) -> int:
+    """Number of leading system messages, which are always sent."""
+    pinned = 0
+    while pinned < len(messages) and messages[pinned].role == "system":
+        pinned += 1
+    return pinned
+
+
+def tool_call_start(messages: List[ChatMessage], index: int, floor: int = 0) -> int:
+    """
+    Where the message at `index` can start a prompt: a tool result can't be
+    sent without the assistant message that called it, so for one of those
+    this is the index of that assistant message.
+    """
+    while index > floor and messages[index].role == "tool":
+        index -= 1
+    return index
+
+
+class ContextWindow:
+    """
+    Token-budgeted view of a conversation's history.
+
+    Leading system messages are always kept; the rest of `max_tokens` is
+    filled with the most recent messages that fit. The newest message is
+    always included, even if it alone exceeds the budget. An assistant
+    message that calls tools and the tool results after it are kept or
+    dropped together.
+
+    Token counts are cached per message, so budgeting a turn only tokenizes
+    the messages added since the previous one.
+    """
+
+    def __init__(self, max_tokens: int = 4096):
+        self.max_tokens = max_tokens
+        self._counts: Optional[MessageCache] = None
+        self._count_tokens: Optional[Callable[[str], int]] = None
+
+    def token_counts(self, messages: List[ChatMessage], count_tokens: Callable[[str], int]) -> List[int]:
+        """Token count of each message, reusing cached counts for messages seen before."""
+        if self._counts is None or count_tokens != self._count_tokens:
+            # A different tokenizer gives different counts.
+            self._count_tokens = count_tokens
+            # Besides the history passed in, keep room for a few discarded turns and replaced summaries.
+            self._counts = MessageCache(lambda message: count_tokens(message.content) + MESSAGE_OVERHEAD, max_entries=64)
+        return self._counts.map(messages)
+
+    def select(self, messages: List[ChatMessage], count_tokens: Callable[[str], int]) -> List[ChatMessage]:
+        """Return the messages to send this turn: pinned system messages plus the newest turns that fit."""
+        counts = self.token_counts(messages, count_tokens)
+        pinned = pinned_count(messages)
+
+        budget = self.max_tokens - sum(counts[:pinned])
+        start = len(messages)
+        while start > pinned:
+            group = tool_call_start(messages, start - 1, pinned)
+            cost = sum(counts[group:start])
+            if cost > budget and start < len(messages):
+                break
+            budget -= cost
+            start = group
+        return messages[:pinned] + messages[start:]
@@ -0,0 +1,53 @@
+"""
+Module for testing that ChatEngine.achat never blocks the event loop
+"""
+
+import asyncio
+import time
+from typing import List
+from cognition.engines.chat_engine import ChatEngine, Conversation
+from cognition.llms.base_llm import BaseLLM
+from cognition.models.chat_models import ChatMessage
+
+DELAY = 0.2
+N_REQUESTS = 10
+
+
+class SlowModel(BaseLLM):
+    async def generate(self, messages: List[ChatMessage]) -> str:
+        await asyncio.sleep(DELAY)
+        return f"reply to: {messages[-1].content}"
+
+    async def stream(self, messages: List[ChatMessage]):
+        yield await self.generate(messages)
+
+    async def function_call(self, function_name: str, function_args: dict) -> str:
+        raise NotImplementedError
+
+
+def new_engine(llm):
+    conversation = Conversation()
+    conversation.add_message(ChatMessage(role="system", content="You are a large language model"))
+    return ChatEngine(llm, conversation)
+
+
+def test_achat_appends_both_turns():
+    engine = new_engine(SlowModel())
+    response = asyncio.run(engine.achat("hi"))
+    assert response == "reply to: hi"
+    assert [msg.role for msg in engine.conversation.conversation_history.messages] == ["system", "user", "assistant"]
+
+
+def test_parallel_achat_finishes_in_time_of_one():
+    llm = SlowModel()
+
+    async def main():
+        engines = [new_engine(llm) for _ in range(N_REQUESTS)]
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(engine.achat(f"q{i}") for i, engine in enumerate(engines)))
+        return time.perf_counter() - start, responses
+
+    elapsed, responses = asyncio.run(main())
+    assert responses == [f"reply to: q{i}" for i in range(N_REQUESTS)]
+    # Serialized, this would take N_REQUESTS * DELAY.
+    assert elapsed < DELAY * 2
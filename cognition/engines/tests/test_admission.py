@@ -0,0 +1,117 @@
+"""
+Module for testing bounded, fair admission in front of an LLM backend
+"""
+
+import asyncio
+import pytest
+from cognition.engines.admission import AdmissionController, AdmissionRejected
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_per_client_queue_limit_and_global_queue_limit():
+    async def main():
+        controller = AdmissionController(max_concurrency=1, max_queue=3, max_queue_per_client=2)
+        holder = await controller.acquire("a")
+        waiters = [asyncio.ensure_future(controller.acquire("greedy")) for _ in range(2)]
+        await settle()
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire("greedy")
+        other = asyncio.ensure_future(controller.acquire("b"))
+        await settle()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("c")
+        assert controller.queued == 3
+        assert rejected.value.retry_after >= 1
+        for task in waiters + [other]:
+            task.cancel()
+        await asyncio.gather(*waiters, other, return_exceptions=True)
+        holder.release()
+        return controller
+
+    controller = asyncio.run(main())
+    assert controller.queued == 0 and controller.active == 0
+
+
+def test_freed_slots_go_round_robin_across_clients():
+    async def main():
+        controller = AdmissionController(max_concurrency=1, max_queue=10, max_queue_per_client=10)
+        holder = await controller.acquire("first")
+        order = []
+
+        async def request(client_id):
+            async with controller.admit(client_id):
+                order.append(client_id)
+                await asyncio.sleep(0)
+
+        tasks = [asyncio.ensure_future(request(client_id)) for client_id in ["a", "a", "a", "b", "c"]]
+        await settle()
+        holder.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(main()) == ["a", "b", "c", "a", "a"]
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def main():
+        controller = AdmissionController(max_concurrency=1, max_queue=1)
+        holder = await controller.acquire("a")
+        waiter = asyncio.ensure_future(controller.acquire("b"))
+        await settle()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert controller.queued == 0
+        # The queue slot is free again.
+        replacement = asyncio.ensure_future(controller.acquire("c"))
+        await settle()
+        holder.release()
+        (await replacement).release()
+        return controller
+
+    controller = asyncio.run(main())
+    assert controller.active == 0
+
+
+def test_cancelled_holder_releases_its_slot():
+    async def main():
+        controller = AdmissionController(max_concurrency=1, max_queue=1)
+        started = asyncio.Event()
+
+        async def hold():
+            async with controller.admit("a"):
+                started.set()
+                await asyncio.sleep(10)
+
+        holder = asyncio.ensure_future(hold())
+        await started.wait()
+        waiter = asyncio.ensure_future(controller.acquire("b"))
+        await settle()
+        holder.cancel()
+        admission = await asyncio.wait_for(waiter, 1.0)
+        admission.release()
+        return controller
+
+    controller = asyncio.run(main())
+    assert controller.active == 0 and controller.queued == 0
+
+
+def test_slot_handed_to_a_waiter_that_was_cancelled_passes_on():
+    async def main():
+        controller = AdmissionController(max_concurrency=1, max_queue=2)
+        holder = await controller.acquire("a")
+        gone = asyncio.ensure_future(controller.acquire("b"))
+        next_up = asyncio.ensure_future(controller.acquire("c"))
+        await settle()
+        # Release hands the slot to "b", which is cancelled before it resumes.
+        holder.release()
+        gone.cancel()
+        await asyncio.gather(gone, return_exceptions=True)
+        (await asyncio.wait_for(next_up, 1.0)).release()
+        return controller
+
+    controller = asyncio.run(main())
+    assert controller.active == 0 and controller.queued == 0
@@ -0,0 +1,75 @@
+"""
+Module for testing the token-budgeted ContextWindow
+"""
+
+from cognition.engines.context_window import ContextWindow, MESSAGE_OVERHEAD
+from cognition.models.chat_models import ChatMessage
+
+
+class CountingTokenizer:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text: str) -> int:
+        self.calls += 1
+        return len(text.split())
+
+
+def history(n_turns: int):
+    messages = [ChatMessage(role="system", content="you are k3nn")]
+    for i in range(n_turns):
+        messages.append(ChatMessage(role="user", content=f"question {i}"))
+        messages.append(ChatMessage(role="assistant", content=f"answer {i}"))
+    return messages
+
+
+def test_keeps_system_prompt_and_most_recent_turns():
+    messages = history(10)
+    per_message = 2 + MESSAGE_OVERHEAD
+    system = 3 + MESSAGE_OVERHEAD
+    window = ContextWindow(max_tokens=system + 4 * per_message)
+    selected = window.select(messages, CountingTokenizer())
+    assert selected[0] is messages[0]
+    assert selected[1:] == messages[-4:]
+
+
+def test_newest_message_is_kept_over_budget():
+    messages = history(1) + [ChatMessage(role="user", content="word " * 100)]
+    selected = ContextWindow(max_tokens=10).select(messages, CountingTokenizer())
+    assert selected == [messages[0], messages[-1]]
+
+
+def test_counts_are_cached_between_turns():
+    tokenizer = CountingTokenizer()
+    window = ContextWindow(max_tokens=1000)
+    messages = history(5)
+    window.select(messages, tokenizer)
+    assert tokenizer.calls == len(messages)
+
+    messages.append(ChatMessage(role="user", content="one more"))
+    window.select(messages, tokenizer)
+    assert tokenizer.calls == len(messages)
+
+    # A discarded turn is replaced without recounting the rest of the history.
+    messages[-1] = ChatMessage(role="user", content="retry")
+    window.select(messages, tokenizer)
+    assert tokenizer.calls == len(messages) + 1
+
+
+def test_tool_calls_are_kept_or_dropped_with_their_results():
+    call = {"id": "call_1", "type": "function", "function": {"name": "get_time", "arguments": "{}"}}
+    messages = history(1) + [
+        ChatMessage(role="user", content="what time is it?"),
+        ChatMessage(role="assistant", content="", tool_calls=[call]),
+        ChatMessage(role="tool", content="noon", tool_call_id="call_1", name="get_time"),
+        ChatMessage(role="tool", content="UTC", tool_call_id="call_1", name="get_time"),
+        ChatMessage(role="assistant", content="It is noon"),
+    ]
+    tokenizer = CountingTokenizer()
+    system = 3 + MESSAGE_OVERHEAD
+    # Room for the final answer and both tool results, but not the call that produced them.
+    window = ContextWindow(max_tokens=system + 3 + 1 + 1 + 3 * MESSAGE_OVERHEAD)
+    assert window.select(messages, tokenizer) == [messages[0], messages[-1]]
+
+    window.max_tokens += MESSAGE_OVERHEAD
+    assert window.select(messages, tokenizer) == [messages[0]] + messages[-4:]
@@ -0,0 +1,67 @@
+"""
+Module for testing background rolling summarization on Conversation
+"""
+
+import asyncio
+from typing import List
+import settings
+from cognition.engines.chat_engine import ChatEngine, Conversation
+from cognition.llms.base_llm import BaseLLM
+from cognition.models.chat_models import ChatMessage
+
+
+class EchoModel(BaseLLM):
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.prompts = []
+
+    async def generate(self, messages: List[ChatMessage]) -> str:
+        self.prompts.append(messages)
+        await asyncio.sleep(self.delay)
+        return "word " * 10
+
+    async def stream(self, messages: List[ChatMessage]):
+        yield await self.generate(messages)
+
+    async def function_call(self, function_name: str, function_args: dict) -> str:
+        raise NotImplementedError
+
+
+def new_engine(llm, summarizer):
+    conversation = Conversation()
+    conversation.add_message(ChatMessage(role="system", content="you are k3nn"))
+    return ChatEngine(llm, conversation, summarizer=summarizer)
+
+
+def test_old_turns_are_replaced_by_summary(monkeypatch):
+    monkeypatch.setattr(settings, "SUMMARY_TRIGGER_TOKENS", 100)
+    monkeypatch.setattr(settings, "SUMMARY_KEEP_TOKENS", 40)
+    llm, summarizer = EchoModel(), EchoModel()
+    engine = new_engine(llm, summarizer)
+
+    async def main():
+        for i in range(8):
+            await engine.achat(f"question {i}")
+            await asyncio.sleep(0)
+
+    asyncio.run(main())
+    conversation = engine.conversation
+    assert summarizer.prompts
+    assert conversation.summarized_upto > 1
+    prompt = conversation.prompt_messages()
+    assert prompt[1] is conversation.summary_message
+    assert prompt[2:] == conversation.conversation_history.messages[conversation.summarized_upto:]
+    assert len(conversation.conversation_history.messages) == 17
+
+
+def test_turns_do_not_wait_for_summarization(monkeypatch):
+    monkeypatch.setattr(settings, "SUMMARY_TRIGGER_TOKENS", 10)
+    monkeypatch.setattr(settings, "SUMMARY_KEEP_TOKENS", 0)
+    engine = new_engine(EchoModel(), EchoModel(delay=10))
+
+    async def main():
+        await engine.achat("first")
+        await asyncio.wait_for(engine.achat("second"), timeout=1)
+        assert engine.conversation.summary is None
+
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+"""
+Module for testing streamed, parallel tool calls in ChatEngine._arun
+"""
+
+import asyncio
+import time
+from typing import List
+from cognition.engines.chat_engine import ChatEngine, Conversation
+from cognition.llms.base_llm import BaseLLM
+from cognition.llms.tool_calls import ToolCallDelta
+from cognition.models.chat_models import ChatMessage
+
+TOOL_DELAY = 0.2
+
+
+class ToolModel(BaseLLM):
+    """Calls two tools with interleaved argument fragments, then answers from their results."""
+
+    def __init__(self):
+        self.started = {}
+
+    async def _arun(self, messages: List[ChatMessage]):
+        if messages[-1].role == "tool":
+            yield "results: " + ", ".join(msg.content for msg in messages if msg.role == "tool")
+            return
+        yield "checking "
+        yield ToolCallDelta(0, id="call_a", name="lookup", arguments='{"key": ')
+        yield ToolCallDelta(1, id="call_b", name="lookup", arguments='{"key": "b"}')
+        # Call 1 is already running while call 0's arguments are still streaming.
+        await asyncio.sleep(0.05)
+        yield ToolCallDelta(0, arguments='"a"}')
+
+    async def generate(self, messages: List[ChatMessage], session_id=None) -> str:
+        raise NotImplementedError
+
+    async def stream(self, messages: List[ChatMessage], session_id=None):
+        raise NotImplementedError
+        yield
+
+    async def function_call(self, function_name: str, function_args: dict) -> str:
+        self.started[function_args["key"]] = time.perf_counter()
+        await asyncio.sleep(TOOL_DELAY)
+        return f"{function_args['key']}!"
+
+
+def test_parallel_tool_calls_are_dispatched_while_streaming():
+    llm = ToolModel()
+    conversation = Conversation()
+    conversation.add_message(ChatMessage(role="user", content="look up a and b"))
+    engine = ChatEngine(llm, conversation)
+
+    async def main():
+        start = time.perf_counter()
+        chunks = [chunk async for chunk in engine._arun()]
+        return chunks, time.perf_counter() - start
+
+    chunks, elapsed = asyncio.run(main())
+    assert chunks == ["checking ", "results: a!, b!"]
+    assert llm.started["b"] < llm.started["a"]
+    assert elapsed < TOOL_DELAY * 2
+
+    messages = conversation.conversation_history.messages
+    assert [msg.role for msg in messages] == ["user", "assistant", "tool", "tool", "assistant"]
+    assert [call["id"] for call in messages[1].tool_calls] == ["call_a", "call_b"]
+    assert [(msg.tool_call_id, msg.content) for msg in messages[2:4]] == [("call_a", "a!"), ("call_b", "b!")]
+
+
+def test_function_call_dispatches_sync_and_async_functions():
+    async def shout(text):
+        return text.upper()
+
+    # ToolModel overrides function_call, so call the dispatch BaseLLM provides directly.
+    llm = ToolModel()
+    llm.functions = {"shout": shout, "whisper": lambda text: text.lower()}
+
+    async def main():
+        results = [await BaseLLM.function_call(llm, name, {"text": "Hi"}) for name in ["shout", "whisper"]]
+        try:
+            await BaseLLM.function_call(llm, "sing", {})
+        except ValueError as e:
+            results.append(str(e))
+        return results
+
+    assert asyncio.run(main()) == ["HI", "hi", "Unknown function: sing"]
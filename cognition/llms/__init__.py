@@ -0,0 +1,35 @@
+"""
+LLM backends.
+
+Backend modules are imported on first use, so selecting one backend never
+pays for another's dependencies (torch and transformers for HuggingFace,
+the openai client for OpenAI). Both Ollama backends talk to Ollama's HTTP
+API directly and need only httpx: "ollama" uses /api/generate and
+"ollama_chat" uses /api/chat.
+"""
+import importlib
+
+BACKENDS = {
+    "ollama": ("cognition.llms.ollama", "OllamaModel"),
+    "ollama_chat": ("cognition.llms.ollama_chat", "OllamaChatModel"),
+    "openai": ("cognition.llms.openai", "OpenAIModel"),
+    "huggingface": ("cognition.llms.huggingface", "HuggingFaceModel"),
+    "router": ("cognition.llms.router", "RoutingModel"),
+}
+
+
+def load_backend(name: str):
+    """Import and return the BaseLLM class registered under `name`."""
+    try:
+        module_name, class_name = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown LLM backend: {name}")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def __getattr__(name: str):
+    # Allows `from cognition.llms import OllamaModel` without importing the other backends.
+    for backend, (_, class_name) in BACKENDS.items():
+        if class_name == name:
+            return load_backend(backend)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,16 +1,63 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import List, AsyncGenerator
+from contextlib import aclosing
+from typing import Callable, Dict, List, AsyncGenerator, Optional, Union
 from cognition.models.chat_models import ChatMessage
+from cognition.llms import metrics
+from cognition.llms.tool_calls import ToolCallDelta
 
 class BaseLLM(ABC):
+    # Implementations of the tools a backend offers the model, by name; sync functions run in a worker thread.
+    functions: Dict[str, Callable] = {}
+
+    # `session_id`, when given, lets a backend reuse prompt state (KV cache, context) from the session's earlier turns.
     @abstractmethod
-    async def generate(self, messages: List[ChatMessage]) -> str:
+    async def generate(self, messages: List[ChatMessage], session_id: Optional[str] = None) -> str:
         pass
 
     @abstractmethod
-    async def stream(self, messages: List[ChatMessage]) -> AsyncGenerator[str, None]:
+    async def stream(self, messages: List[ChatMessage], session_id: Optional[str] = None) -> AsyncGenerator[str, None]:
         pass
 
-    @abstractmethod
     async def function_call(self, function_name: str, function_args: dict) -> str:
-        pass
\ No newline at end of file
+        function = self.functions.get(function_name)
+        if function is None:
+            raise ValueError(f"Unknown function: {function_name}")
+        if asyncio.iscoroutinefunction(function):
+            return await function(**function_args)
+        return await asyncio.to_thread(function, **function_args)
+
+    async def _arun(self, messages: List[ChatMessage]) -> AsyncGenerator[Union[str, ToolCallDelta], None]:
+        """
+        Streaming tool protocol: yield text deltas as str and tool-call pieces as
+        ToolCallDelta. Backends without native tool calling only stream text.
+        """
+        async with aclosing(self.stream(messages)) as deltas:
+            async for delta in deltas:
+                yield delta
+
+    async def _afunction_call(self, function_name: str, function_args: dict) -> str:
+        """Run one tool call requested by the model."""
+        return await self.function_call(function_name, function_args)
+
+    async def warmup(self, system_prompt: str, prompt: str = "Hello"):
+        """
+        Load the model before the first real request. A no-op here, since a remote API has
+        nothing to load and a warm-up call would be billed; local backends override it.
+        """
+
+    def count_tokens(self, text: str) -> int:
+        """Rough token count; backends with a tokenizer override this."""
+        return len(text.split())
+
+    def generation_params(self) -> dict:
+        """Model and sampling parameters that determine this backend's output, e.g. for cache keys."""
+        return {
+            "backend": type(self).__name__,
+            "model": getattr(self, "model", None),
+            "temperature": getattr(self, "temperature", None),
+        }
+
+    def track(self, method: str):
+        """Instrumentation hook: records latency, TTFT, tokens/sec and errors for one call to this backend."""
+        return metrics.track_llm(type(self).__name__, method)
@@ -1,13 +1,101 @@
 import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from typing import List, AsyncGenerator
+from transformers import AutoModelForCausalLM, AutoTokenizer, DynamicCache, StoppingCriteria, StoppingCriteriaList
+from typing import List, AsyncGenerator, Optional
 from cognition.llms.base_llm import BaseLLM
+from cognition.llms.batching import BatchScheduler
+from cognition.llms.prompt_cache import PrefixCache, PromptStateCache, common_prefix_length
+from cognition.llms.rendering import ChatTemplateSegments, MessageCache
+from cognition.llms.streaming import TokenStreamer, truncate_at_stop
+from cognition.llms.tokenizer import from_transformers
 from cognition.models.chat_models import ChatMessage
 
+logger = logging.getLogger(__name__)
+
+
+def configure_torch_threads(intra_op_threads: int = 0, inter_op_threads: int = 0):
+    """Set torch's CPU thread pools; 0 leaves torch's default (one thread per core)."""
+    if intra_op_threads > 0:
+        torch.set_num_threads(intra_op_threads)
+    if inter_op_threads > 0:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError as e:
+            # Only allowed before torch has run any parallel work in this process.
+            logger.warning(f"Could not set torch inter-op threads: {str(e)}")
+
+
+class GenerationRequest:
+    def __init__(self, input_ids: List[int], session_id: Optional[str] = None, prefix_length: int = 0):
+        self.input_ids = input_ids
+        self.session_id = session_id
+        # Leading tokens shared with other sessions (the system prompt).
+        self.prefix_length = prefix_length
+        self.cancelled = threading.Event()
+        # Set for stream() requests, which run on their own rather than in a padded batch.
+        self.streamer: Optional[TokenStreamer] = None
+
+
+class CancelledRequests(StoppingCriteria):
+    """Stops each batch row whose caller has gone away; checked after every decoding step."""
+
+    def __init__(self, requests: List[GenerationRequest]):
+        self.requests = requests
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.tensor([request.cancelled.is_set() for request in self.requests], device=input_ids.device)
+
+
+class StopSequences(StoppingCriteria):
+    """Stops each batch row once its generated text contains a stop sequence."""
+
+    def __init__(self, tokenizer, stop: List[str], prompt_length: int):
+        self.tokenizer = tokenizer
+        self.stop = stop
+        self.prompt_length = prompt_length
+        # Every token decodes to at least one character, so this many tokens covers the longest stop sequence.
+        self.window = max(len(s) for s in stop) + 1
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        start = max(self.prompt_length, input_ids.shape[1] - self.window)
+        tails = self.tokenizer.batch_decode(input_ids[:, start:], skip_special_tokens=True)
+        return torch.tensor([any(s in tail for s in self.stop) for tail in tails], device=input_ids.device)
+
+
+def clone_cache(cache: DynamicCache) -> DynamicCache:
+    """
+    Copy-on-write clone of a KV cache. DynamicCache grows (torch.cat) and crops
+    (slicing) by building new tensors, so the clone shares the original's
+    tensors without ever writing to them.
+    """
+    clone = DynamicCache()
+    clone.key_cache = list(cache.key_cache)
+    clone.value_cache = list(cache.value_cache)
+    clone._seen_tokens = cache._seen_tokens
+    return clone
+
+
 class HuggingFaceModel(BaseLLM):
-    def __init__(self, model_path: str = "././weights/meta-llama/Meta-Llama-3.1-8B-Instruct"):
+    def __init__(
+        self,
+        model_path: str = "././weights/meta-llama/Meta-Llama-3.1-8B-Instruct",
+        max_batch_size: int = 8,
+        max_batch_wait: float = 0.01,
+        temperature: Optional[float] = None,
+        prompt_cache_tokens: int = 0,
+        prefix_cache: bool = False,
+        stop_sequences: Optional[List[str]] = None,
+        intra_op_threads: int = 0,
+        inter_op_threads: int = 0,
+    ):
+        self.model_path = model_path
+        self.temperature = temperature
+        configure_torch_threads(intra_op_threads, inter_op_threads)
         self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.tokens = from_transformers(model_path, self.tokenizer)
         self.model = AutoModelForCausalLM.from_pretrained(
             model_path,
             torch_dtype=torch.float16,
@@ -15,54 +103,238 @@ class HuggingFaceModel(BaseLLM):
         )
         self.model.eval()
         self.has_chat_template = hasattr(self.tokenizer, 'chat_template') and self.tokenizer.chat_template is not None
+        # Without a chat template the model would carry on writing the user's next turn.
+        self.stop_sequences = list(stop_sequences or []) + ([] if self.has_chat_template else ["\nuser:"])
 
-    async def generate(self, messages: List[ChatMessage]) -> str:
-        if self.has_chat_template:
-            return await self._generate_with_chat_template(messages)
-        else:
-            return await self._generate_without_chat_template(messages)
+        # Batched prompts are left-padded so every row ends where generation starts.
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        # Per-message token ids, so a turn only tokenizes the messages that are new.
+        self.segments = ChatTemplateSegments(self.tokenizer) if self.has_chat_template else None
+        if self.segments is not None and self.segments.supported:
+            self._first_ids = MessageCache(lambda msg: self.segments.encode(self.segments.render_first(msg)))
+            self._message_ids = MessageCache(lambda msg: self.segments.encode(self.segments.render(msg)))
+            self._generation_ids = self.segments.encode(self.segments.generation_prompt())
+        # Per-session KV caches, so a turn only prefills the tokens added since the last one.
+        self.prompt_states = PromptStateCache(prompt_cache_tokens) if prompt_cache_tokens > 0 else None
+        # KV cache of the system prompt, computed once and cloned into every new session.
+        self.prefix_states = PrefixCache() if prefix_cache and self.segments is not None and self.segments.supported else None
+        # The one thread that runs the model, so torch work never blocks the event loop or competes with itself.
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hf-inference")
+        self.scheduler = BatchScheduler(
+            self._generate_batch, max_batch_size=max_batch_size, max_wait=max_batch_wait, executor=self.executor)
+
+    async def generate(self, messages: List[ChatMessage], session_id: Optional[str] = None) -> str:
+        with self.track("generate") as call:
+            request = await self._request(messages, session_id)
+            try:
+                response = await self.scheduler.submit(request)
+            except asyncio.CancelledError:
+                request.cancelled.set()
+                raise
+            call.output(self.count_tokens(response))
+            return response
+
+    async def warmup(self, system_prompt: str, prompt: str = "Hello"):
+        """Page the weights in, initialize the tokenizer and prefill the system prompt's shared KV cache."""
+        messages = [
+            ChatMessage(role="system", content=system_prompt),
+            ChatMessage(role="user", content=prompt),
+        ]
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._warmup, messages)
 
-    async def stream(self, messages: List[ChatMessage]) -> AsyncGenerator[str, None]:
-        # Implement streaming logic
-        full_response = await self.generate(messages)
-        for token in full_response.split():
-            yield token + " "
+    def _warmup(self, messages: List[ChatMessage]):
+        input_ids, prefix_length = self._encode(messages), self._prefix_length(messages)
+        if prefix_length:
+            # Prefill the persona's shared prefix now rather than on the first session.
+            self._prefix_state(input_ids[:prefix_length])
+        input_ids = torch.tensor([input_ids], device=self.model.device)
+        with torch.no_grad():
+            # A forward pass reads every layer, so mmapped weights are resident afterwards.
+            self.model.generate(
+                input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                max_new_tokens=1,
+                do_sample=False,
+                pad_token_id=self.tokenizer.pad_token_id,
+            )
+
+    async def stream(self, messages: List[ChatMessage], session_id: Optional[str] = None) -> AsyncGenerator[str, None]:
+        """Yield text deltas as the model produces them, decoding only the newly generated tokens."""
+        with self.track("stream") as call:
+            request = await self._request(messages, session_id)
+            request.streamer = TokenStreamer(self._decode, self.stop_sequences, on_stop=request.cancelled.set)
+            generation = asyncio.ensure_future(self.scheduler.submit(request))
+            # Ends the iteration if generation fails before the streamer's own end().
+            generation.add_done_callback(lambda _: request.streamer.close())
+            try:
+                async for delta in request.streamer:
+                    call.delta()
+                    yield delta
+                await generation
+            finally:
+                if not generation.done():
+                    # The caller stopped reading; stop generating after the current step.
+                    request.cancelled.set()
+                    generation.cancel()
 
     async def function_call(self, function_name: str, function_args: dict) -> str:
         # Implement function calling logic here (if applicable)
         raise NotImplementedError("Function calling is not implemented for this model.")
 
-    async def _generate_with_chat_template(self, messages: List[ChatMessage]) -> str:
-        serialized_messages = self._serialize_messages(messages)
-        inputs = self.tokenizer.apply_chat_template(
-            serialized_messages,
-            tokenize=True,
-            add_generation_prompt=True,
-            return_tensors="pt",
-            return_dict=True,
-        ).to(self.model.device)
-        
-        outputs = self.model.generate(**inputs, max_new_tokens=512, do_sample=True)
-        full_response = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)[0]
-        
-        # Extract only the assistant's response
-        assistant_response = full_response.split("assistant")[-1].strip()
-        return assistant_response
-
-    async def _generate_without_chat_template(self, messages: List[ChatMessage]) -> str:
+    def generation_params(self) -> dict:
+        params = super().generation_params()
+        params["model"] = self.model_path
+        return params
+
+    def count_tokens(self, text: str) -> int:
+        return self.tokens.count(text)
+
+    async def _request(self, messages: List[ChatMessage], session_id: Optional[str]) -> GenerationRequest:
+        """
+        Tokenize on the inference thread, like generation: it keeps the event
+        loop free, and the per-message id caches are only used from that thread.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, lambda: GenerationRequest(self._encode(messages), session_id, self._prefix_length(messages)))
+
+    def _encode(self, messages: List[ChatMessage]) -> List[int]:
+        """Prompt token ids for a conversation, assembled from cached per-message ids when the template allows."""
+        if self.segments is not None and self.segments.supported and messages:
+            input_ids = list(self._first_ids.map(messages[:1])[0])
+            for message_ids in self._message_ids.map(messages[1:]):
+                input_ids.extend(message_ids)
+            input_ids.extend(self._generation_ids)
+            return input_ids
+        prompt = self._build_prompt(messages)
+        if self.has_chat_template:
+            # The chat template already contains the special tokens.
+            return self.tokenizer.encode(prompt, add_special_tokens=False)
+        return self.tokenizer.encode(prompt, truncation=True, max_length=2048)
+
+    def _prefix_length(self, messages: List[ChatMessage]) -> int:
+        """Number of prompt tokens that come from the leading system message."""
+        if self.prefix_states is None or not messages or messages[0].role != "system":
+            return 0
+        return len(self._first_ids.map(messages[:1])[0])
+
+    def _build_prompt(self, messages: List[ChatMessage]) -> str:
+        if self.has_chat_template:
+            return self.tokenizer.apply_chat_template(
+                self._serialize_messages(messages),
+                tokenize=False,
+                add_generation_prompt=True,
+            )
         prompt = "\n".join([f"{msg.role}: {msg.content}" for msg in messages])
-        prompt += "\nassistant:"  # Add a prompt for the model to continue
+        return prompt + "\nassistant:"  # Add a prompt for the model to continue
 
-        inputs = self.tokenizer(prompt, return_tensors="pt", truncation=True, max_length=2048).to(self.model.device)
+    def _generation_kwargs(self) -> dict:
+        if self.temperature == 0:
+            return {"max_new_tokens": 512, "do_sample": False}
+        if self.has_chat_template:
+            generation_kwargs = {"max_new_tokens": 512, "do_sample": True}
+        else:
+            generation_kwargs = {"max_new_tokens": 512, "temperature": 0.7, "do_sample": True}
+        if self.temperature is not None:
+            generation_kwargs["temperature"] = self.temperature
+        return generation_kwargs
+
+    async def aclose(self):
+        await self.scheduler.aclose()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _decode(self, ids: List[int]) -> str:
+        return self.tokenizer.decode(ids, skip_special_tokens=True)
+
+    def _stopping_criteria(self, requests: List[GenerationRequest], prompt_length: int) -> StoppingCriteriaList:
+        criteria = [CancelledRequests(requests)]
+        if self.stop_sequences:
+            criteria.append(StopSequences(self.tokenizer, self.stop_sequences, prompt_length))
+        return StoppingCriteriaList(criteria)
+
+    def _generate_batch(self, requests: List[GenerationRequest]) -> List[str]:
+        """Generate for a batch of tokenized prompts: streamed requests one at a time, the rest in one padded call."""
+        alone = [request for request in requests if request.streamer is not None]
+        together = [request for request in requests if request.streamer is None]
+        if len(together) == 1 and (self.prompt_states is not None or self.prefix_states is not None):
+            # Per-request KV caches can't be mixed within one padded batch, so only lone requests reuse them.
+            alone, together = requests, []
+        results = {id(request): self._generate_one(request) for request in alone}
+        if together:
+            results.update(zip(map(id, together), self._generate_padded(together)))
+        return [results[id(request)] for request in requests]
+
+    def _generate_padded(self, requests: List[GenerationRequest]) -> List[str]:
+        """Run one left-padded generate call for a batch of tokenized prompts and decode only the new tokens."""
+        inputs = self.tokenizer.pad({"input_ids": [request.input_ids for request in requests]}, return_tensors="pt")
+        inputs = inputs.to(self.model.device)
+        prompt_length = inputs["input_ids"].shape[1]
 
         with torch.no_grad():
-            output = self.model.generate(**inputs, max_new_tokens=512, temperature=0.7, do_sample=True)
+            outputs = self.model.generate(
+                **inputs,
+                pad_token_id=self.tokenizer.pad_token_id,
+                stopping_criteria=self._stopping_criteria(requests, prompt_length),
+                **self._generation_kwargs(),
+            )
+
+        texts = self.tokenizer.batch_decode(outputs[:, prompt_length:], skip_special_tokens=True)
+        return [truncate_at_stop(text, self.stop_sequences).strip() for text in texts]
+
+    def _generate_one(self, request: GenerationRequest) -> str:
+        """
+        Generate for one request, streaming it if it has a streamer, and
+        prefilling only the tokens not already covered by the session's saved
+        KV cache or, for a new session, the shared system-prompt cache.
+        """
+        input_ids = request.input_ids
+        past_key_values = None
+        state = self.prompt_states.pop(request.session_id) if self.prompt_states is not None else None
+        if state is not None:
+            cached_ids, cached = state
+            # At least one token has to be prefilled to get logits for the next one.
+            reused = min(common_prefix_length(cached_ids, input_ids), len(input_ids) - 1)
+            if reused > 0 and reused >= request.prefix_length:
+                if reused < cached.get_seq_length():
+                    # The history changed past this point (e.g. the context window slid); keep the shared prefix.
+                    cached.crop(reused)
+                past_key_values = cached
+        if past_key_values is None and 0 < request.prefix_length < len(input_ids):
+            past_key_values = self._prefix_state(input_ids[:request.prefix_length])
+        if past_key_values is None:
+            past_key_values = DynamicCache()
+
+        ids = torch.tensor([input_ids], device=self.model.device)
+        with torch.no_grad():
+            outputs = self.model.generate(
+                ids,
+                attention_mask=torch.ones_like(ids),
+                past_key_values=past_key_values,
+                pad_token_id=self.tokenizer.pad_token_id,
+                stopping_criteria=self._stopping_criteria([request], len(input_ids)),
+                streamer=request.streamer,
+                return_dict_in_generate=True,
+                **self._generation_kwargs(),
+            )
+
+        sequence = outputs.sequences[0]
+        cache = outputs.past_key_values
+        cached_length = cache.get_seq_length()
+        if self.prompt_states is not None:
+            self.prompt_states.put(request.session_id, (sequence[:cached_length].tolist(), cache), cached_length)
+        return truncate_at_stop(self._decode(sequence[len(input_ids):]), self.stop_sequences).strip()
 
-        generated_text = self.tokenizer.decode(output[0], skip_special_tokens=True)
-        
-        # Extract only the assistant's response
-        assistant_response = generated_text.split("assistant:")[-1].strip()
-        return assistant_response
+    def _prefix_state(self, prefix_ids: List[int]) -> DynamicCache:
+        """A clone of the shared KV cache for this prefix, prefilling it on first use."""
+        cache = self.prefix_states.get(prefix_ids)
+        if cache is None:
+            ids = torch.tensor([prefix_ids], device=self.model.device)
+            with torch.no_grad():
+                cache = self.model(ids, past_key_values=DynamicCache(), use_cache=True).past_key_values
+            self.prefix_states.put(prefix_ids, cache)
+        return clone_cache(cache)
 
     def _serialize_messages(self, messages: List[ChatMessage]) -> List[dict]:
         return [{"role": msg.role, "content": msg.content} for msg in messages]
@@ -0,0 +1,110 @@
+import json
+from typing import List, Optional
+
+# Ollama's JSON mode can get stuck emitting whitespace; this many in a row outside a string is treated as malformed.
+MAX_WHITESPACE_RUN = 64
+
+JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "number": (int, float),
+    "integer": int,
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+class MalformedJSON(ValueError):
+    pass
+
+
+class IncrementalJSONParser:
+    """
+    Tracks the structure of a JSON document as it arrives in fragments.
+
+    Every character is scanned exactly once, so deciding whether a streamed
+    document is complete is linear in its length, and it is parsed with
+    json.loads only once, when its top-level object or array closes.
+    Structural mistakes (text before the opening bracket, mismatched
+    brackets, runaway whitespace) set `error` as soon as they appear, so a
+    caller can abort a generation that has already gone wrong.
+    """
+
+    def __init__(self):
+        self._fragments: List[str] = []
+        self._stack: List[str] = []
+        self.started = False
+        self.complete = False
+        self.error: Optional[str] = None
+        self._in_string = False
+        self._escaped = False
+        self._whitespace_run = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._stack)
+
+    def feed(self, fragment: str) -> bool:
+        """Add a fragment; returns True once the top-level value has closed."""
+        self._fragments.append(fragment)
+        for char in fragment:
+            if self.complete or self.error:
+                break
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char.isspace():
+                self._whitespace_run += 1
+                if self._whitespace_run > MAX_WHITESPACE_RUN:
+                    self.error = "runaway whitespace"
+                continue
+            self._whitespace_run = 0
+            if not self.started and char not in "{[":
+                self.error = f"expected an object or array, got {char!r}"
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._stack.append("}" if char == "{" else "]")
+                self.started = True
+            elif char in "}]":
+                if not self._stack or self._stack.pop() != char:
+                    self.error = f"unexpected {char!r}"
+                elif not self._stack:
+                    self.complete = True
+        return self.complete
+
+    @property
+    def text(self) -> str:
+        return "".join(self._fragments)
+
+    def value(self):
+        """The parsed document; empty input parses as an empty object."""
+        text = self.text
+        return json.loads(text) if text.strip() else {}
+
+
+def schema_errors(value, schema: dict, path: str = "$") -> List[str]:
+    """
+    Check `value` against the parts of a JSON schema that matter for generated
+    output: `type`, `required`, `properties` and `items`.
+    """
+    expected = schema.get("type")
+    if isinstance(expected, str) and expected in JSON_TYPES:
+        if not isinstance(value, JSON_TYPES[expected]) or (expected in ("number", "integer") and isinstance(value, bool)):
+            return [f"{path} should be {expected}"]
+    errors = []
+    if isinstance(value, dict):
+        errors.extend(f"{path}.{key} is missing" for key in schema.get("required", []) if key not in value)
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                errors.extend(schema_errors(value[key], subschema, f"{path}.{key}"))
+    if isinstance(value, list) and isinstance(schema.get("items"), dict):
+        for i, item in enumerate(value):
+            errors.extend(schema_errors(item, schema["items"], f"{path}[{i}]"))
+    return errors
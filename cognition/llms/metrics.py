@@ -0,0 +1,203 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+RATE_BUCKETS = (1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0, 160.0)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **labels) -> int:
+        counts = self._counts.get(self._key(labels))
+        return counts[-1] if counts else 0
+
+    def mean(self, **labels) -> Optional[float]:
+        key = self._key(labels)
+        count = self.count(**labels)
+        return self._sums[key] / count if count else None
+
+    def label_values(self) -> List[Dict[str, str]]:
+        return [dict(zip(self.labelnames, key)) for key in list(self._counts)]
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, counts in self._counts.items():
+                for bound, count in zip(self.buckets, counts):
+                    le = 'le="%s"' % bound
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {counts[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {self._sums[key]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {counts[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "llm_request_duration_seconds", "Time spent in one backend call.", ("backend", "method"))
+LLM_TIME_TO_FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "llm_time_to_first_token_seconds", "Time from the start of a streamed call to its first delta.", ("backend",))
+LLM_OUTPUT_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "llm_output_tokens_per_second", "Output tokens per second of one backend call.", ("backend", "method"), RATE_BUCKETS)
+LLM_OUTPUT_TOKENS = REGISTRY.counter(
+    "llm_output_tokens_total", "Output tokens produced.", ("backend",))
+LLM_ERRORS = REGISTRY.counter(
+    "llm_errors_total", "Backend calls that raised.", ("backend", "method"))
+QUEUE_DEPTH = REGISTRY.gauge(
+    "queue_depth", "Requests waiting for a backend.", ("backend", "queue"))
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency, including streamed bodies.", ("endpoint",))
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by status code.", ("endpoint", "status"))
+HTTP_ERRORS = REGISTRY.counter(
+    "http_request_errors_total", "HTTP requests that ended in a 5xx.", ("endpoint",))
+
+
+class LLMCall:
+    """Per-call handle yielded by `track_llm`; backends report deltas and output through it."""
+
+    def __init__(self, backend: str, method: str):
+        self.backend = backend
+        self.method = method
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.output_tokens = 0
+
+    def delta(self, tokens: int = 1):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            LLM_TIME_TO_FIRST_TOKEN_SECONDS.observe(self.first_token_at - self.started, backend=self.backend)
+        self.output_tokens += tokens
+
+    def output(self, tokens: int):
+        self.output_tokens += tokens
+
+
+@contextmanager
+def track_llm(backend: str, method: str) -> Iterator[LLMCall]:
+    call = LLMCall(backend, method)
+    try:
+        yield call
+    except Exception:
+        LLM_ERRORS.inc(backend=backend, method=method)
+        raise
+    finally:
+        elapsed = time.perf_counter() - call.started
+        LLM_REQUEST_SECONDS.observe(elapsed, backend=backend, method=method)
+        if call.output_tokens:
+            LLM_OUTPUT_TOKENS.inc(call.output_tokens, backend=backend)
+            if elapsed > 0:
+                LLM_OUTPUT_TOKENS_PER_SECOND.observe(call.output_tokens / elapsed, backend=backend, method=method)
+
+
+def summary() -> Dict[str, dict]:
+    """Per-backend averages, for scripts that want to print the same numbers /metrics exposes."""
+    report = {}
+    for labels in LLM_REQUEST_SECONDS.label_values():
+        backend, method = labels["backend"], labels["method"]
+        report[f"{backend}.{method}"] = {
+            "calls": LLM_REQUEST_SECONDS.count(**labels),
+            "errors": int(LLM_ERRORS.get(**labels)),
+            "mean_latency_s": LLM_REQUEST_SECONDS.mean(**labels),
+            "mean_ttft_s": LLM_TIME_TO_FIRST_TOKEN_SECONDS.mean(backend=backend),
+            "mean_tokens_per_s": LLM_OUTPUT_TOKENS_PER_SECOND.mean(**labels),
+        }
+    return report
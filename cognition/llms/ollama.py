@@ -1,84 +1,228 @@
 import asyncio
 import logging
 import json
-from typing import List, AsyncGenerator
-from llama_index.llms.ollama import Ollama
+import weakref
+from typing import List, AsyncGenerator, Optional, Union
+import httpx
 from cognition.models.chat_models import ChatMessage
 from cognition.llms.base_llm import BaseLLM
-import tiktoken
+from cognition.llms.json_stream import IncrementalJSONParser, MalformedJSON, schema_errors
+from cognition.llms.prompt_cache import PromptStateCache
+from cognition.llms.rendering import MessageCache
+from cognition.llms.tokenizer import get_tokenizer
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class OllamaModel(BaseLLM):
-    def __init__(self, model: str = "llama3.1", request_timeout: float = 120.0):
+    def __init__(
+        self,
+        model: str = "llama3.1",
+        request_timeout: float = 120.0,
+        temperature: float = 0.75,
+        keep_alive: Optional[Union[str, int]] = None,
+        prompt_cache_tokens: int = 0,
+        tokenizer_path: Optional[str] = None,
+        base_url: str = "http://localhost:11434",
+    ):
         self.model = model
         self.request_timeout = request_timeout
-        self.llm = Ollama(model=model, request_timeout=request_timeout)
-        self.tokenizer = tiktoken.encoding_for_model("gpt-3.5-turbo")  # Use a default tokenizer
+        self.temperature = temperature
+        self.keep_alive = keep_alive
+        self.base_url = base_url.rstrip("/")
+        # Shared with every other user of this model's tokenizer, along with its cached counts.
+        self.tokenizer = get_tokenizer(model, tokenizer_path)
+        self._rendered = MessageCache(lambda msg: f"{msg.role}: {msg.content}")
+        # Per-session `context` returned by Ollama, so a turn only sends what the model hasn't seen.
+        self.prompt_states = PromptStateCache(prompt_cache_tokens) if prompt_cache_tokens > 0 else None
+        # httpx clients are bound to the event loop they were first used on, so keep one per loop.
+        # Weakly keyed, so a loop that is gone takes its entry with it.
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
 
     def count_tokens(self, text: str) -> int:
         """Count the number of tokens in the given text."""
-        return len(self.tokenizer.encode(text))
+        return self.tokenizer.count(text)
 
     def truncate_to_token_limit(self, text: str, max_tokens: int) -> str:
         """Truncate text to a specified maximum number of tokens."""
-        tokens = self.tokenizer.encode(text)
-        if len(tokens) <= max_tokens:
-            return text
-        return self.tokenizer.decode(tokens[:max_tokens])
-
-    async def generate(self, messages: List[ChatMessage]) -> str:
+        return self.tokenizer.truncate(text, max_tokens)
+
+    async def warmup(self, system_prompt: str, prompt: str = "Hello"):
+        """
+        Load the model into Ollama and evaluate the system prompt once.
+
+        A single one-token completion loads the weights, primes Ollama's prompt
+        cache with the persona, and (with `keep_alive`) keeps the model resident
+        instead of letting it unload after Ollama's idle timeout.
+        """
+        payload = self._payload(self._serialize_messages([
+            ChatMessage(role="system", content=system_prompt),
+            ChatMessage(role="user", content=prompt),
+        ]), stream=False, options={"num_predict": 1})
+        response = await self._http_client().post("/api/generate", json=payload)
+        response.raise_for_status()
+        logger.info(f"Warmed up {self.model} (load {response.json().get('load_duration', 0) / 1e9:.2f}s)")
+
+    async def generate(self, messages: List[ChatMessage], session_id: Optional[str] = None) -> str:
         """Generate a response to a list of chat messages."""
-        logger.info(f"Generating response for messages: {messages}")
+        logger.info(f"Generating response for {len(messages)} messages")
         try:
-            serialized_messages = self._serialize_messages(messages)
-            response = await self.llm.acomplete(serialized_messages)
-            logger.info(f"Generated response: {response}")
-            return str(response)
+            with self.track("generate") as call:
+                lines = self._rendered.map(messages)
+                prompt, fields = self._resume(session_id, lines)
+                response = await self._http_client().post(
+                    "/api/generate", json=self._payload(prompt, stream=False, **fields))
+                response.raise_for_status()
+                result = response.json()
+                text = result.get("response", "")
+                logger.info(f"Generated response: {text}")
+                call.output(result.get("eval_count") or self.count_tokens(text))
+                self._save_context(session_id, lines, text, result.get("context"))
+                return text
         except Exception as e:
             logger.error(f"Error generating response: {str(e)}")
             raise
 
-    async def stream(self, messages: List[ChatMessage]) -> AsyncGenerator[str, None]:
+    async def stream(self, messages: List[ChatMessage], session_id: Optional[str] = None) -> AsyncGenerator[str, None]:
         """Stream a response to a list of chat messages."""
-        logger.info(f"Streaming response for messages: {messages}")
+        logger.info(f"Streaming response for {len(messages)} messages")
         try:
-            serialized_messages = self._serialize_messages(messages)
-            stream_response = await self.llm.astream_complete(serialized_messages)
-            async for token in self._async_iterate(stream_response):
-                yield token.delta
+            with self.track("stream") as call:
+                lines = self._rendered.map(messages)
+                prompt, fields = self._resume(session_id, lines)
+                payload = self._payload(prompt, stream=True, **fields)
+                response = ""
+                # Leaving the block closes the HTTP stream, which stops Ollama generating.
+                async with self._http_client().stream("POST", "/api/generate", json=payload) as http_response:
+                    http_response.raise_for_status()
+                    async for chunk in self._chunks(http_response):
+                        delta = chunk.get("response", "")
+                        if delta:
+                            call.delta()
+                            response += delta
+                            yield delta
+                        if chunk.get("done"):
+                            # Only the final chunk carries the context.
+                            self._save_context(session_id, lines, response, chunk.get("context"))
         except Exception as e:
             logger.error(f"Error streaming response: {str(e)}")
             raise
 
-    async def _async_iterate(self, async_iterable):
-        while True:
-            try:
-                yield await async_iterable.__anext__()
-            except StopAsyncIteration:
-                break
+    def _payload(self, prompt: str, stream: bool, **fields) -> dict:
+        """An /api/generate request body; `fields` add to or override the defaults."""
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "options": {"temperature": self.temperature},
+        }
+        if self.keep_alive is not None:
+            # Sent with every request; otherwise each one resets Ollama's unload timer to its default.
+            payload["keep_alive"] = self.keep_alive
+        payload.update(fields)
+        return payload
+
+    async def _chunks(self, response: httpx.Response) -> AsyncGenerator[dict, None]:
+        """The NDJSON chunks of a streamed /api/generate response."""
+        async for line in response.aiter_lines():
+            if not line.strip():
+                continue
+            chunk = json.loads(line)
+            if "error" in chunk:
+                raise RuntimeError(chunk["error"])
+            yield chunk
+
+    def _resume(self, session_id: Optional[str], lines: List[str]):
+        """
+        Build the prompt and extra payload fields for this turn. If the session's
+        saved context covers a prefix of the conversation, send only the new
+        lines along with it.
+        """
+        state = self.prompt_states.pop(session_id) if self.prompt_states is not None else None
+        if state is not None:
+            covered, context = state
+            if len(covered) < len(lines) and lines[:len(covered)] == covered:
+                return "\n".join(lines[len(covered):]), {"context": context}
+        return "\n".join(lines), {}
+
+    def _save_context(self, session_id: Optional[str], lines: List[str], response: str, context: Optional[List[int]]):
+        if self.prompt_states is not None and context:
+            # Rendered the way the next turn will render this reply once it is in the history.
+            covered = lines + [f"assistant: {response}"]
+            self.prompt_states.put(session_id, (covered, context), len(context))
 
     async def function_call(self, function_name: str, function_args: dict) -> str:
         """Implement function calling if supported by Ollama, otherwise raise NotImplementedError."""
         raise NotImplementedError("Function calling is not implemented for Ollama models.")
 
-    async def generate_json(self, prompt: str) -> dict:
-        """Generate a JSON response to a prompt."""
-        logger.info(f"Generating JSON response for prompt: {prompt}")
+    async def generate_json(self, prompt: str, schema: Optional[dict] = None, max_retries: int = 2) -> dict:
+        """
+        Generate a JSON response to a prompt, constrained to `schema` if given.
+
+        The response is parsed as it streams, so output that goes wrong (text
+        before the opening brace, mismatched brackets, runaway whitespace) is
+        abandoned at that point and retried, rather than after the whole
+        response has been generated.
+        """
+        logger.info(f"Generating JSON response for prompt: {prompt[:100]}")
+        for attempt in range(max_retries + 1):
+            try:
+                with self.track("generate_json") as call:
+                    json_response = await self._stream_json(prompt, schema, call)
+                logger.info(f"Generated JSON response: {json_response}")
+                return json_response
+            except MalformedJSON as e:
+                if attempt == max_retries:
+                    logger.error(f"Error generating JSON response: {str(e)}")
+                    raise
+                logger.warning(f"Malformed JSON response ({str(e)}), retrying")
+            except Exception as e:
+                logger.error(f"Error generating JSON response: {str(e)}")
+                raise
+
+    async def _stream_json(self, prompt: str, schema: Optional[dict], call) -> dict:
+        payload = self._payload(prompt, stream=True, format=schema or "json")
+        parser = IncrementalJSONParser()
+        # Leaving the block closes the response, which stops Ollama generating.
+        async with self._http_client().stream("POST", "/api/generate", json=payload) as response:
+            response.raise_for_status()
+            async for chunk in self._chunks(response):
+                call.delta()
+                if parser.feed(chunk.get("response", "")) or parser.error or chunk.get("done"):
+                    break
+        if parser.error:
+            raise MalformedJSON(parser.error)
+        if not parser.complete:
+            raise MalformedJSON("response ended before the JSON was complete")
         try:
-            json_llm = Ollama(model=self.model, request_timeout=self.request_timeout, json_mode=True)
-            response = await json_llm.acomplete(prompt)
-            json_response = json.loads(str(response))
-            logger.info(f"Generated JSON response: {json_response}")
-            return json_response
-        except Exception as e:
-            logger.error(f"Error generating JSON response: {str(e)}")
-            raise
+            value = parser.value()
+        except json.JSONDecodeError as e:
+            raise MalformedJSON(str(e)) from e
+        errors = schema_errors(value, schema) if schema else []
+        if errors:
+            raise MalformedJSON("; ".join(errors))
+        return value
+
+    def _http_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            # Clients of closed loops can't be used or closed any more; let their connections be collected.
+            for stale in [stale for stale in self._clients if stale.is_closed()]:
+                del self._clients[stale]
+            client = self._clients[loop] = httpx.AsyncClient(
+                base_url=self.base_url, timeout=httpx.Timeout(self.request_timeout, connect=10.0))
+        return client
+
+    async def aclose(self):
+        """Close the HTTP client used on the running event loop; call it on each loop the model was used from."""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
 
     def _serialize_messages(self, messages: List[ChatMessage]) -> str:
-        """Serialize ChatMessage objects into a string format."""
-        return "\n".join([f"{msg.role}: {msg.content}" for msg in messages])
+        """Serialize ChatMessage objects into a string format, reusing each message's cached rendering."""
+        return "\n".join(self._rendered.map(messages))
 
 # Example usage
 async def main():
@@ -0,0 +1,229 @@
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional, Union
+import httpx
+from cognition.llms import metrics
+from cognition.llms.base_llm import BaseLLM
+from cognition.llms.rendering import MessageCache
+from cognition.llms.tokenizer import get_tokenizer
+from cognition.llms.tool_calls import ToolCallDelta
+from cognition.models.chat_models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_LOAD_SECONDS = metrics.REGISTRY.histogram(
+    "ollama_load_duration_seconds", "Time Ollama spent loading the model for a request.", ("model",))
+OLLAMA_PROMPT_EVAL_SECONDS = metrics.REGISTRY.histogram(
+    "ollama_prompt_eval_duration_seconds", "Server-side prefill time.", ("model",))
+OLLAMA_PROMPT_TOKENS = metrics.REGISTRY.counter(
+    "ollama_prompt_eval_tokens_total", "Prompt tokens Ollama evaluated (excludes tokens reused from its cache).", ("model",))
+OLLAMA_EVAL_TOKENS_PER_SECOND = metrics.REGISTRY.histogram(
+    "ollama_eval_tokens_per_second", "Server-side decode speed.", ("model",), metrics.RATE_BUCKETS)
+
+
+class OllamaError(Exception):
+    pass
+
+
+class OllamaTimings:
+    """Server-side timings from the final chunk of an Ollama response; durations in seconds."""
+
+    def __init__(self, stats: dict):
+        self.total = stats.get("total_duration", 0) / 1e9
+        self.load = stats.get("load_duration", 0) / 1e9
+        self.prompt_eval = stats.get("prompt_eval_duration", 0) / 1e9
+        self.prompt_eval_count = stats.get("prompt_eval_count", 0)
+        self.eval = stats.get("eval_duration", 0) / 1e9
+        self.eval_count = stats.get("eval_count", 0)
+
+    @property
+    def eval_tokens_per_second(self) -> Optional[float]:
+        return self.eval_count / self.eval if self.eval else None
+
+    def as_dict(self) -> dict:
+        return dict(vars(self), eval_tokens_per_second=self.eval_tokens_per_second)
+
+
+class OllamaResponse:
+    """The NDJSON chunks of one /api/chat response; `timings` is set once the final chunk has been read."""
+
+    def __init__(self, response: httpx.Response):
+        self.response = response
+        self.timings: Optional[OllamaTimings] = None
+
+    async def __aiter__(self) -> AsyncIterator[dict]:
+        async for line in self.response.aiter_lines():
+            if not line.strip():
+                continue
+            chunk = json.loads(line)
+            if "error" in chunk:
+                raise OllamaError(chunk["error"])
+            if chunk.get("done"):
+                self.timings = OllamaTimings(chunk)
+            yield chunk
+
+
+class OllamaChatModel(BaseLLM):
+    """
+    Ollama backend that talks to its HTTP API directly.
+
+    Uses /api/chat with structured messages, streams the NDJSON response over
+    a pooled httpx client, passes `keep_alive` and `options.num_ctx`, and
+    records the server's load, prefill and decode timings. Each call reads
+    its own timings from its response; `last_timings` keeps the most recent
+    ones for debugging and may belong to a concurrent request.
+    """
+
+    def __init__(
+        self,
+        model: str = "llama3.1",
+        base_url: str = "http://localhost:11434",
+        client: Optional[httpx.AsyncClient] = None,
+        temperature: Optional[float] = None,
+        keep_alive: Optional[Union[str, int]] = None,
+        num_ctx: Optional[int] = None,
+        tools: Optional[List[dict]] = None,
+        functions: Optional[Dict[str, Callable]] = None,
+        request_timeout: float = 120.0,
+        tokenizer_path: Optional[str] = None,
+    ):
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        # An injected client may be shared, so only a client made here is closed by `aclose`.
+        self._owns_client = client is None
+        self.client = client or httpx.AsyncClient(timeout=httpx.Timeout(request_timeout, connect=10.0))
+        self.temperature = temperature
+        self.keep_alive = keep_alive
+        self.num_ctx = num_ctx
+        self.tools = tools
+        self.functions = functions or {}
+        self.last_timings: Optional[OllamaTimings] = None
+        self._rendered = MessageCache(self._format_message)
+        self.tokenizer = get_tokenizer(model, tokenizer_path)
+
+    async def generate(self, messages: List[ChatMessage], session_id: Optional[str] = None) -> str:
+        with self.track("generate") as call:
+            response = ""
+            async with self._chat(messages, stream=False) as chunks:
+                async for chunk in chunks:
+                    response += chunk.get("message", {}).get("content", "")
+            call.output(chunks.timings.eval_count if chunks.timings else self.count_tokens(response))
+            return response
+
+    async def stream(self, messages: List[ChatMessage], session_id: Optional[str] = None) -> AsyncGenerator[str, None]:
+        with self.track("stream") as call:
+            # Leaving the block closes the HTTP response, which stops Ollama generating.
+            async with self._chat(messages, stream=True) as chunks:
+                async for chunk in chunks:
+                    content = chunk.get("message", {}).get("content", "")
+                    if content:
+                        call.delta()
+                        yield content
+
+    async def _arun(self, messages: List[ChatMessage]) -> AsyncGenerator[Union[str, ToolCallDelta], None]:
+        """Stream text and tool calls. Ollama sends each tool call whole, with its arguments as an object."""
+        with self.track("stream") as call:
+            index = 0
+            async with self._chat(messages, stream=True, tools=self.tools) as chunks:
+                async for chunk in chunks:
+                    message = chunk.get("message", {})
+                    if message.get("content"):
+                        call.delta()
+                        yield message["content"]
+                    for tool_call in message.get("tool_calls") or []:
+                        call.delta()
+                        function = tool_call.get("function", {})
+                        yield ToolCallDelta(
+                            index=index,
+                            id=tool_call.get("id") or f"call_{index}",
+                            name=function.get("name"),
+                            arguments=json.dumps(function.get("arguments", {})),
+                        )
+                        index += 1
+
+    def count_tokens(self, text: str) -> int:
+        return self.tokenizer.count(text)
+
+    async def warmup(self, system_prompt: str, prompt: str = "Hello"):
+        """Load the model (kept resident by `keep_alive`) and evaluate the system prompt with a one-token reply."""
+        messages = [ChatMessage(role="system", content=system_prompt), ChatMessage(role="user", content=prompt)]
+        async with self._chat(messages, stream=False, options={"num_predict": 1}) as chunks:
+            async for _ in chunks:
+                pass
+        load = f" (load {chunks.timings.load:.2f}s)" if chunks.timings else ""
+        logger.info(f"Warmed up {self.model}{load}")
+
+    @asynccontextmanager
+    async def _chat(
+        self,
+        messages: List[ChatMessage],
+        stream: bool,
+        tools: Optional[List[dict]] = None,
+        options: Optional[dict] = None,
+    ) -> AsyncIterator[OllamaResponse]:
+        """POST /api/chat and yield the response, to be iterated over chunk by chunk."""
+        payload = {"model": self.model, "messages": self._rendered.map(messages), "stream": stream}
+        request_options = {}
+        if self.temperature is not None:
+            request_options["temperature"] = self.temperature
+        if self.num_ctx is not None:
+            request_options["num_ctx"] = self.num_ctx
+        request_options.update(options or {})
+        if request_options:
+            payload["options"] = request_options
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        if tools:
+            payload["tools"] = tools
+
+        async with self.client.stream("POST", f"{self.base_url}/api/chat", json=payload) as response:
+            if response.is_error:
+                await response.aread()
+                raise OllamaError(f"Ollama returned {response.status_code}: {response.text}")
+            chunks = OllamaResponse(response)
+            yield chunks
+            if chunks.timings is not None:
+                self._record_timings(chunks.timings)
+
+    def _record_timings(self, timings: OllamaTimings):
+        self.last_timings = timings
+        OLLAMA_LOAD_SECONDS.observe(timings.load, model=self.model)
+        OLLAMA_PROMPT_EVAL_SECONDS.observe(timings.prompt_eval, model=self.model)
+        OLLAMA_PROMPT_TOKENS.inc(timings.prompt_eval_count, model=self.model)
+        if timings.eval_tokens_per_second is not None:
+            OLLAMA_EVAL_TOKENS_PER_SECOND.observe(timings.eval_tokens_per_second, model=self.model)
+
+    def _format_message(self, msg: ChatMessage) -> dict:
+        message = {"role": msg.role, "content": msg.content}
+        if msg.tool_calls:
+            # Ollama takes arguments as an object rather than OpenAI's JSON string.
+            message["tool_calls"] = [
+                {"function": {"name": call["function"]["name"], "arguments": json.loads(call["function"]["arguments"] or "{}")}}
+                for call in msg.tool_calls
+            ]
+        return message
+
+    async def aclose(self):
+        if self._owns_client:
+            await self.client.aclose()
+
+
+# Example usage
+async def main():
+    ollama = OllamaChatModel(model="llama3.1")
+    messages = [
+        ChatMessage(role="system", content="You are a pirate with a colorful personality"),
+        ChatMessage(role="user", content="What is your name?"),
+    ]
+
+    print("Stream:")
+    async for token in ollama.stream(messages):
+        print(token, end="", flush=True)
+    print()
+    print(json.dumps(ollama.last_timings.as_dict(), indent=2))
+    await ollama.aclose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,9 +1,12 @@
 import asyncio
 import os
-from typing import List, AsyncGenerator
+from typing import Callable, Dict, List, AsyncGenerator, Optional, Union
 from openai import AsyncOpenAI
 from tenacity import retry, wait_random_exponential, stop_after_attempt
 from cognition.llms.base_llm import BaseLLM
+from cognition.llms.rendering import MessageCache
+from cognition.llms.tokenizer import get_tokenizer
+from cognition.llms.tool_calls import ToolCallDelta
 from cognition.models.chat_models import ChatMessage
 from typing import List, AsyncGenerator
 import json
@@ -13,47 +16,109 @@ import dotenv; dotenv.load_dotenv()
 
 
 class OpenAIModel(BaseLLM):
-    def __init__(self, model: str = 'gpt-3.5-turbo', tools=None):
-        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(
+        self,
+        model: str = 'gpt-3.5-turbo',
+        tools=None,
+        client: Optional[AsyncOpenAI] = None,
+        temperature: Optional[float] = None,
+        functions: Optional[Dict[str, Callable]] = None,
+    ):
+        self.client = client or AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         self.model = model
         self.tools = tools
+        self.functions = functions or {}
+        self.temperature = temperature
+        self._rendered = MessageCache(self._format_message)
+        # tiktoken's encoding for this model, so the context window budgets real tokens rather than words.
+        self.tokenizer = get_tokenizer(model)
 
     @retry(wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(3))
-    async def generate(self, messages: List[ChatMessage]) -> str:
+    async def generate(self, messages: List[ChatMessage], session_id: Optional[str] = None) -> str:
         json_data = {"model": self.model, "messages": self._format_messages(messages)}
+        if self.temperature is not None:
+            json_data["temperature"] = self.temperature
         if self.tools:
             json_data["tools"] = self.tools
             json_data["tool_choice"] = "auto"
 
         try:
-            response = await self.client.chat.completions.create(**json_data)
-            return response.choices[0].message.content
+            with self.track("generate") as call:
+                response = await self.client.chat.completions.create(**json_data)
+                if response.usage is not None:
+                    call.output(response.usage.completion_tokens)
+                return response.choices[0].message.content
         except Exception as e:
             print(f"Unable to generate ChatCompletion response: {e}")
             raise
 
     @retry(wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(3))
-    async def stream(self, messages: List[ChatMessage]) -> AsyncGenerator[str, None]:
+    async def stream(self, messages: List[ChatMessage], session_id: Optional[str] = None) -> AsyncGenerator[str, None]:
         json_data = {"model": self.model, "messages": self._format_messages(messages), "stream": True}
+        if self.temperature is not None:
+            json_data["temperature"] = self.temperature
         if self.tools:
             json_data["tools"] = self.tools
             json_data["tool_choice"] = "auto"
 
         try:
-            stream = await self.client.chat.completions.create(**json_data)
-            async for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
+            with self.track("stream") as call:
+                stream = await self.client.chat.completions.create(**json_data)
+                try:
+                    async for chunk in stream:
+                        if chunk.choices[0].delta.content is not None:
+                            call.delta()
+                            yield chunk.choices[0].delta.content
+                finally:
+                    await stream.close()
         except Exception as e:
             print(f"Unable to generate streaming ChatCompletion response: {e}")
             raise
 
-    async def function_call(self, function_name: str, function_args: dict) -> str:
-        # Implement function calling logic here
-        pass
+    async def _arun(self, messages: List[ChatMessage]) -> AsyncGenerator[Union[str, ToolCallDelta], None]:
+        """Stream text and tool-call deltas; several tool calls may be interleaved by index."""
+        json_data = {"model": self.model, "messages": self._format_messages(messages), "stream": True}
+        if self.temperature is not None:
+            json_data["temperature"] = self.temperature
+        if self.tools:
+            json_data["tools"] = self.tools
+            json_data["tool_choice"] = "auto"
+
+        with self.track("stream") as call:
+            stream = await self.client.chat.completions.create(**json_data)
+            try:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.content:
+                        call.delta()
+                        yield delta.content
+                    for tool_call in delta.tool_calls or []:
+                        call.delta()
+                        function = tool_call.function
+                        yield ToolCallDelta(
+                            index=tool_call.index,
+                            id=tool_call.id,
+                            name=function.name if function else None,
+                            arguments=(function.arguments or "") if function else "",
+                        )
+            finally:
+                await stream.close()
+
+    def count_tokens(self, text: str) -> int:
+        return self.tokenizer.count(text)
 
     def _format_messages(self, messages: List[ChatMessage]) -> List[dict]:
-        return [{"role": msg.role, "content": msg.content} for msg in messages]
+        return self._rendered.map(messages)
+
+    def _format_message(self, msg: ChatMessage) -> dict:
+        message = {"role": msg.role, "content": msg.content}
+        if msg.tool_calls:
+            message["tool_calls"] = msg.tool_calls
+        if msg.tool_call_id:
+            message["tool_call_id"] = msg.tool_call_id
+        return message
 
 # Example usage
 async def main():
@@ -0,0 +1,78 @@
+from collections import OrderedDict
+from typing import Any, List, Optional, Sequence, Tuple
+
+
+def common_prefix_length(a: Sequence, b: Sequence) -> int:
+    n = min(len(a), len(b))
+    for i in range(n):
+        if a[i] != b[i]:
+            return i
+    return n
+
+
+class PromptStateCache:
+    """
+    LRU of per-session prompt state, bounded by the total number of tokens held.
+
+    A backend stores whatever lets it skip re-processing a session's earlier
+    turns (HF past_key_values, Ollama's `context`) together with its size in
+    tokens. A state is popped while a request uses it, so it is never shared
+    by two generations, and put back afterwards.
+    """
+
+    def __init__(self, max_tokens: int = 32768):
+        self.max_tokens = max_tokens
+        self.tokens = 0
+        self._states: "OrderedDict[str, Tuple[int, Any]]" = OrderedDict()
+
+    def pop(self, session_id: Optional[str]) -> Optional[Any]:
+        if session_id is None or session_id not in self._states:
+            return None
+        size, state = self._states.pop(session_id)
+        self.tokens -= size
+        return state
+
+    def put(self, session_id: Optional[str], state: Any, size: int):
+        if session_id is None or size > self.max_tokens:
+            return
+        self.pop(session_id)
+        self._states[session_id] = (size, state)
+        self.tokens += size
+        while self.tokens > self.max_tokens:
+            _, (evicted, _) = self._states.popitem(last=False)
+            self.tokens -= evicted
+
+    def __len__(self):
+        return len(self._states)
+
+    def sessions(self) -> List[str]:
+        return list(self._states)
+
+
+class PrefixCache:
+    """
+    Prompt state for prefixes shared by many sessions, such as a persona's
+    system prompt, keyed by the prefix's token ids.
+
+    Keying by content means an edited persona simply misses and gets a fresh
+    entry; the stale one ages out of the LRU.
+    """
+
+    def __init__(self, max_entries: int = 4):
+        self.max_entries = max_entries
+        self._states: "OrderedDict[Tuple[int, ...], Any]" = OrderedDict()
+
+    def get(self, prefix_ids: Sequence[int]) -> Optional[Any]:
+        key = tuple(prefix_ids)
+        state = self._states.get(key)
+        if state is not None:
+            self._states.move_to_end(key)
+        return state
+
+    def put(self, prefix_ids: Sequence[int], state: Any):
+        self._states[tuple(prefix_ids)] = state
+        while len(self._states) > self.max_entries:
+            self._states.popitem(last=False)
+
+    def __len__(self):
+        return len(self._states)
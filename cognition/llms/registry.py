@@ -0,0 +1,117 @@
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, Tuple, Optional
+import httpx
+import settings
+from cognition.llms import load_backend
+from cognition.llms.base_llm import BaseLLM
+
+logger = logging.getLogger(__name__)
+
+
+class LLMRegistry:
+    """
+    Process-wide cache of warm BaseLLM backends.
+
+    Each (backend, model, options) combination is constructed once and then
+    handed out to every request. Backends that accept an httpx client share
+    a single connection pool owned by the registry.
+    """
+
+    def __init__(self):
+        self._backends: Dict[Tuple, BaseLLM] = {}
+        # Backends may be created from a worker thread during startup; reentrant because
+        # a router creates its child backends while its own creation holds the lock.
+        self._lock = threading.RLock()
+        self.http_client = httpx.AsyncClient(timeout=httpx.Timeout(120.0, connect=10.0))
+
+    @staticmethod
+    def _key(backend: str, model: Optional[str], options: dict) -> Tuple:
+        return (backend, model, tuple(sorted(options.items())))
+
+    def get(self, backend: str, model: Optional[str] = None, **options) -> BaseLLM:
+        """Return the warm backend for this configuration, creating it on first use."""
+        key = self._key(backend, model, options)
+        llm = self._backends.get(key)
+        if llm is None:
+            with self._lock:
+                llm = self._backends.get(key)
+                if llm is None:
+                    logger.info(f"Creating {backend} backend for model {model} with options {options}")
+                    llm = self._create(backend, model, options)
+                    self._backends[key] = llm
+        return llm
+
+    def is_loaded(self, backend: str, model: Optional[str] = None, **options) -> bool:
+        return self._key(backend, model, options) in self._backends
+
+    def _create(self, backend: str, model: Optional[str], options: dict) -> BaseLLM:
+        if backend == "huggingface" and "model_path" not in options:
+            options["model_path"] = self._hf_model_path(model)
+        # Backends are imported here so only the selected ones pay for their dependencies.
+        model_class = load_backend(backend)
+        if backend == "openai":
+            from base import BaseConfig
+            options["client"] = BaseConfig("openai").get_async_openai_client(
+                base_url=options.pop("base_url", None),
+                api_key=options.pop("api_key", None),
+                http_client=self.http_client,
+            )
+        if backend == "router":
+            options.setdefault("hedge_after", settings.ROUTER_HEDGE_AFTER)
+            options.setdefault("percentile", settings.ROUTER_PERCENTILE)
+            return model_class(backends=self._routes(options.pop("temperature", None)), **options)
+        if backend in ("ollama", "huggingface"):
+            options.setdefault("prompt_cache_tokens", settings.PROMPT_CACHE_MAX_TOKENS)
+        if backend in ("ollama", "ollama_chat"):
+            options.setdefault("keep_alive", settings.OLLAMA_KEEP_ALIVE)
+            options.setdefault("tokenizer_path", settings.TOKENIZER_PATH)
+            options.setdefault("base_url", settings.OLLAMA_BASE_URL)
+        if backend == "ollama_chat":
+            options.setdefault("client", self.http_client)
+            options.setdefault("num_ctx", settings.OLLAMA_NUM_CTX)
+        if backend == "huggingface":
+            options.setdefault("max_batch_size", settings.HF_MAX_BATCH_SIZE)
+            options.setdefault("max_batch_wait", settings.HF_MAX_BATCH_WAIT)
+            options.setdefault("prefix_cache", settings.PREFIX_CACHE_ENABLED)
+            options.setdefault("stop_sequences", settings.HF_STOP_SEQUENCES)
+            options.setdefault("intra_op_threads", settings.HF_INTRA_OP_THREADS)
+            options.setdefault("inter_op_threads", settings.HF_INTER_OP_THREADS)
+            return model_class(**options)
+        model_kwargs = {"model": model} if model is not None else {}
+        return model_class(**model_kwargs, **options)
+
+    @staticmethod
+    def _hf_model_path(model: Optional[str]) -> str:
+        """The local directory or Hub repo id to load: `model` when it is one, else HF_MODEL_PATH."""
+        for candidate in (model, settings.HF_MODEL_PATH):
+            if candidate and (os.path.isdir(candidate) or re.fullmatch(r"[\w.-]+/[\w.-]+", candidate)):
+                return candidate
+        raise ValueError(
+            f"The huggingface backend needs a local model directory or a Hugging Face repo id, "
+            f"but model {model!r} is neither and HF_MODEL_PATH is {settings.HF_MODEL_PATH!r}"
+        )
+
+    def _routes(self, temperature: Optional[float]) -> List[BaseLLM]:
+        """The router's backends, from ROUTER_BACKENDS ("backend:model,backend:model"), in priority order."""
+        options = {"temperature": temperature} if temperature is not None else {}
+        routes = []
+        for route in settings.ROUTER_BACKENDS.split(","):
+            backend, _, model = route.strip().partition(":")
+            routes.append(self.get(backend, model or None, **options))
+        return routes
+
+    def __len__(self):
+        return len(self._backends)
+
+    def __iter__(self):
+        return iter(list(self._backends.values()))
+
+    async def aclose(self):
+        for llm in self:
+            if hasattr(llm, "aclose"):
+                await llm.aclose()
+        await self.http_client.aclose()
+        self._backends.clear()
@@ -0,0 +1,108 @@
+from collections import OrderedDict
+from typing import Any, Callable, List, Tuple
+from cognition.models.chat_models import ChatMessage
+
+
+class MessageCache:
+    """
+    Cache of a value computed from each message: its rendered form, its
+    token count.
+
+    A session's history is the same list of ChatMessage objects turn after
+    turn, so caching by message identity means a turn only computes values
+    for the messages it hasn't seen yet. Messages are treated as immutable
+    once seen. Beyond the messages of the latest call, at most `max_entries`
+    others are kept, least recently used first out.
+    """
+
+    def __init__(self, compute: Callable[[ChatMessage], Any], max_entries: int = 8192):
+        self.compute = compute
+        self.max_entries = max_entries
+        # Keyed by id(); each entry holds its message so the id can't be reused while cached.
+        self._entries: "OrderedDict[int, Tuple[ChatMessage, Any]]" = OrderedDict()
+
+    def map(self, messages: List[ChatMessage]) -> List[Any]:
+        values = []
+        for message in messages:
+            key = id(message)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] is not message:
+                entry = self._entries[key] = (message, self.compute(message))
+            self._entries.move_to_end(key)
+            values.append(entry[1])
+        while len(self._entries) > self.max_entries + len(messages):
+            self._entries.popitem(last=False)
+        return values
+
+    def clear(self):
+        self._entries.clear()
+
+
+class ChatTemplateSegments:
+    """
+    Splits a tokenizer's chat template into independent per-message segments.
+
+    The first message is rendered as a conversation of its own, which covers
+    whatever the template emits up front (BOS, default system headers). Every
+    later message is rendered as the text it adds after a fixed anchor
+    message. A prompt is then the concatenation of cached segments plus the
+    generation prompt. Templates where a message's text depends on the
+    messages around it don't split this way; a probe conversation detects
+    them at construction, and `supported` is False.
+    """
+
+    ANCHOR = ChatMessage(role="system", content="anchor")
+    PROBES = [
+        [
+            ChatMessage(role="system", content="probe system"),
+            ChatMessage(role="user", content="probe user"),
+            ChatMessage(role="assistant", content="probe assistant"),
+            ChatMessage(role="user", content="probe user again"),
+        ],
+        [
+            ChatMessage(role="user", content="probe user"),
+            ChatMessage(role="assistant", content="probe assistant"),
+            ChatMessage(role="user", content="probe user again"),
+        ],
+    ]
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        try:
+            self._anchor = self._template([self.ANCHOR])
+            self._generation_prompt = self._template([self.ANCHOR], add_generation_prompt=True)[len(self._anchor):]
+            self.supported = all(self._check(probe) for probe in self.PROBES)
+        except Exception:
+            # Templates that reject a system message, for example, can't be split.
+            self.supported = False
+
+    def _template(self, messages: List[ChatMessage], add_generation_prompt: bool = False) -> str:
+        return self.tokenizer.apply_chat_template(
+            [{"role": msg.role, "content": msg.content} for msg in messages],
+            tokenize=False,
+            add_generation_prompt=add_generation_prompt,
+        )
+
+    def render_first(self, message: ChatMessage) -> str:
+        return self._template([message])
+
+    def render(self, message: ChatMessage) -> str:
+        """The text this message adds when it follows other messages."""
+        rendered = self._template([self.ANCHOR, message])
+        if not rendered.startswith(self._anchor):
+            raise ValueError("Chat template renders messages differently depending on what follows them")
+        return rendered[len(self._anchor):]
+
+    def generation_prompt(self) -> str:
+        return self._generation_prompt
+
+    def encode(self, text: str) -> List[int]:
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+    def _check(self, probe: List[ChatMessage]) -> bool:
+        expected = self._template(probe, add_generation_prompt=True)
+        pieces = [self.render_first(probe[0])] + [self.render(msg) for msg in probe[1:]] + [self.generation_prompt()]
+        if "".join(pieces) != expected:
+            return False
+        ids = [token for piece in pieces for token in self.encode(piece)]
+        return ids == self.encode(expected)
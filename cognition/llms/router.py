@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncGenerator, Deque, Dict, List, Optional
+from cognition.llms import metrics
+from cognition.llms.base_llm import BaseLLM
+from cognition.models.chat_models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+HEDGED_REQUESTS = metrics.REGISTRY.counter(
+    "llm_hedged_requests_total", "Requests that fired a hedge, by which backend answered first.", ("primary", "winner"))
+
+
+class LatencyTracker:
+    """Sliding window of one backend's time-to-first-token samples."""
+
+    def __init__(self, window: int = 100):
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class RoutingModel(BaseLLM):
+    """
+    Routes each request to the backend with the best recent tail latency and
+    hedges it.
+
+    If the primary hasn't produced its first token within `hedge_after`
+    seconds, the same request is fired at the next backend; whichever starts
+    answering first is used and the other is cancelled. `generate` joins the
+    winning stream, so it is hedged the same way. Backends keep their configured
+    order until each has `min_samples` observations, then are ranked by their
+    `percentile` time to first token. A hedged-out or failed request counts
+    as a slow sample, so a degraded primary is demoted.
+    """
+
+    def __init__(
+        self,
+        backends: List[BaseLLM],
+        hedge_after: float = 1.0,
+        percentile: float = 95.0,
+        min_samples: int = 5,
+        error_penalty: float = 30.0,
+    ):
+        if not backends:
+            raise ValueError("RoutingModel needs at least one backend")
+        self.backends = backends
+        self.hedge_after = hedge_after
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.error_penalty = error_penalty
+        self.latency: Dict[int, LatencyTracker] = {id(backend): LatencyTracker() for backend in backends}
+
+    def ranked(self) -> List[BaseLLM]:
+        """Backends in the order they should be tried."""
+        trackers = [self.latency[id(backend)] for backend in self.backends]
+        if any(len(tracker.samples) < self.min_samples for tracker in trackers):
+            return list(self.backends)
+        order = sorted(range(len(self.backends)), key=lambda i: (trackers[i].percentile(self.percentile), i))
+        return [self.backends[i] for i in order]
+
+    async def generate(self, messages: List[ChatMessage], session_id: Optional[str] = None) -> str:
+        # Built on `stream` so hedging waits on the first token, not on the whole reply.
+        async with aclosing(self.stream(messages, session_id)) as deltas:
+            return "".join([delta async for delta in deltas])
+
+    async def stream(self, messages: List[ChatMessage], session_id: Optional[str] = None) -> AsyncGenerator[str, None]:
+        kwargs = {"session_id": session_id} if session_id else {}
+        # The primary and the hedge both come from this one ranking.
+        ranked = self.ranked()
+        started = time.perf_counter()
+        # Each candidate is an open stream plus the task fetching its first delta.
+        streams = {}
+
+        def start(backend: BaseLLM):
+            deltas = backend.stream(messages, **kwargs)
+            streams[asyncio.ensure_future(deltas.__anext__())] = (backend, deltas)
+
+        async def close(task: asyncio.Future, deltas):
+            task.cancel()
+            try:
+                await task
+            except BaseException:
+                pass
+            await deltas.aclose()
+
+        start(ranked[0])
+        hedged = False
+        winner = None
+        try:
+            while winner is None:
+                timeout = self.hedge_after if not hedged and len(ranked) > 1 else None
+                done, _ = await asyncio.wait(streams, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    start(ranked[1])
+                    continue
+                for task in done:
+                    backend, deltas = streams.pop(task)
+                    error = task.exception()
+                    if error is None or isinstance(error, StopAsyncIteration):
+                        if winner is None:
+                            winner = (backend, deltas, None if error else task.result())
+                            self._record(backend, started)
+                        else:
+                            await deltas.aclose()
+                        continue
+                    logger.warning(f"{type(backend).__name__} failed: {str(error)}")
+                    self.latency[id(backend)].observe(self.error_penalty)
+                    await deltas.aclose()
+                    if not hedged and len(ranked) > 1:
+                        hedged = True
+                        start(ranked[1])
+                if winner is None and not streams:
+                    raise error
+        finally:
+            # Cancel the slower request; its backend stops generating when its stream closes.
+            for task, (backend, deltas) in streams.items():
+                self.latency[id(backend)].observe(time.perf_counter() - started)
+                await close(task, deltas)
+
+        backend, deltas, first = winner
+        if hedged:
+            HEDGED_REQUESTS.inc(primary=type(ranked[0]).__name__, winner=type(backend).__name__)
+        async with aclosing(deltas):
+            if first is None:
+                return
+            yield first
+            async for delta in deltas:
+                yield delta
+
+    def _record(self, backend: BaseLLM, started: float):
+        self.latency[id(backend)].observe(time.perf_counter() - started)
+
+    async def function_call(self, function_name: str, function_args: dict) -> str:
+        return await self.ranked()[0].function_call(function_name, function_args)
+
+    def _arun(self, messages: List[ChatMessage]):
+        # Tool calls aren't hedged: running a tool twice could have side effects.
+        return self.ranked()[0]._arun(messages)
+
+    async def _afunction_call(self, function_name: str, function_args: dict) -> str:
+        return await self.ranked()[0]._afunction_call(function_name, function_args)
+
+    async def warmup(self, system_prompt: str, prompt: str = "Hello"):
+        await asyncio.gather(*(backend.warmup(system_prompt, prompt) for backend in self.backends))
+
+    def count_tokens(self, text: str) -> int:
+        return self.backends[0].count_tokens(text)
+
+    def generation_params(self) -> dict:
+        params = [backend.generation_params() for backend in self.backends]
+        temperatures = {param.get("temperature") for param in params}
+        return {
+            "backend": type(self).__name__,
+            "model": params,
+            # Cacheable only if every backend it may route to is.
+            "temperature": temperatures.pop() if len(temperatures) == 1 else None,
+        }
@@ -0,0 +1,130 @@
+import asyncio
+from typing import Callable, List, Optional, Sequence
+
+
+def truncate_at_stop(text: str, stop: Sequence[str]) -> str:
+    """Cut `text` at the earliest stop sequence, if any."""
+    hits = [text.find(s) for s in stop if s and s in text]
+    return text[:min(hits)] if hits else text
+
+
+class StopSequenceFilter:
+    """
+    Removes stop sequences from streamed text. Text that could be the start
+    of a stop sequence is held back until the next delta shows whether it is.
+    """
+
+    def __init__(self, stop: Sequence[str]):
+        self.stop = [s for s in stop if s]
+        self.pending = ""
+        self.stopped = False
+
+    def feed(self, text: str) -> str:
+        if self.stopped:
+            return ""
+        text = self.pending + text
+        if any(s in text for s in self.stop):
+            self.stopped = True
+            self.pending = ""
+            return truncate_at_stop(text, self.stop)
+        hold = 0
+        for s in self.stop:
+            for k in range(min(len(s) - 1, len(text)), hold, -1):
+                if text.endswith(s[:k]):
+                    hold = k
+                    break
+        self.pending = text[len(text) - hold:] if hold else ""
+        return text[:len(text) - hold]
+
+    def flush(self) -> str:
+        text, self.pending = self.pending, ""
+        return text
+
+
+class IncrementalDecoder:
+    """
+    Turns token ids into text deltas as they are generated.
+
+    Each step decodes only a short window: the tokens since the last emitted
+    delta plus the ones before them, which tokenizers need to get word
+    spacing right. A delta ending in an incomplete UTF-8 sequence is held
+    back until the rest of the character arrives.
+    """
+
+    def __init__(self, decode: Callable[[List[int]], str]):
+        self.decode = decode
+        self.ids: List[int] = []
+        self.prefix_offset = 0
+        self.read_offset = 0
+
+    def push(self, ids: List[int]) -> str:
+        self.ids.extend(ids)
+        prefix_text = self.decode(self.ids[self.prefix_offset:self.read_offset])
+        new_text = self.decode(self.ids[self.prefix_offset:])
+        if len(new_text) > len(prefix_text) and not new_text.endswith("\ufffd"):
+            self.prefix_offset, self.read_offset = self.read_offset, len(self.ids)
+            return new_text[len(prefix_text):]
+        return ""
+
+
+class TokenStreamer:
+    """
+    A `streamer` for transformers' generate() that hands decoded deltas to
+    an asyncio consumer.
+
+    generate() calls `put` and `end` from the worker thread running it; the
+    deltas cross to the event loop with call_soon_threadsafe and are read
+    with `async for`. The first `put` is the prompt and is skipped. Output
+    is cut at the first stop sequence and `on_stop` is called, so the
+    generation can be stopped too.
+    """
+
+    def __init__(
+        self,
+        decode: Callable[[List[int]], str],
+        stop: Sequence[str] = (),
+        on_stop: Optional[Callable[[], None]] = None,
+    ):
+        self.decoder = IncrementalDecoder(decode)
+        self.filter = StopSequenceFilter(stop)
+        self.on_stop = on_stop
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._prompt_skipped = False
+        self._started = False
+
+    def put(self, value):
+        if not self._prompt_skipped:
+            self._prompt_skipped = True
+            return
+        ids = value.reshape(-1).tolist() if hasattr(value, "reshape") else list(value)
+        self._emit(self.filter.feed(self.decoder.push(ids)))
+        if self.filter.stopped and self.on_stop is not None:
+            self.on_stop()
+
+    def end(self):
+        self._emit(self.filter.flush())
+        self.close()
+
+    def close(self):
+        """Stop iteration; safe to call from any thread, and more than once."""
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
+
+    def _emit(self, text: str):
+        if not self._started:
+            # Match the non-streamed reply, which is stripped.
+            text = text.lstrip()
+            self._started = bool(text)
+        if text:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, text)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        text = await self._queue.get()
+        if text is None:
+            # Leave the sentinel for any later reader.
+            self._queue.put_nowait(None)
+            raise StopAsyncIteration
+        return text
@@ -0,0 +1,77 @@
+"""
+Module for testing the micro-batching scheduler
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from cognition.llms.batching import BatchScheduler
+
+
+def test_concurrent_requests_share_a_batch():
+    batches = []
+
+    def run_batch(items):
+        batches.append(list(items))
+        return [item.upper() for item in items]
+
+    async def main():
+        scheduler = BatchScheduler(run_batch, max_batch_size=4, max_wait=0.05)
+        results = await asyncio.gather(*(scheduler.submit(f"p{i}") for i in range(6)))
+        await scheduler.aclose()
+        return results
+
+    results = asyncio.run(main())
+    assert results == [f"P{i}" for i in range(6)]
+    assert [len(batch) for batch in batches] == [4, 2]
+
+
+def test_single_request_waits_at_most_max_wait():
+    async def main():
+        scheduler = BatchScheduler(lambda items: items, max_batch_size=8, max_wait=0.05)
+        start = time.perf_counter()
+        result = await scheduler.submit("only")
+        await scheduler.aclose()
+        return result, time.perf_counter() - start
+
+    result, elapsed = asyncio.run(main())
+    assert result == "only"
+    assert elapsed < 0.5
+
+
+def test_batch_errors_reach_every_caller():
+    def run_batch(items):
+        raise RuntimeError("out of memory")
+
+    async def main():
+        scheduler = BatchScheduler(run_batch, max_batch_size=4, max_wait=0.01)
+        results = await asyncio.gather(scheduler.submit("a"), scheduler.submit("b"), return_exceptions=True)
+        await scheduler.aclose()
+        return results
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_batches_run_on_the_given_executor_without_blocking_the_loop():
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+
+    def run_batch(items):
+        time.sleep(0.2)
+        return [threading.current_thread().name for _ in items]
+
+    async def main():
+        scheduler = BatchScheduler(run_batch, max_wait=0.01, executor=executor)
+        generation = asyncio.ensure_future(scheduler.submit("a"))
+        ticks = 0
+        while not generation.done():
+            await asyncio.sleep(0.01)
+            ticks += 1
+        await scheduler.aclose()
+        return generation.result(), ticks
+
+    thread_name, ticks = asyncio.run(main())
+    executor.shutdown()
+    assert thread_name.startswith("inference")
+    assert ticks >= 10
@@ -0,0 +1,38 @@
+"""
+Module for testing incremental JSON parsing and the schema check used by JSON-mode generation
+"""
+
+from cognition.llms.json_stream import IncrementalJSONParser, schema_errors
+
+
+def test_parser_completes_across_fragments():
+    parser = IncrementalJSONParser()
+    assert not parser.feed('{"a": "}{", "b"')
+    assert parser.depth == 1
+    assert parser.feed(': [1, {"c": "\\""}]}')
+    assert parser.value() == {"a": "}{", "b": [1, {"c": '"'}]}
+
+
+def test_parser_flags_malformed_output_early():
+    prose = IncrementalJSONParser()
+    prose.feed("Sure! Here is")
+    assert prose.error and not prose.complete
+
+    mismatched = IncrementalJSONParser()
+    mismatched.feed('{"a": [1}')
+    assert mismatched.error == "unexpected '}'"
+
+    runaway = IncrementalJSONParser()
+    runaway.feed('{"a": 1' + "\n" * 200)
+    assert runaway.error == "runaway whitespace"
+
+
+def test_schema_errors():
+    schema = {
+        "type": "object",
+        "required": ["name", "tags"],
+        "properties": {"name": {"type": "string"}, "tags": {"type": "array", "items": {"type": "string"}}},
+    }
+    assert schema_errors({"name": "a", "tags": ["x"]}, schema) == []
+    assert schema_errors({"name": 1, "tags": ["x", 2]}, schema) == ["$.name should be string", "$.tags[1] should be string"]
+    assert schema_errors({"name": "a"}, schema) == ["$.tags is missing"]
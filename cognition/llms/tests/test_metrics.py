@@ -0,0 +1,47 @@
+"""
+Module for testing the Prometheus metrics registry and LLM call tracking
+"""
+
+import pytest
+from cognition.llms import metrics
+
+
+def test_render_uses_prometheus_text_format():
+    registry = metrics.MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests.", ("endpoint",))
+    latency = registry.histogram("latency_seconds", "Latency.", ("endpoint",), buckets=(0.1, 1.0))
+    requests.inc(endpoint="/chat")
+    requests.inc(2, endpoint="/chat")
+    latency.observe(0.5, endpoint="/chat")
+    latency.observe(5.0, endpoint="/chat")
+
+    lines = registry.render().splitlines()
+    assert "# TYPE requests_total counter" in lines
+    assert 'requests_total{endpoint="/chat"} 3.0' in lines
+    assert 'latency_seconds_bucket{endpoint="/chat",le="0.1"} 0' in lines
+    assert 'latency_seconds_bucket{endpoint="/chat",le="1.0"} 1' in lines
+    assert 'latency_seconds_bucket{endpoint="/chat",le="+Inf"} 2' in lines
+    assert 'latency_seconds_count{endpoint="/chat"} 2' in lines
+    assert latency.mean(endpoint="/chat") == 2.75
+
+
+def test_registering_a_name_twice_returns_the_same_metric():
+    registry = metrics.MetricsRegistry()
+    assert registry.gauge("depth", "Depth.") is registry.gauge("depth", "Depth.")
+
+
+def test_track_llm_records_latency_ttft_tokens_and_errors():
+    with metrics.track_llm("TrackedModel", "stream") as call:
+        call.delta()
+        call.delta(2)
+    with pytest.raises(RuntimeError):
+        with metrics.track_llm("TrackedModel", "generate"):
+            raise RuntimeError("backend down")
+
+    assert metrics.LLM_REQUEST_SECONDS.count(backend="TrackedModel", method="stream") == 1
+    assert metrics.LLM_TIME_TO_FIRST_TOKEN_SECONDS.count(backend="TrackedModel") == 1
+    assert metrics.LLM_OUTPUT_TOKENS.get(backend="TrackedModel") == 3
+    assert metrics.LLM_ERRORS.get(backend="TrackedModel", method="generate") == 1
+    report = metrics.summary()
+    assert report["TrackedModel.stream"]["calls"] == 1
+    assert report["TrackedModel.generate"]["errors"] == 1
@@ -0,0 +1,89 @@
+"""
+Module for testing the payloads OllamaModel sends, against a local stub of Ollama's HTTP API
+"""
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from cognition.llms.ollama import OllamaModel
+from cognition.models.chat_models import ChatMessage
+
+
+class StubOllama(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        StubOllama.requests.append(payload)
+        if payload.get("stream"):
+            chunks = [{"response": word, "done": False} for word in ["Ahoy", " there"]]
+            chunks.append({"response": "", "done": True, "context": [1, 2, 3]})
+        else:
+            chunks = [{"response": "Ahoy there", "done": True, "context": [1, 2, 3]}]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write((json.dumps(chunk) + "\n").encode())
+
+    def log_message(self, *args):
+        pass
+
+
+def run_with_stub(coroutine_factory, **options):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllama)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        model = OllamaModel(model="stub", base_url=f"http://127.0.0.1:{server.server_port}", keep_alive=-1, **options)
+        return asyncio.run(coroutine_factory(model))
+    finally:
+        server.shutdown()
+
+
+MESSAGES = [ChatMessage(role="system", content="You are a pirate"), ChatMessage(role="user", content="hi")]
+
+
+def test_generate_and_stream_send_keep_alive():
+    async def main(model):
+        await model.generate(MESSAGES)
+        return [delta async for delta in model.stream(MESSAGES)]
+
+    StubOllama.requests.clear()
+    assert run_with_stub(main) == ["Ahoy", " there"]
+    assert [payload.get("keep_alive") for payload in StubOllama.requests] == [-1, -1]
+
+
+def test_next_turn_sends_only_new_lines_with_the_session_context():
+    async def main(model):
+        await model.generate(MESSAGES, session_id="a")
+        turn = MESSAGES + [ChatMessage(role="assistant", content="Ahoy there"), ChatMessage(role="user", content="bye")]
+        return [delta async for delta in model.stream(turn, session_id="a")]
+
+    StubOllama.requests.clear()
+    assert run_with_stub(main, prompt_cache_tokens=100) == ["Ahoy", " there"]
+    first, second = StubOllama.requests
+    assert "context" not in first and first["prompt"] == "system: You are a pirate\nuser: hi"
+    assert second["context"] == [1, 2, 3] and second["prompt"] == "user: bye"
+
+
+def test_aclose_closes_the_loops_client_and_closed_loops_are_forgotten():
+    async def use_and_close(model):
+        await model.generate(MESSAGES)
+        client = model._http_client()
+        await model.aclose()
+        return client, model
+
+    client, model = run_with_stub(use_and_close)
+    assert client.is_closed and len(model._clients) == 0
+
+    def twice(model):
+        for _ in range(2):
+            # Each run gets a new loop; the second drops the first, closed one.
+            asyncio.run(model.generate(MESSAGES))
+        return model
+
+    async def main(model):
+        return await asyncio.to_thread(twice, model)
+
+    assert len(run_with_stub(main)._clients) == 1
@@ -0,0 +1,123 @@
+"""
+Module for testing OllamaChatModel against a local stub of Ollama's HTTP API
+"""
+
+import asyncio
+import json
+import threading
+import httpx
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from cognition.llms.ollama_chat import OllamaChatModel, OllamaError
+from cognition.llms.tool_calls import ToolCallDelta
+from cognition.models.chat_models import ChatMessage
+
+STATS = {
+    "done": True,
+    "total_duration": 2_000_000_000,
+    "load_duration": 500_000_000,
+    "prompt_eval_count": 20,
+    "prompt_eval_duration": 250_000_000,
+    "eval_count": 3,
+    "eval_duration": 1_500_000_000,
+}
+
+
+class StubOllama(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        StubOllama.requests.append(payload)
+        last = payload["messages"][-1]["content"]
+        if last == "fail":
+            chunks = [{"error": "model not found"}]
+        elif last == "cut off":
+            chunks = [{"message": {"role": "assistant", "content": "Ah"}, "done": False}]
+        elif last == "use tools":
+            chunks = [
+                {"message": {"role": "assistant", "content": "", "tool_calls": [
+                    {"function": {"name": "lookup", "arguments": {"key": "a"}}},
+                    {"function": {"name": "lookup", "arguments": {"key": "b"}}},
+                ]}, "done": False},
+                dict(STATS, message={"role": "assistant", "content": ""}),
+            ]
+        elif payload["stream"]:
+            chunks = [{"message": {"role": "assistant", "content": word}, "done": False} for word in ["Ahoy", " there", "!"]]
+            chunks.append(dict(STATS, message={"role": "assistant", "content": ""}))
+        else:
+            chunks = [dict(STATS, message={"role": "assistant", "content": "Ahoy there!"})]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write((json.dumps(chunk) + "\n").encode())
+            self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+def run_with_stub(coroutine_factory, **options):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllama)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        model = OllamaChatModel(
+            model="stub", base_url=f"http://127.0.0.1:{server.server_port}", keep_alive=-1, num_ctx=8192, **options)
+        return asyncio.run(coroutine_factory(model)), model
+    finally:
+        server.shutdown()
+
+
+MESSAGES = [ChatMessage(role="system", content="You are a pirate"), ChatMessage(role="user", content="hi")]
+
+
+def test_stream_sends_chat_payload_and_records_timings():
+    async def main(model):
+        return [delta async for delta in model.stream(MESSAGES)]
+
+    deltas, model = run_with_stub(main)
+    assert deltas == ["Ahoy", " there", "!"]
+    payload = StubOllama.requests[-1]
+    assert payload["messages"] == [{"role": "system", "content": "You are a pirate"}, {"role": "user", "content": "hi"}]
+    assert payload["keep_alive"] == -1 and payload["options"]["num_ctx"] == 8192
+    assert model.last_timings.prompt_eval_count == 20
+    assert model.last_timings.eval_tokens_per_second == 2.0
+
+
+def test_generate_and_errors():
+    async def main(model):
+        reply = await model.generate(MESSAGES)
+        try:
+            await model.generate([ChatMessage(role="user", content="fail")])
+        except OllamaError as e:
+            return reply, str(e)
+
+    (reply, error), _ = run_with_stub(main)
+    assert reply == "Ahoy there!"
+    assert error == "model not found"
+
+
+def test_tool_calls_are_streamed_as_deltas():
+    async def main(model):
+        return [event async for event in model._arun([ChatMessage(role="user", content="use tools")])]
+
+    events, _ = run_with_stub(main)
+    assert all(isinstance(event, ToolCallDelta) for event in events)
+    assert [(event.index, event.name, json.loads(event.arguments)) for event in events] == [
+        (0, "lookup", {"key": "a"}), (1, "lookup", {"key": "b"})]
+
+
+def test_warmup_without_final_stats_and_injected_client_is_left_open():
+    client = httpx.AsyncClient()
+
+    async def main(model):
+        await model.warmup("You are a pirate", "cut off")
+        await model.aclose()
+        closed = client.is_closed
+        await client.aclose()
+        return closed
+
+    closed, model = run_with_stub(main, client=client)
+    assert model.last_timings is None
+    assert not closed
@@ -0,0 +1,28 @@
+"""
+Module for testing OpenAIModel's token counting and warm-up
+"""
+
+import asyncio
+from cognition.llms import openai as openai_backend
+from cognition.llms.tokenizer import TokenizerService
+
+
+def test_count_tokens_uses_the_models_tokenizer(monkeypatch):
+    requested = []
+
+    def get_tokenizer(model, path=None):
+        requested.append(model)
+        # Two tokens per character: nothing like a word count.
+        return TokenizerService("fake", encode=lambda text: list(text * 2), decode="".join)
+
+    monkeypatch.setattr(openai_backend, "get_tokenizer", get_tokenizer)
+    model = openai_backend.OpenAIModel(model="gpt-4o-mini", client=object())
+    assert requested == ["gpt-4o-mini"]
+    assert model.count_tokens("hi there") == 16
+
+
+def test_warmup_makes_no_paid_call(monkeypatch):
+    monkeypatch.setattr(openai_backend, "get_tokenizer", lambda model, path=None: None)
+    # Any request through this client would raise.
+    model = openai_backend.OpenAIModel(model="gpt-4o-mini", client=object())
+    asyncio.run(model.warmup("You are a pirate"))
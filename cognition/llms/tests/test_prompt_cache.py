@@ -0,0 +1,45 @@
+"""
+Module for testing the per-session and shared-prefix prompt state caches
+"""
+
+from cognition.llms.prompt_cache import PrefixCache, PromptStateCache, common_prefix_length
+
+
+def test_common_prefix_length():
+    assert common_prefix_length([1, 2, 3], [1, 2, 4, 5]) == 2
+    assert common_prefix_length([1, 2], [1, 2, 3]) == 2
+    assert common_prefix_length([], [1]) == 0
+
+
+def test_evicts_least_recently_used_sessions_by_tokens():
+    cache = PromptStateCache(max_tokens=10)
+    cache.put("a", "state a", 4)
+    cache.put("b", "state b", 4)
+    # Taking a state out and putting it back marks it as recently used.
+    cache.put("a", cache.pop("a"), 5)
+    cache.put("c", "state c", 3)
+    assert cache.sessions() == ["a", "c"]
+    assert cache.tokens == 8
+
+
+def test_pop_removes_state_while_in_use():
+    cache = PromptStateCache(max_tokens=10)
+    cache.put("a", "state a", 4)
+    assert cache.pop("a") == "state a"
+    assert cache.pop("a") is None
+    assert cache.tokens == 0
+    cache.put(None, "anonymous", 1)
+    cache.put("big", "too big", 11)
+    assert len(cache) == 0
+
+
+def test_prefix_cache_is_keyed_by_prefix_content():
+    cache = PrefixCache(max_entries=2)
+    cache.put([1, 2, 3], "persona v1")
+    assert cache.get((1, 2, 3)) == "persona v1"
+    # An edited persona tokenizes differently and misses; old entries age out.
+    assert cache.get([1, 2, 4]) is None
+    cache.put([1, 2, 4], "persona v2")
+    cache.put([5], "other persona")
+    assert cache.get([1, 2, 3]) is None
+    assert len(cache) == 2
@@ -0,0 +1,20 @@
+"""
+Module for testing how the backend registry configures the huggingface backend
+"""
+
+import pytest
+import settings
+from cognition.llms.registry import LLMRegistry
+
+
+def test_huggingface_loads_a_repo_id_or_directory_named_by_the_model(tmp_path):
+    assert LLMRegistry._hf_model_path("meta-llama/Meta-Llama-3.1-8B-Instruct") == "meta-llama/Meta-Llama-3.1-8B-Instruct"
+    assert LLMRegistry._hf_model_path(str(tmp_path)) == str(tmp_path)
+
+
+def test_huggingface_falls_back_to_its_own_setting_or_fails_clearly(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "HF_MODEL_PATH", str(tmp_path))
+    assert LLMRegistry._hf_model_path("llama3.1") == str(tmp_path)
+    monkeypatch.setattr(settings, "HF_MODEL_PATH", None)
+    with pytest.raises(ValueError, match="HF_MODEL_PATH"):
+        LLMRegistry().get("huggingface", "llama3.1")
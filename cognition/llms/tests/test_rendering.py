@@ -0,0 +1,67 @@
+"""
+Module for testing per-message render caching
+"""
+
+from cognition.llms.rendering import ChatTemplateSegments, MessageCache
+from cognition.models.chat_models import ChatMessage
+
+
+class Llama3StyleTokenizer:
+    """Mimics a Llama 3.1 chat template: BOS, then a system block that is always present."""
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=False):
+        text = "<bos>"
+        if messages and messages[0]["role"] == "system":
+            system, messages = messages[0]["content"], messages[1:]
+        else:
+            system = ""
+        text += f"<h>system</h>Today Date: 26 Jul 2024\n{system}<eot>"
+        for message in messages:
+            text += f"<h>{message['role']}</h>{message['content']}<eot>"
+        if add_generation_prompt:
+            text += "<h>assistant</h>"
+        return text
+
+    def encode(self, text, add_special_tokens=True):
+        return [ord(c) for c in text]
+
+
+class ContextDependentTokenizer(Llama3StyleTokenizer):
+    """Numbers each turn, so a message's rendering depends on its position."""
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=False):
+        return "".join(f"[{i}]{m['content']}" for i, m in enumerate(messages))
+
+
+def conversation():
+    return [
+        ChatMessage(role="system", content="you are k3nn"),
+        ChatMessage(role="user", content="hi"),
+        ChatMessage(role="assistant", content="hello"),
+        ChatMessage(role="user", content="how are you?"),
+    ]
+
+
+def test_message_cache_only_renders_new_messages():
+    calls = []
+    cache = MessageCache(lambda msg: calls.append(msg) or msg.content.upper())
+    messages = conversation()
+    assert cache.map(messages) == ["YOU ARE K3NN", "HI", "HELLO", "HOW ARE YOU?"]
+    messages.append(ChatMessage(role="assistant", content="fine"))
+    assert cache.map(messages)[-1] == "FINE"
+    assert len(calls) == len(messages)
+
+
+def test_template_segments_match_full_render():
+    tokenizer = Llama3StyleTokenizer()
+    segments = ChatTemplateSegments(tokenizer)
+    assert segments.supported
+    for messages in (conversation(), conversation()[1:]):
+        pieces = [segments.render_first(messages[0])] + [segments.render(msg) for msg in messages[1:]]
+        expected = tokenizer.apply_chat_template(
+            [{"role": m.role, "content": m.content} for m in messages], add_generation_prompt=True)
+        assert "".join(pieces) + segments.generation_prompt() == expected
+
+
+def test_context_dependent_templates_are_not_split():
+    assert not ChatTemplateSegments(ContextDependentTokenizer()).supported
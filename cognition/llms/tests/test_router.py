@@ -0,0 +1,112 @@
+"""
+Module for testing hedged requests and latency-based ranking in RoutingModel
+"""
+
+import asyncio
+import time
+from typing import List
+from cognition.llms.base_llm import BaseLLM
+from cognition.llms.router import RoutingModel
+from cognition.models.chat_models import ChatMessage
+
+MESSAGES = [ChatMessage(role="user", content="hi")]
+
+
+class DelayedModel(BaseLLM):
+    def __init__(self, name: str, delay: float, fail: bool = False, tail: float = 0.0):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        # Time between the first token and the rest of the reply.
+        self.tail = tail
+        self.closed = False
+
+    async def generate(self, messages: List[ChatMessage], session_id=None) -> str:
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError(f"{self.name} is down")
+        return self.name
+
+    async def stream(self, messages: List[ChatMessage], session_id=None):
+        try:
+            yield await self.generate(messages)
+            await asyncio.sleep(self.tail)
+            yield " done"
+        finally:
+            self.closed = True
+
+    async def function_call(self, function_name: str, function_args: dict) -> str:
+        raise NotImplementedError
+
+
+def test_stream_hedges_to_secondary_and_cancels_primary():
+    primary, secondary = DelayedModel("primary", 1.0), DelayedModel("secondary", 0.05)
+    router = RoutingModel([primary, secondary], hedge_after=0.1)
+
+    async def main():
+        start = time.perf_counter()
+        deltas = [delta async for delta in router.stream(MESSAGES)]
+        return deltas, time.perf_counter() - start
+
+    deltas, elapsed = asyncio.run(main())
+    assert deltas == ["secondary", " done"]
+    assert elapsed < 0.5
+    assert primary.closed
+
+
+def test_fast_primary_is_not_hedged():
+    primary, secondary = DelayedModel("primary", 0.01), DelayedModel("secondary", 0.01)
+    router = RoutingModel([primary, secondary], hedge_after=0.5)
+    assert asyncio.run(router.generate(MESSAGES)) == "primary done"
+    assert not router.latency[id(secondary)].samples
+
+
+def test_generate_hedges_on_first_token_not_full_reply():
+    primary, secondary = DelayedModel("primary", 0.01, tail=0.3), DelayedModel("secondary", 0.01)
+    router = RoutingModel([primary, secondary], hedge_after=0.1)
+    assert asyncio.run(router.generate(MESSAGES)) == "primary done"
+    assert not router.latency[id(secondary)].samples
+    assert max(router.latency[id(primary)].samples) < 0.1
+
+
+def test_failed_primary_fails_over_without_waiting_for_deadline():
+    router = RoutingModel([DelayedModel("primary", 0.0, fail=True), DelayedModel("secondary", 0.01)], hedge_after=5.0)
+    start = time.perf_counter()
+    assert asyncio.run(router.generate(MESSAGES)) == "secondary done"
+    assert time.perf_counter() - start < 1.0
+
+
+def test_slow_primary_is_demoted_by_latency_percentile():
+    primary, secondary = DelayedModel("primary", 0.2), DelayedModel("secondary", 0.01)
+    router = RoutingModel([primary, secondary], hedge_after=0.05, min_samples=3)
+
+    async def main():
+        for _ in range(3):
+            await router.generate(MESSAGES)
+
+    asyncio.run(main())
+    assert router.ranked() == [secondary, primary]
+
+
+def test_fast_primary_stays_first_while_the_backup_is_unsampled():
+    primary, secondary = DelayedModel("primary", 0.01), DelayedModel("secondary", 0.01)
+    router = RoutingModel([primary, secondary], hedge_after=0.5, min_samples=5)
+
+    async def main():
+        for _ in range(5):
+            await router.generate(MESSAGES)
+
+    asyncio.run(main())
+    assert len(router.latency[id(primary)].samples) == 5
+    assert router.ranked() == [primary, secondary]
+
+
+def test_hedge_goes_to_the_next_ranked_backend():
+    demoted, primary, backup = DelayedModel("demoted", 0.01), DelayedModel("primary", 0.3), DelayedModel("backup", 0.01)
+    router = RoutingModel([demoted, primary, backup], hedge_after=0.05, min_samples=1)
+    for backend, seconds in [(demoted, 1.0), (primary, 0.01), (backup, 0.1)]:
+        router.latency[id(backend)].observe(seconds)
+    assert router.ranked() == [primary, backup, demoted]
+    # The primary stalls; the hedge goes to the backup, not to the configured second backend.
+    assert asyncio.run(router.generate(MESSAGES)) == "backup done"
+    assert list(router.latency[id(demoted)].samples) == [1.0]
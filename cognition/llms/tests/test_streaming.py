@@ -0,0 +1,50 @@
+"""
+Module for testing incremental decoding, stop sequences and the threaded token streamer
+"""
+
+import asyncio
+import threading
+from cognition.llms.streaming import IncrementalDecoder, StopSequenceFilter, TokenStreamer
+
+
+def decode_bytes(ids):
+    return bytes(ids).decode("utf-8", errors="replace")
+
+
+def test_decoder_holds_back_partial_characters():
+    decoder = IncrementalDecoder(decode_bytes)
+    deltas = [decoder.push([b]) for b in "héllo".encode()]
+    assert deltas == ["h", "", "é", "l", "l", "o"]
+
+
+def test_stop_filter_holds_back_possible_stop_prefix():
+    stop = StopSequenceFilter(["\nuser:"])
+    assert stop.feed("Paris is nice.\n") == "Paris is nice."
+    assert stop.feed("use") == ""
+    assert stop.feed("d to be") == "\nused to be"
+    assert stop.feed(" big.\nuser: and") == " big."
+    assert stop.stopped and stop.feed("more") == ""
+
+
+def test_streamer_delivers_deltas_from_generation_thread():
+    async def main():
+        stopped = threading.Event()
+        streamer = TokenStreamer(decode_bytes, stop=["STOP"], on_stop=stopped.set)
+
+        def generate():
+            streamer.put([1, 2, 3])  # the prompt
+            for b in b"  Hi there STOP ignored":
+                if stopped.is_set():
+                    break
+                streamer.put([b])
+            streamer.end()
+
+        thread = threading.Thread(target=generate)
+        thread.start()
+        deltas = [delta async for delta in streamer]
+        thread.join()
+        return deltas, stopped.is_set()
+
+    deltas, stopped = asyncio.run(main())
+    assert "".join(deltas) == "Hi there "
+    assert stopped
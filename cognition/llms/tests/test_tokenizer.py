@@ -0,0 +1,48 @@
+"""
+Module for testing the cached tokenizer service and incremental token counting
+"""
+
+import random
+from cognition.llms.tokenizer import TokenizerService, WORD
+
+TEXT = "Hello there, world. This is a test!  Double  spaced\n\nparagraph. Unicode: héllo wörld ok. " * 5
+
+
+def counting_service():
+    calls = []
+
+    def encode(text):
+        calls.append(text)
+        return WORD.findall(text)
+
+    return TokenizerService("words", encode=encode, decode="".join), calls
+
+
+def test_counts_are_memoized_by_content():
+    tokens, calls = counting_service()
+    assert tokens.count(TEXT) == tokens.count(TEXT) == len(TEXT.split())
+    assert len(calls) == 1
+    assert tokens.count_batch(["a b", TEXT, "a b c"]) == [2, len(TEXT.split()), 3]
+    assert calls[1:] == ["a b", "a b c"]
+
+
+def test_incremental_count_matches_full_count():
+    tokens, calls = counting_service()
+    counter = tokens.incremental()
+    rng = random.Random(0)
+    i = 0
+    while i < len(TEXT):
+        j = i + rng.randint(1, 12)
+        counter.append(TEXT[i:j])
+        i = j
+    assert counter.text == TEXT
+    assert counter.count == len(WORD.findall(TEXT))
+    assert counter.peek("more words") == len(WORD.findall(TEXT + "more words"))
+    # Each append only re-tokenizes the text since the last word boundary.
+    assert max(len(text) for text in calls) < 40
+
+
+def test_truncate():
+    tokens, _ = counting_service()
+    assert tokens.truncate("one two three four", 2) == "one two "
+    assert tokens.truncate("one two", 5) == "one two"
@@ -0,0 +1,19 @@
+"""
+Module for testing incremental parsing of streamed tool calls
+"""
+
+from cognition.llms.tool_calls import IncrementalJSONParser, ToolCall, ToolCallDelta
+
+
+def test_parser_completes_when_top_level_object_closes():
+    parser = IncrementalJSONParser()
+    fragments = ['{"query": "cu', 'rly } and { braces', ' \\" quoted"', ', "n": [1, {"a"', ': 2}]', '}']
+    assert [parser.feed(fragment) for fragment in fragments] == [False] * 5 + [True]
+    assert parser.value() == {"query": 'curly } and { braces " quoted', "n": [1, {"a": 2}]}
+
+
+def test_tool_call_needs_name_and_complete_arguments():
+    call = ToolCall(0)
+    assert not call.feed(ToolCallDelta(0, arguments='{"x": 1}'))
+    assert call.feed(ToolCallDelta(0, id="call_1", name="add"))
+    assert call.to_dict() == {"id": "call_1", "type": "function", "function": {"name": "add", "arguments": '{"x": 1}'}}
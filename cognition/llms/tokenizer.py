@@ -0,0 +1,251 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Hugging Face repos whose tokenizer matches an Ollama model, looked up in the local HF cache only.
+OLLAMA_TOKENIZER_REPOS = {
+    "llama3.1": "meta-llama/Llama-3.1-8B-Instruct",
+    "llama3.2": "meta-llama/Llama-3.2-3B-Instruct",
+    "llama3": "meta-llama/Meta-Llama-3-8B-Instruct",
+    "mistral": "mistralai/Mistral-7B-Instruct-v0.3",
+    "qwen2.5": "Qwen/Qwen2.5-7B-Instruct",
+    "gemma2": "google/gemma-2-9b-it",
+}
+
+# A word and the whitespace after it; the offline fallback when no tokenizer can be loaded.
+WORD = re.compile(r"\s*\S+\s*|\s+")
+
+
+class TokenizerService:
+    """
+    Token counting and truncation for one model's tokenizer, with counts
+    memoized by content hash in an LRU.
+
+    `encode`, `decode` and the optional `encode_batch` adapt whatever
+    tokenizer was loaded (tokenizers, transformers or tiktoken), so callers
+    don't depend on which one it was. Hashing keeps the cache small when the
+    counted texts are large, and the lock makes it safe to share between the
+    worker threads of a batch job.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        encode: Callable[[str], Sequence],
+        decode: Callable[[Sequence], str],
+        encode_batch: Optional[Callable[[List[str]], List[Sequence]]] = None,
+        max_entries: int = 65536,
+    ):
+        self.name = name
+        self.encode = encode
+        self.decode = decode
+        self._encode_batch = encode_batch
+        self.max_entries = max_entries
+        self._counts: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    def _get(self, key: bytes) -> Optional[int]:
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+            return count
+
+    def _put(self, key: bytes, count: int):
+        with self._lock:
+            self._counts[key] = count
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+
+    def count(self, text: str) -> int:
+        key = self._key(text)
+        count = self._get(key)
+        if count is None:
+            count = len(self.encode(text))
+            self._put(key, count)
+        return count
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        """Count many texts, tokenizing the uncached ones in one batch call where the tokenizer has one."""
+        keys = [self._key(text) for text in texts]
+        counts = [self._get(key) for key in keys]
+        missing: Dict[bytes, str] = {key: text for key, text, count in zip(keys, texts, counts) if count is None}
+        if missing:
+            pending = list(missing.items())
+            if self._encode_batch is not None:
+                encoded = self._encode_batch([text for _, text in pending])
+            else:
+                encoded = [self.encode(text) for _, text in pending]
+            fresh = {key: len(ids) for (key, _), ids in zip(pending, encoded)}
+            for key, count in fresh.items():
+                self._put(key, count)
+            counts = [fresh[key] if count is None else count for key, count in zip(keys, counts)]
+        return counts
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if self.count(text) <= max_tokens:
+            return text
+        return self.decode(self.encode(text)[:max_tokens])
+
+    def incremental(self, text: str = "") -> "IncrementalCount":
+        counter = IncrementalCount(self)
+        if text:
+            counter.append(text)
+        return counter
+
+
+class IncrementalCount:
+    """
+    Running token count of append-only text.
+
+    Tokenizers that split words at whitespace (regex pre-tokenized BPE,
+    SentencePiece) never merge across the space before a word, so everything
+    before the last word boundary is counted once and only the trailing word
+    is re-tokenized on each append. Appending is proportional to the new
+    text, not to everything counted so far.
+    """
+
+    def __init__(self, tokens: TokenizerService):
+        self.tokens = tokens
+        self._parts: List[str] = []
+        self._committed = 0
+        self._tail = ""
+        self._tail_count = 0
+
+    @staticmethod
+    def _boundary(text: str) -> int:
+        """Index of the whitespace that starts the last word, or 0 if there's none to split at."""
+        for i in range(len(text) - 2, 0, -1):
+            if text[i].isspace() and not text[i - 1].isspace() and not text[i + 1].isspace():
+                return i
+        return 0
+
+    def append(self, text: str) -> int:
+        self._parts.append(text)
+        tail = self._tail + text
+        split = self._boundary(tail)
+        if split:
+            self._committed += len(self.tokens.encode(tail[:split]))
+            tail = tail[split:]
+        self._tail = tail
+        self._tail_count = len(self.tokens.encode(tail)) if tail else 0
+        return self.count
+
+    def peek(self, text: str) -> int:
+        """The count if `text` were appended, without appending it."""
+        return self._committed + len(self.tokens.encode(self._tail + text))
+
+    @property
+    def count(self) -> int:
+        return self._committed + self._tail_count
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+
+def from_transformers(name: str, tokenizer, max_entries: int = 65536) -> TokenizerService:
+    return TokenizerService(
+        name,
+        encode=lambda text: tokenizer.encode(text, add_special_tokens=False),
+        decode=lambda ids: tokenizer.decode(ids, skip_special_tokens=True),
+        encode_batch=lambda texts: tokenizer(texts, add_special_tokens=False)["input_ids"],
+        max_entries=max_entries,
+    )
+
+
+def _from_file(path: str, max_entries: int) -> TokenizerService:
+    """Load from a local tokenizer.json, or a directory of tokenizer files."""
+    tokenizer_json = path if path.endswith(".json") else os.path.join(path, "tokenizer.json")
+    try:
+        from tokenizers import Tokenizer
+    except ImportError:
+        Tokenizer = None
+    if Tokenizer is not None and os.path.isfile(tokenizer_json):
+        tokenizer = Tokenizer.from_file(tokenizer_json)
+        return TokenizerService(
+            path,
+            encode=lambda text: tokenizer.encode(text, add_special_tokens=False).ids,
+            decode=lambda ids: tokenizer.decode(ids),
+            encode_batch=lambda texts: [e.ids for e in tokenizer.encode_batch(texts, add_special_tokens=False)],
+            max_entries=max_entries,
+        )
+    from transformers import AutoTokenizer
+    return from_transformers(path, AutoTokenizer.from_pretrained(os.path.dirname(tokenizer_json), local_files_only=True), max_entries)
+
+
+def _from_hf_cache(repo: str, max_entries: int) -> TokenizerService:
+    from transformers import AutoTokenizer
+    return from_transformers(repo, AutoTokenizer.from_pretrained(repo, local_files_only=True), max_entries)
+
+
+def _from_tiktoken(model: str, max_entries: int) -> TokenizerService:
+    import tiktoken
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    return TokenizerService(
+        encoding.name,
+        encode=lambda text: encoding.encode(text, disallowed_special=()),
+        decode=encoding.decode,
+        encode_batch=lambda texts: encoding.encode_batch(texts, disallowed_special=()),
+        max_entries=max_entries,
+    )
+
+
+def _words(max_entries: int) -> TokenizerService:
+    return TokenizerService("words", encode=WORD.findall, decode="".join, max_entries=max_entries)
+
+
+def load_tokenizer(model: str, path: Optional[str] = None, max_entries: int = 65536) -> TokenizerService:
+    """
+    Load the tokenizer for `model` without touching the network.
+
+    Tries, in order: the local `path`; the model's Hugging Face repo in the
+    local HF cache; tiktoken (exact for OpenAI models, an approximation for
+    others, and only if its BPE file can be loaded); and finally a word count.
+    """
+    base = model.split(":")[0]
+    repo = model if "/" in model else OLLAMA_TOKENIZER_REPOS.get(base)
+    loaders: List[Tuple[str, Callable[[], TokenizerService]]] = []
+    if path:
+        loaders.append((path, lambda: _from_file(path, max_entries)))
+    if repo:
+        loaders.append((repo, lambda: _from_hf_cache(repo, max_entries)))
+    loaders.append(("tiktoken", lambda: _from_tiktoken(model, max_entries)))
+    for source, loader in loaders:
+        try:
+            tokens = loader()
+        except Exception as e:
+            logger.debug(f"No tokenizer for {model} from {source}: {str(e)}")
+            continue
+        logger.info(f"Using tokenizer {tokens.name} for {model}")
+        return tokens
+    logger.warning(f"No tokenizer available for {model}; counting words instead")
+    return _words(max_entries)
+
+
+_services: Dict[Tuple[str, Optional[str]], TokenizerService] = {}
+_services_lock = threading.Lock()
+
+
+def get_tokenizer(model: str, path: Optional[str] = None) -> TokenizerService:
+    """The shared TokenizerService for `model`, loaded on first use."""
+    key = (model, path)
+    with _services_lock:
+        tokens = _services.get(key)
+        if tokens is None:
+            tokens = _services[key] = load_tokenizer(model, path)
+        return tokens
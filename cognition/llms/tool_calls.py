@@ -0,0 +1,49 @@
+from typing import Optional
+from cognition.llms.json_stream import IncrementalJSONParser
+
+
+class ToolCallDelta:
+    """
+    One streamed piece of a tool call, in the shape every backend's `_arun`
+    yields: calls are told apart by `index`, `id` and `name` arrive with the
+    first piece, and `arguments` is the next fragment of the JSON arguments.
+    """
+
+    def __init__(self, index: int, id: Optional[str] = None, name: Optional[str] = None, arguments: str = ""):
+        self.index = index
+        self.id = id
+        self.name = name
+        self.arguments = arguments
+
+
+class ToolCall:
+    """A tool call being assembled from ToolCallDeltas."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.id: Optional[str] = None
+        self.name: Optional[str] = None
+        self.parser = IncrementalJSONParser()
+
+    def feed(self, delta: ToolCallDelta) -> bool:
+        self.id = delta.id or self.id
+        self.name = delta.name or self.name
+        if delta.arguments:
+            self.parser.feed(delta.arguments)
+        return self.complete
+
+    @property
+    def complete(self) -> bool:
+        return self.name is not None and self.parser.complete
+
+    @property
+    def arguments(self) -> str:
+        return self.parser.text
+
+    def to_dict(self) -> dict:
+        """The call in OpenAI's assistant `tool_calls` format."""
+        return {
+            "id": self.id,
+            "type": "function",
+            "function": {"name": self.name, "arguments": self.arguments},
+        }
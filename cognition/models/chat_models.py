@@ -5,6 +5,10 @@ from typing import List, Optional, Union, Tuple
 class ChatMessage(BaseModel):
     role: str
     content: str
+    # Tool calling: set on assistant messages that call tools and on the tool results that answer them.
+    tool_calls: Optional[List[dict]] = None
+    tool_call_id: Optional[str] = None
+    name: Optional[str] = None
 
 # create a chat history object that is a list of chat messages (which are dictionaries of role, content, and tools)
 class ChatHistory(BaseModel):
@@ -4,12 +4,13 @@ import anthropic
 from tools.bing_search import BingSearchAPI
 import json
 import argparse
+from cognition.llms import metrics
 
 load_dotenv()
 client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
 bing_search = BingSearchAPI()
 
-def chat_with_claude(messages):
+def _chat_with_claude(messages):
     response = client.messages.create(
         model="claude-3-5-sonnet-20240620",
         max_tokens=1000,
@@ -41,6 +42,12 @@ def chat_with_claude(messages):
     )
     return response
 
+def chat_with_claude(messages):
+    with metrics.track_llm("Anthropic", "generate") as call:
+        response = _chat_with_claude(messages)
+        call.output(response.usage.output_tokens)
+        return response
+
 def perform_bing_search(query, count=3):
     results = bing_search.search(query, count)
     formatted_results = []
@@ -64,6 +71,7 @@ def main(debug=False):
     while True:
         user_input = input("> ")
         if user_input.lower() == 'exit':
+            print(json.dumps(metrics.summary(), indent=2))
             break
         
         messages.append({"role": "user", "content": user_input})
@@ -4,6 +4,7 @@ import anthropic
 from tools.bing_search import BingSearchAPI
 import json
 import argparse
+from cognition.llms import metrics
 
 load_dotenv()
 client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
@@ -27,6 +28,12 @@ tools = [
     }
 ]
 
+def create_message(**kwargs):
+    with metrics.track_llm("Anthropic", "generate") as call:
+        response = client.messages.create(**kwargs)
+        call.output(response.usage.output_tokens)
+        return response
+
 def perform_bing_search(query, count=3):
     results = bing_search.search(query, count)
     formatted_results = []
@@ -47,7 +54,7 @@ def chatbot_interaction(user_message, debug=False):
         {"role": "user", "content": user_message}
     ]
 
-    response = client.messages.create(
+    response = create_message(
         model=MODEL_NAME,
         max_tokens=1000,
         temperature=0.7,
@@ -91,7 +98,7 @@ def chatbot_interaction(user_message, debug=False):
             },
         ]
 
-        response = client.messages.create(
+        response = create_message(
             model=MODEL_NAME,
             max_tokens=1000,
             temperature=0.7,
@@ -122,6 +129,7 @@ def main(debug=False):
     while True:
         user_input = input("> ")
         if user_input.lower() == 'exit':
+            print(json.dumps(metrics.summary(), indent=2))
             break
         
         response = chatbot_interaction(user_input, debug)
@@ -34,10 +34,13 @@ import re
 import concurrent.futures
 from tqdm import tqdm
 import argparse
+import asyncio
+import threading
 import unittest
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 
 from cognition.llms.ollama import OllamaModel
+from cognition.llms import metrics
 from cognition.models.chat_models import ChatMessage
 
 # Set up logging
@@ -91,6 +94,30 @@ logger = setup_logging()
 MAX_TOKENS = None  # No limit on tokens
 
 
+_thread_state = threading.local()
+
+
+def run(coroutine):
+    """
+    Run an OllamaModel call from this script's sync code. Each worker thread
+    keeps one event loop, so the model's pooled HTTP connections are reused
+    across calls.
+    """
+    loop = getattr(_thread_state, "loop", None)
+    if loop is None:
+        loop = _thread_state.loop = asyncio.new_event_loop()
+    return loop.run_until_complete(coroutine)
+
+
+def close_thread_loop(ollama: OllamaModel):
+    """Close the model's HTTP client on this thread's event loop, then the loop itself."""
+    loop = getattr(_thread_state, "loop", None)
+    if loop is not None:
+        _thread_state.loop = None
+        loop.run_until_complete(ollama.aclose())
+        loop.close()
+
+
 def read_markdown_file(file_path: Path) -> str:
     """Read and parse a markdown file."""
     with open(file_path, 'r', encoding='utf-8') as file:
@@ -135,7 +162,7 @@ def generate_multiple_qa_pairs(
     {content}"""
     
     try:
-        response = ollama.generate_json(prompt)
+        response = run(ollama.generate_json(prompt))
         qa_pairs = []
         for pair in response.get("qa_pairs", []):
             if validate_completion(pair.get("answer")):
@@ -158,14 +185,15 @@ def truncate_to_token_limit(ollama: OllamaModel, text: str, max_tokens: int = No
         return text
 
     sentences = re.split(r'(?<=[.!?])\s+', text)
-    truncated_text = ""
+    # Counted incrementally, so each sentence is tokenized once rather than the whole prefix again.
+    truncated = ollama.tokenizer.incremental()
     
     for sentence in sentences:
-        if ollama.count_tokens(truncated_text + sentence) > max_tokens:
+        if truncated.peek(sentence) > max_tokens:
             break
-        truncated_text += sentence + " "
+        truncated.append(sentence + " ")
     
-    return truncated_text.strip()
+    return truncated.text.strip()
 
 
 def chunk_text(ollama: OllamaModel, text: str, max_tokens: int = None) -> List[str]:
@@ -174,21 +202,21 @@ def chunk_text(ollama: OllamaModel, text: str, max_tokens: int = None) -> List[s
         return [text]  # Return the entire text as a single chunk
 
     chunks = []
-    current_chunk = ""
+    current_chunk = ollama.tokenizer.incremental()
     sentences = re.split(r'(?<=[.!?])\s+', text)
 
     for sentence in sentences:
-        if ollama.count_tokens(current_chunk + sentence) > max_tokens:
-            if current_chunk:
-                chunks.append(current_chunk.strip())
-                current_chunk = sentence + " "
+        if current_chunk.peek(sentence) > max_tokens:
+            if current_chunk.text:
+                chunks.append(current_chunk.text.strip())
+                current_chunk = ollama.tokenizer.incremental(sentence + " ")
             else:
                 chunks.append(ollama.truncate_to_token_limit(sentence, max_tokens))
         else:
-            current_chunk += sentence + " "
+            current_chunk.append(sentence + " ")
 
-    if current_chunk:
-        chunks.append(current_chunk.strip())
+    if current_chunk.text:
+        chunks.append(current_chunk.text.strip())
 
     return chunks
 
@@ -200,7 +228,7 @@ def generate_blog_prompt(ollama: OllamaModel, title: str, content: str) -> Dict[
         ChatMessage(role="system", content="Generate a brief description for a blog post. Respond with only the description, without any additional text."),
         ChatMessage(role="user", content=f"Generate a description for a blog post titled '{title}'.")
     ]
-    description = ollama.generate(messages)
+    description = run(ollama.generate(messages))
     prompt = f"Generate a blog post about '{title}'. Description: {description}"
     completion = content  # No truncation
     return {"prompt": prompt, "completion": completion}
@@ -214,7 +242,7 @@ def summarize_and_expand(ollama: OllamaModel, content: str, title: str) -> Dict[
         ChatMessage(role="system", content="Summarize the given blog post in a single paragraph. Respond with only the summary, without any additional text."),
         ChatMessage(role="user", content=f"Summarize this blog post about '{title}':\n\n{truncated_content}")
     ]
-    summary = ollama.generate(messages)
+    summary = run(ollama.generate(messages))
     return {"prompt": f"Expand on this summary of '{title}': {summary}", "completion": content}
 
 
@@ -238,7 +266,7 @@ def generate_interesting_questions(
     Blog post content:
     {content}"""
     
-    response = ollama.generate_json(prompt)
+    response = run(ollama.generate_json(prompt))
     return response.get("questions", [])
 
 
@@ -255,7 +283,7 @@ def answer_interesting_question(
         ChatMessage(role="system", content="Answer the given question based on the context provided from the blog post. Respond with only the answer, without any additional text."),
         ChatMessage(role="user", content=f"Question: {question}\n\nContext from the blog post '{title}':\n\n{truncated_content}")
     ]
-    answer = ollama.generate(messages)
+    answer = run(ollama.generate(messages))
     return {"prompt": question, "completion": answer}
 
 
@@ -267,7 +295,7 @@ def analyze_writing_style(ollama: OllamaModel, content: str, title: str) -> str:
         ChatMessage(role="system", content="Analyze the writing style of the given blog post. Describe the style concisely without any additional text."),
         ChatMessage(role="user", content=f"Analyze the writing style of this blog post about '{title}':\n\n{truncated_content}")
     ]
-    return ollama.generate(messages)
+    return run(ollama.generate(messages))
 
 
 def extract_key_points(
@@ -291,7 +319,7 @@ def extract_key_points(
     Blog post content:
     {truncated_content}"""
     
-    response = ollama.generate_json(prompt)
+    response = run(ollama.generate_json(prompt))
     return response.get("key_points", [])
 
 
@@ -318,7 +346,7 @@ def generate_summary(ollama: OllamaModel, content: str, title: str) -> Dict[str,
         ChatMessage(role="user", content=f"{prompt}\n\n{content}")
     ]
     try:
-        summary = ollama.generate(messages)
+        summary = run(ollama.generate(messages))
         return {"prompt": prompt, "completion": summary}
     except Exception as e:
         logger.error(f"Error generating summary for '{title}': {str(e)}")
@@ -334,7 +362,7 @@ def generate_style_transfer(ollama: OllamaModel, content: str, title: str) -> Di
         ChatMessage(role="system", content="You are a helpful assistant that can rewrite text in different styles."),
         ChatMessage(role="user", content=f"{prompt}\n\n{content}")
     ]
-    rewrite = ollama.generate(messages)
+    rewrite = run(ollama.generate(messages))
     return {"prompt": prompt, "completion": rewrite}
 
 
@@ -345,14 +373,14 @@ def generate_domain_specific_question(ollama: OllamaModel, content: str, title:
         ChatMessage(role="system", content="You are a helpful assistant that generates domain-specific questions."),
         ChatMessage(role="user", content=f"{question_prompt}\n\n{content}")
     ]
-    question = ollama.generate(question_messages)
+    question = run(ollama.generate(question_messages))
     
     answer_prompt = f"Answer the following question based on the blog post about '{title}':\n{question}"
     answer_messages = [
         ChatMessage(role="system", content="You are a helpful assistant that answers questions based on given content."),
         ChatMessage(role="user", content=f"{answer_prompt}\n\nContent:\n{content}")
     ]
-    answer = ollama.generate(answer_messages)
+    answer = run(ollama.generate(answer_messages))
     
     return {"prompt": question, "completion": answer}
 
@@ -364,14 +392,14 @@ def generate_logical_reasoning_task(ollama: OllamaModel, content: str, title: st
         ChatMessage(role="system", content="You are a helpful assistant that creates logical reasoning questions."),
         ChatMessage(role="user", content=f"{question_prompt}\n\n{content}")
     ]
-    question = ollama.generate(question_messages)
+    question = run(ollama.generate(question_messages))
     
     answer_prompt = f"Provide a step-by-step solution to this logical reasoning question:\n{question}\n\nBased on the blog post about '{title}':"
     answer_messages = [
         ChatMessage(role="system", content="You are a helpful assistant that provides step-by-step solutions to logical reasoning questions."),
         ChatMessage(role="user", content=f"{answer_prompt}\n\n{content}")
     ]
-    answer = ollama.generate(answer_messages)
+    answer = run(ollama.generate(answer_messages))
     
     return {"prompt": question, "completion": answer}
 
@@ -423,6 +451,9 @@ def process_file(file_path: Path, ollama: OllamaModel) -> List[Dict[str, str]]:
 
     except Exception as e:
         logger.error(f"Error processing file {file_path}: {str(e)}", exc_info=True)
+    finally:
+        # Pool threads outlive the task, so release this file's loop and connections here.
+        close_thread_loop(ollama)
 
     return file_training_data
 
@@ -539,13 +570,13 @@ class TestGeneratePayload(unittest.TestCase):
 
     @patch('cognition.llms.ollama.OllamaModel')
     def test_generate_multiple_qa_pairs(self, mock_ollama):
-        mock_ollama.generate_json.return_value = {
+        mock_ollama.generate_json = AsyncMock(return_value={
             "qa_pairs": [
                 {"question": "Q1", "answer": "This is a valid answer for Q1 with more than 20 characters."},
                 {"question": "Q2", "answer": "Short"},
                 {"question": "Q3", "answer": "This is another valid answer for Q3 with sufficient length."}
             ]
-        }
+        })
         
         result = generate_multiple_qa_pairs(mock_ollama, "Sample content", "Sample Title")
         self.assertEqual(len(result), 2)  # Only two valid pairs should be returned
@@ -554,7 +585,7 @@ class TestGeneratePayload(unittest.TestCase):
 
     @patch('cognition.llms.ollama.OllamaModel')
     def test_generate_multiple_qa_pairs_error(self, mock_ollama):
-        mock_ollama.generate_json.side_effect = Exception("API Error")
+        mock_ollama.generate_json = AsyncMock(side_effect=Exception("API Error"))
         
         result = generate_multiple_qa_pairs(mock_ollama, "Sample content", "Sample Title")
         self.assertEqual(result, [])  # Should return an empty list on error
@@ -584,5 +615,6 @@ if __name__ == "__main__":
         training_data = process_corpus(args.corpus_path, ollama, args.max_workers)
         save_training_data(training_data, args.output_dir, args.train_split, args.test_split, args.val_split)
         logger.info(f"Generated {len(training_data)} training examples.")
+        logger.info(f"Backend metrics: {json.dumps(metrics.summary(), indent=2)}")
     else:
         logger.error("Tests failed. Please fix the issues before running the script.")
\ No newline at end of file
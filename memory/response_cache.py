@@ -0,0 +1,167 @@
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+from cognition.models.chat_models import ChatMessage
+from cognition.llms import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_REQUESTS = metrics.REGISTRY.counter(
+    "response_cache_requests_total", "Response cache lookups by result.", ("result",))
+
+
+class ResponseCache:
+    """
+    Exact-match cache of completions.
+
+    Keys are a hash of the normalized message list plus the backend's model
+    and sampling parameters. Entries live in an in-memory LRU tier and,
+    when `cache_dir` is set, in an on-disk tier of JSON files that survives
+    restarts. Both tiers honour the same TTL. The disk tier is kept under
+    `max_disk_bytes` by dropping its oldest files; expired files are swept
+    at startup and on every write.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 3600.0,
+        cache_dir: Optional[str] = None,
+        allow_sampled: bool = False,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.allow_sampled = allow_sampled
+        self.max_disk_bytes = max_disk_bytes
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        # Files on disk, oldest first, as key -> (stored_at, size in bytes)
+        self._files: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        self._disk_bytes = 0
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._scan_disk()
+
+    def is_cacheable(self, params: dict) -> bool:
+        """Only deterministic generations are cached unless `allow_sampled` is set."""
+        return self.allow_sampled or params.get("temperature") == 0
+
+    @staticmethod
+    def key(messages: List[ChatMessage], params: dict) -> str:
+        normalized = [[msg.role.strip().lower(), " ".join(msg.content.split())] for msg in messages]
+        payload = json.dumps({"messages": normalized, "params": params}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            stored_at, response = entry
+            if time.time() - stored_at <= self.ttl:
+                self._entries.move_to_end(key)
+                CACHE_REQUESTS.inc(result="hit")
+                return response
+            del self._entries[key]
+
+        entry = self._read_disk(key)
+        if entry is not None:
+            stored_at, response = entry
+            self._remember(key, stored_at, response)
+            CACHE_REQUESTS.inc(result="disk_hit")
+            return response
+
+        CACHE_REQUESTS.inc(result="miss")
+        return None
+
+    def set(self, key: str, response: str):
+        stored_at = time.time()
+        self._remember(key, stored_at, response)
+        self._write_disk(key, stored_at, response)
+
+    def _remember(self, key: str, stored_at: float, response: str):
+        self._entries[key] = (stored_at, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def _read_disk(self, key: str) -> Optional[Tuple[float, str]]:
+        if self.cache_dir is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable cache entry {path}: {str(e)}")
+            return None
+        if time.time() - entry["stored_at"] > self.ttl:
+            self._drop_file(key)
+            return None
+        return entry["stored_at"], entry["response"]
+
+    def _write_disk(self, key: str, stored_at: float, response: str):
+        if self.cache_dir is None:
+            return
+        path = self._path(key)
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"stored_at": stored_at, "response": response}, f, ensure_ascii=False)
+            tmp_path.replace(path)
+            size = path.stat().st_size
+        except OSError as e:
+            logger.warning(f"Could not write cache entry {path}: {str(e)}")
+            return
+        self._forget_file(key)
+        self._files[key] = (stored_at, size)
+        self._disk_bytes += size
+        self._sweep_disk()
+
+    def _scan_disk(self):
+        """Index the files left by a previous run, oldest first, and sweep them."""
+        found = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            found.append((stat.st_mtime, path.stem, stat.st_size))
+        for stored_at, key, size in sorted(found):
+            self._files[key] = (stored_at, size)
+            self._disk_bytes += size
+        self._sweep_disk()
+
+    def _sweep_disk(self):
+        """Delete expired files, then the oldest ones until the tier fits `max_disk_bytes`."""
+        now = time.time()
+        while self._files:
+            key, (stored_at, _) = next(iter(self._files.items()))
+            if now - stored_at <= self.ttl and self._disk_bytes <= self.max_disk_bytes:
+                break
+            self._drop_file(key)
+
+    def _forget_file(self, key: str):
+        entry = self._files.pop(key, None)
+        if entry is not None:
+            self._disk_bytes -= entry[1]
+
+    def _drop_file(self, key: str):
+        self._forget_file(key)
+        self._path(key).unlink(missing_ok=True)
+
+    def clear(self):
+        self._entries.clear()
+        if self.cache_dir is not None:
+            for path in self.cache_dir.glob("*.json"):
+                path.unlink(missing_ok=True)
+            self._files.clear()
+            self._disk_bytes = 0
@@ -0,0 +1,400 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Callable, Optional, AsyncIterator, AsyncContextManager, Tuple
+from cognition.engines.chat_engine import Conversation
+from cognition.models.chat_models import ChatMessage
+
+# Stored as JSON in messages.tool_fields, and only when a message has any.
+TOOL_FIELDS = {"tool_calls", "tool_call_id", "name"}
+
+
+class SessionLeaseLost(Exception):
+    """A turn's lease on its session expired and another turn took it over; the turn's changes were not saved."""
+
+    def __init__(self, session_id: str):
+        super().__init__(f"Lost the lease on session {session_id}; another request took it over")
+        self.session_id = session_id
+
+
+class Session:
+    def __init__(self, session_id: str, conversation: Conversation):
+        self.session_id = session_id
+        self.conversation = conversation
+        conversation.session_id = session_id
+        self.lock = asyncio.Lock()
+        self.last_access = time.monotonic()
+        self.size = 0
+
+    def measure(self) -> int:
+        """Approximate the memory held by this session's history, in bytes of message content."""
+        self.size = sum(len(msg.content) for msg in self.conversation.conversation_history.messages)
+        return self.size
+
+
+class BaseSessionStore(ABC):
+    @staticmethod
+    def new_session_id() -> str:
+        return uuid.uuid4().hex
+
+    @abstractmethod
+    def session(self, session_id: Optional[str] = None) -> AsyncContextManager[Session]:
+        """Hold the session exclusively for one turn; changes to its conversation are kept on exit."""
+        pass
+
+    async def aclose(self):
+        pass
+
+
+class SessionStore(BaseSessionStore):
+    """
+    Keeps one Conversation per session id in this process.
+
+    Sessions are evicted least-recently-used first once there are more than
+    `max_sessions` of them or their histories together exceed `max_bytes`,
+    and any session idle for longer than `ttl` seconds is dropped. A session
+    whose lock is held by a running turn is never evicted.
+    """
+
+    def __init__(
+        self,
+        conversation_factory: Callable[[], Conversation],
+        max_sessions: int = 1000,
+        ttl: float = 3600.0,
+        max_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.conversation_factory = conversation_factory
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._total_bytes = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str):
+        return session_id in self._sessions
+
+    def get(self, session_id: Optional[str] = None) -> Session:
+        """Return the session for `session_id`, creating it (and an id, if none was given) when needed."""
+        self._expire()
+        if session_id is None:
+            session_id = self.new_session_id()
+
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = Session(session_id, self.conversation_factory())
+            self._sessions[session_id] = session
+            self._total_bytes += session.measure()
+            self._evict(keep=session_id)
+        else:
+            self._sessions.move_to_end(session_id)
+        session.last_access = time.monotonic()
+        return session
+
+    @asynccontextmanager
+    async def session(self, session_id: Optional[str] = None) -> AsyncIterator[Session]:
+        """Hold the session's lock for the duration of one turn so concurrent turns never interleave."""
+        session = self.get(session_id)
+        async with session.lock:
+            try:
+                yield session
+            finally:
+                self._update_size(session)
+
+    def drop(self, session_id: str):
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._total_bytes -= session.size
+
+    def _update_size(self, session: Session):
+        previous = session.size
+        session.last_access = time.monotonic()
+        if self._sessions.get(session.session_id) is not session:
+            # Evicted while the turn was running; nothing left to account for.
+            return
+        self._sessions.move_to_end(session.session_id)
+        self._total_bytes += session.measure() - previous
+        self._evict(keep=session.session_id)
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        for session_id, session in list(self._sessions.items()):
+            if session.last_access >= cutoff:
+                break
+            if not session.lock.locked():
+                self.drop(session_id)
+
+    def _evict(self, keep: Optional[str] = None):
+        for session_id, session in list(self._sessions.items()):
+            if len(self._sessions) <= self.max_sessions and self._total_bytes <= self.max_bytes:
+                break
+            # Sessions mid-turn are never evicted from under it, so the store may stay over budget until they finish.
+            if session_id != keep and not session.lock.locked():
+                self.drop(session_id)
+
+
+class SQLiteSessionStore(BaseSessionStore):
+    """
+    Keeps conversations in a SQLite database in WAL mode, so several uvicorn
+    workers on one host can share sessions.
+
+    A turn holds a lease on its session row instead of a database-wide write
+    lock, so turns on different sessions proceed in parallel across workers.
+    Leases are renewed while a turn runs and expire `lease_ttl` seconds
+    after the last renewal, in case a worker dies mid-turn. A turn whose
+    lease was taken over anyway fails with SessionLeaseLost rather than
+    overwrite the turn that took it.
+    Eviction follows the same rules as SessionStore.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        conversation_factory: Callable[[], Conversation],
+        max_sessions: int = 1000,
+        ttl: float = 3600.0,
+        max_bytes: int = 64 * 1024 * 1024,
+        lease_ttl: float = 300.0,
+        poll_interval: float = 0.05,
+    ):
+        self.conversation_factory = conversation_factory
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        # Turns in this worker queue on an in-process lock before polling the shared lease.
+        self._local_locks: "OrderedDict[str, asyncio.Lock]" = OrderedDict()
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                last_access REAL NOT NULL,
+                size INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                summary TEXT,
+                summarized_upto INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access);
+            CREATE TABLE IF NOT EXISTS messages (
+                session_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                tool_fields TEXT,
+                PRIMARY KEY (session_id, idx)
+            );
+        """)
+        # Summaries still running when their turn was saved; each is written once it finishes.
+        self._summary_writes: set = set()
+
+    def _run(self, fn, *args):
+        with self._db_lock:
+            return fn(*args)
+
+    def __len__(self):
+        return self._run(lambda: self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0])
+
+    def __contains__(self, session_id: str):
+        return self._run(
+            lambda: self._db.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        ) is not None
+
+    def _try_lease(self, session_id: str, owner: str) -> bool:
+        now = time.time()
+        cursor = self._db.execute(
+            """
+            INSERT INTO sessions (session_id, last_access, size, lease_owner, lease_expires)
+            VALUES (?, ?, 0, ?, ?)
+            ON CONFLICT (session_id) DO UPDATE SET
+                lease_owner = excluded.lease_owner,
+                lease_expires = excluded.lease_expires,
+                last_access = excluded.last_access
+            WHERE sessions.lease_owner IS NULL OR sessions.lease_expires < excluded.last_access
+            """,
+            (session_id, now, owner, now + self.lease_ttl),
+        )
+        return cursor.rowcount > 0
+
+    def _load(self, session_id: str) -> Tuple[list, Optional[str], int]:
+        rows = self._db.execute(
+            "SELECT role, content, tool_fields FROM messages WHERE session_id = ? ORDER BY idx", (session_id,)
+        ).fetchall()
+        summary, summarized_upto = self._db.execute(
+            "SELECT summary, summarized_upto FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        messages = [
+            ChatMessage(role=role, content=content, **(json.loads(tool_fields) if tool_fields else {}))
+            for role, content, tool_fields in rows
+        ]
+        return messages, summary, summarized_upto
+
+    @staticmethod
+    def _tool_fields(message: ChatMessage) -> Optional[str]:
+        fields = message.model_dump(include=TOOL_FIELDS, exclude_none=True)
+        return json.dumps(fields) if fields else None
+
+    def _save(self, session_id: str, owner: str, messages: list, first_new: int):
+        now = time.time()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            holder = self._db.execute("SELECT lease_owner FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if holder is None or holder[0] != owner:
+                # Another turn may have written the session since; don't overwrite its messages.
+                raise SessionLeaseLost(session_id)
+            self._db.executemany(
+                "INSERT OR REPLACE INTO messages (session_id, idx, role, content, tool_fields) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (session_id, idx, msg.role, msg.content, self._tool_fields(msg))
+                    for idx, msg in enumerate(messages) if idx >= first_new
+                ],
+            )
+            self._db.execute(
+                """
+                UPDATE sessions SET last_access = ?, size = ?, lease_owner = NULL, lease_expires = NULL
+                WHERE session_id = ?
+                """,
+                (now, sum(len(msg.content) for msg in messages), session_id),
+            )
+            self._evict(now, keep=session_id)
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def _renew(self, session_id: str, owner: str) -> bool:
+        cursor = self._db.execute(
+            "UPDATE sessions SET lease_expires = ? WHERE session_id = ? AND lease_owner = ?",
+            (time.time() + self.lease_ttl, session_id, owner),
+        )
+        return cursor.rowcount > 0
+
+    async def _keep_lease(self, session_id: str, owner: str):
+        """Renew the lease while the turn runs, so a long turn (several tool rounds, say) doesn't outlive it."""
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            if not await asyncio.to_thread(self._run, self._renew, session_id, owner):
+                return
+
+    def _save_summary(self, session_id: str, summary: str, summarized_upto: int):
+        # No lease needed: turns never write these columns, and a newer summary is never overwritten.
+        self._db.execute(
+            "UPDATE sessions SET summary = ?, summarized_upto = ? WHERE session_id = ? AND summarized_upto < ?",
+            (summary, summarized_upto, session_id, summarized_upto),
+        )
+
+    def _release(self, session_id: str, owner: str):
+        self._db.execute(
+            "UPDATE sessions SET lease_owner = NULL, lease_expires = NULL WHERE session_id = ? AND lease_owner = ?",
+            (session_id, owner),
+        )
+
+    def _evict(self, now: float, keep: str):
+        # Sessions mid-turn in another worker are never evicted from under it.
+        idle = "(lease_owner IS NULL OR lease_expires < :now) AND session_id != :keep"
+        params = {"now": now, "keep": keep}
+        expired = self._db.execute(
+            f"SELECT session_id, size FROM sessions WHERE last_access < :cutoff AND {idle}",
+            {**params, "cutoff": now - self.ttl},
+        ).fetchall()
+        doomed = [session_id for session_id, _ in expired]
+        count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions").fetchone()
+        count -= len(expired)
+        total -= sum(size for _, size in expired)
+        if count > self.max_sessions or total > self.max_bytes:
+            for session_id, size in self._db.execute(
+                f"SELECT session_id, size FROM sessions WHERE {idle} ORDER BY last_access", params
+            ):
+                if count <= self.max_sessions and total <= self.max_bytes:
+                    break
+                if session_id in doomed:
+                    continue
+                doomed.append(session_id)
+                count -= 1
+                total -= size
+        for session_id in doomed:
+            self._db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def _local_lock(self, session_id: str) -> asyncio.Lock:
+        lock = self._local_locks.get(session_id)
+        if lock is None:
+            lock = self._local_locks[session_id] = asyncio.Lock()
+            # Forget locks nobody is holding once there are more than we have sessions.
+            while len(self._local_locks) > self.max_sessions:
+                oldest_id, oldest = next(iter(self._local_locks.items()))
+                if oldest.locked():
+                    break
+                del self._local_locks[oldest_id]
+        return lock
+
+    @asynccontextmanager
+    async def session(self, session_id: Optional[str] = None) -> AsyncIterator[Session]:
+        if session_id is None:
+            session_id = self.new_session_id()
+        owner = uuid.uuid4().hex
+        async with self._local_lock(session_id):
+            while not await asyncio.to_thread(self._run, self._try_lease, session_id, owner):
+                await asyncio.sleep(self.poll_interval)
+
+            try:
+                messages, summary, summarized_upto = await asyncio.to_thread(self._run, self._load, session_id)
+                conversation = self.conversation_factory() if not messages else Conversation()
+                for message in messages:
+                    conversation.add_message(message)
+                conversation.restore_summary(summary, summarized_upto)
+                session = Session(session_id, conversation)
+                stored = len(messages)
+            except BaseException:
+                await asyncio.to_thread(self._run, self._release, session_id, owner)
+                raise
+
+            renewal = asyncio.ensure_future(self._keep_lease(session_id, owner))
+            try:
+                yield session
+            finally:
+                renewal.cancel()
+                await asyncio.gather(renewal, return_exceptions=True)
+                # Histories only grow by appending, so only the new tail is written.
+                await asyncio.to_thread(
+                    self._run, self._save, session_id, owner,
+                    list(conversation.conversation_history.messages), stored,
+                )
+                if conversation.summarizing:
+                    task = asyncio.ensure_future(self._save_summary_when_done(session_id, conversation))
+                    self._summary_writes.add(task)
+                    task.add_done_callback(self._summary_writes.discard)
+
+    async def _save_summary_when_done(self, session_id: str, conversation: Conversation):
+        await conversation.wait_for_summary()
+        if conversation.summary is not None:
+            await asyncio.to_thread(
+                self._run, self._save_summary, session_id, conversation.summary, conversation.summarized_upto,
+            )
+
+    async def aclose(self):
+        for task in list(self._summary_writes):
+            task.cancel()
+        await asyncio.gather(*self._summary_writes, return_exceptions=True)
+        self._run(self._db.close)
+
+
+def create_session_store(backend: str, conversation_factory: Callable[[], Conversation], db_path: str = "sessions.db", **kwargs) -> BaseSessionStore:
+    if backend == "memory":
+        return SessionStore(conversation_factory, **kwargs)
+    if backend == "sqlite":
+        return SQLiteSessionStore(db_path, conversation_factory, **kwargs)
+    raise ValueError(f"Unknown session backend: {backend}")
@@ -0,0 +1,71 @@
+"""
+Module for testing the exact-match response cache
+"""
+
+import time
+from cognition.models.chat_models import ChatMessage
+from memory.response_cache import ResponseCache
+
+PARAMS = {"backend": "OllamaModel", "model": "llama3.1", "temperature": 0}
+
+
+def messages(content: str):
+    return [ChatMessage(role="system", content="You are a pirate"), ChatMessage(role="user", content=content)]
+
+
+def test_keys_normalize_whitespace_and_role_case_but_not_params():
+    key = ResponseCache.key(messages("hello  there"), PARAMS)
+    assert key == ResponseCache.key([ChatMessage(role=" System", content="You are a pirate"),
+                                     ChatMessage(role="user", content=" hello there ")], PARAMS)
+    assert key != ResponseCache.key(messages("hello there"), dict(PARAMS, model="llama3.2"))
+    assert key != ResponseCache.key(messages("goodbye"), PARAMS)
+
+
+def test_only_deterministic_generations_are_cacheable():
+    assert ResponseCache().is_cacheable(PARAMS)
+    assert not ResponseCache().is_cacheable(dict(PARAMS, temperature=0.7))
+    assert ResponseCache(allow_sampled=True).is_cacheable(dict(PARAMS, temperature=0.7))
+
+
+def test_lru_and_ttl():
+    cache = ResponseCache(max_entries=2, ttl=0.05)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    cache.get("a")
+    cache.set("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A" and cache.get("c") == "C"
+    time.sleep(0.06)
+    assert cache.get("a") is None
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    ResponseCache(cache_dir=str(tmp_path)).set("k", "persisted")
+    restarted = ResponseCache(cache_dir=str(tmp_path))
+    assert restarted.get("k") == "persisted"
+    (tmp_path / "broken.json").write_text("{not json")
+    assert restarted.get("broken") is None
+    restarted.clear()
+    assert ResponseCache(cache_dir=str(tmp_path)).get("k") is None
+
+
+def test_disk_tier_drops_its_oldest_files_past_the_byte_limit(tmp_path):
+    cache = ResponseCache(max_entries=1, cache_dir=str(tmp_path), max_disk_bytes=200)
+    for key in "abcde":
+        cache.set(key, key * 40)
+    assert sorted(path.stem for path in tmp_path.glob("*.json")) == ["d", "e"]
+    assert cache.get("a") is None and cache.get("d") == "d" * 40
+    assert ResponseCache(cache_dir=str(tmp_path), max_disk_bytes=100).get("d") is None
+
+
+def test_expired_files_are_swept_at_startup_and_on_write(tmp_path):
+    ResponseCache(cache_dir=str(tmp_path), ttl=0.05).set("old", "stale")
+    time.sleep(0.06)
+    ResponseCache(cache_dir=str(tmp_path), ttl=0.05)
+    assert not (tmp_path / "old.json").exists()
+
+    cache = ResponseCache(cache_dir=str(tmp_path), ttl=0.05)
+    cache.set("first", "stale")
+    time.sleep(0.06)
+    cache.set("second", "fresh")
+    assert sorted(path.stem for path in tmp_path.glob("*.json")) == ["second"]
@@ -0,0 +1,218 @@
+"""
+Module for testing the session store
+"""
+
+import asyncio
+import time
+import pytest
+import settings
+from cognition.engines.chat_engine import Conversation
+from cognition.models.chat_models import ChatMessage
+from memory.session_store import SessionLeaseLost, SessionStore, SQLiteSessionStore
+
+
+def new_conversation():
+    conversation = Conversation()
+    conversation.add_message(ChatMessage(role="system", content="You are a large language model"))
+    return conversation
+
+
+def test_sessions_are_isolated():
+    store = SessionStore(new_conversation)
+    store.get("a").conversation.add_message(ChatMessage(role="user", content="hi"))
+    assert len(store.get("a").conversation.conversation_history.messages) == 2
+    assert len(store.get("b").conversation.conversation_history.messages) == 1
+
+
+def test_lru_eviction():
+    store = SessionStore(new_conversation, max_sessions=2)
+    store.get("a")
+    store.get("b")
+    store.get("a")
+    store.get("c")
+    assert "a" in store and "c" in store and "b" not in store
+
+
+def test_ttl_expiry():
+    store = SessionStore(new_conversation, ttl=0.01)
+    store.get("a")
+    time.sleep(0.02)
+    store.get("b")
+    assert "a" not in store and "b" in store
+
+
+def test_memory_cap_evicts_oldest():
+    store = SessionStore(new_conversation, max_bytes=200)
+
+    async def turn(session_id):
+        async with store.session(session_id) as session:
+            session.conversation.add_message(ChatMessage(role="user", content="x" * 100))
+
+    asyncio.run(turn("a"))
+    asyncio.run(turn("b"))
+    assert "a" not in store and "b" in store
+
+
+def test_sessions_mid_turn_are_not_evicted_or_expired():
+    store = SessionStore(new_conversation, max_sessions=1, ttl=0.05)
+
+    async def main():
+        async with store.session("a") as session:
+            await asyncio.sleep(0.1)
+            store.get("b")
+            assert "a" in store
+            session.conversation.add_message(ChatMessage(role="user", content="still here"))
+        return store.get("a").conversation.conversation_history.messages
+
+    assert asyncio.run(main())[-1].content == "still here"
+
+
+def test_turns_on_one_session_do_not_interleave():
+    store = SessionStore(new_conversation)
+    order = []
+
+    async def turn(tag):
+        async with store.session("a"):
+            order.append(f"{tag}-start")
+            await asyncio.sleep(0.01)
+            order.append(f"{tag}-end")
+
+    async def main():
+        await asyncio.gather(turn("1"), turn("2"))
+
+    asyncio.run(main())
+    assert order == ["1-start", "1-end", "2-start", "2-end"]
+
+
+def test_sqlite_store_shares_sessions_between_instances(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    # Two stores on one file stand in for two uvicorn workers.
+    first = SQLiteSessionStore(db_path, new_conversation)
+    second = SQLiteSessionStore(db_path, new_conversation)
+
+    async def turn(store, content):
+        async with store.session("a") as session:
+            session.conversation.add_message(ChatMessage(role="user", content=content))
+            return [msg.content for msg in session.conversation.conversation_history.messages]
+
+    asyncio.run(turn(first, "hi"))
+    history = asyncio.run(turn(second, "again"))
+    assert history == ["You are a large language model", "hi", "again"]
+
+
+def test_sqlite_store_serializes_turns_across_instances(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    stores = [SQLiteSessionStore(db_path, new_conversation, poll_interval=0.005) for _ in range(2)]
+    order = []
+
+    async def turn(store, tag):
+        async with store.session("a") as session:
+            order.append(f"{tag}-start")
+            await asyncio.sleep(0.02)
+            session.conversation.add_message(ChatMessage(role="user", content=tag))
+            order.append(f"{tag}-end")
+
+    async def main():
+        await asyncio.gather(turn(stores[0], "1"), turn(stores[1], "2"))
+
+    asyncio.run(main())
+    assert order in (["1-start", "1-end", "2-start", "2-end"], ["2-start", "2-end", "1-start", "1-end"])
+    assert len(asyncio.run(_history(stores[0], "a"))) == 3
+
+
+def test_sqlite_store_renews_the_lease_during_a_long_turn(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    stores = [SQLiteSessionStore(db_path, new_conversation, lease_ttl=0.05, poll_interval=0.005) for _ in range(2)]
+    order = []
+
+    async def turn(store, tag, delay):
+        await asyncio.sleep(delay)
+        async with store.session("a"):
+            order.append(f"{tag}-start")
+            await asyncio.sleep(0.2)
+            order.append(f"{tag}-end")
+
+    async def main():
+        await asyncio.gather(turn(stores[0], "long", 0), turn(stores[1], "next", 0.01))
+
+    asyncio.run(main())
+    assert order == ["long-start", "long-end", "next-start", "next-end"]
+
+
+def test_sqlite_store_does_not_save_a_turn_whose_lease_was_taken(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    late, other = SQLiteSessionStore(db_path, new_conversation), SQLiteSessionStore(db_path, new_conversation)
+
+    async def main():
+        with pytest.raises(SessionLeaseLost):
+            async with late.session("a") as session:
+                # The lease runs out (say the worker stalled) and another turn takes the session.
+                late._db.execute("UPDATE sessions SET lease_expires = 0 WHERE session_id = 'a'")
+                async with other.session("a") as taken:
+                    taken.conversation.add_message(ChatMessage(role="user", content="from the other worker"))
+                session.conversation.add_message(ChatMessage(role="user", content="late"))
+        return await _history(other, "a")
+
+    history = asyncio.run(main())
+    assert [msg.content for msg in history[1:]] == ["from the other worker"]
+
+
+def test_sqlite_store_evicts_least_recently_used(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), new_conversation, max_sessions=2)
+    for session_id in ["a", "b", "c"]:
+        asyncio.run(_history(store, session_id))
+    assert len(store) == 2 and "a" not in store
+
+
+def test_sqlite_store_round_trips_tool_calls(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    call = {"id": "call_1", "type": "function", "function": {"name": "get_time", "arguments": "{}"}}
+    turn = [
+        ChatMessage(role="user", content="what time is it?"),
+        ChatMessage(role="assistant", content="", tool_calls=[call]),
+        ChatMessage(role="tool", content="noon", tool_call_id="call_1", name="get_time"),
+        ChatMessage(role="assistant", content="It's noon."),
+    ]
+
+    async def save():
+        async with SQLiteSessionStore(db_path, new_conversation).session("a") as session:
+            for message in turn:
+                session.conversation.add_message(message)
+
+    asyncio.run(save())
+    assert asyncio.run(_history(SQLiteSessionStore(db_path, new_conversation), "a"))[1:] == turn
+
+
+class SlowSummarizer:
+    async def generate(self, messages):
+        await asyncio.sleep(0.05)
+        return "they said hi a lot"
+
+
+def test_sqlite_store_keeps_summaries_that_finish_after_the_turn(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SUMMARY_TRIGGER_TOKENS", 5)
+    monkeypatch.setattr(settings, "SUMMARY_KEEP_TOKENS", 0)
+    db_path = str(tmp_path / "sessions.db")
+    store = SQLiteSessionStore(db_path, new_conversation)
+
+    async def turn():
+        async with store.session("a") as session:
+            for content in ["hi there", "hello", "hi again"]:
+                session.conversation.add_message(ChatMessage(role="user", content=content))
+            session.conversation.summarize_in_background(SlowSummarizer(), lambda text: len(text.split()))
+        await asyncio.gather(*store._summary_writes)
+
+    asyncio.run(turn())
+
+    async def reload():
+        async with SQLiteSessionStore(db_path, new_conversation).session("a") as session:
+            return session.conversation
+
+    conversation = asyncio.run(reload())
+    assert (conversation.summary, conversation.summarized_upto) == ("they said hi a lot", 4)
+    assert [msg.role for msg in conversation.prompt_messages()] == ["system", "system"]
+
+
+async def _history(store, session_id):
+    async with store.session(session_id) as session:
+        return list(session.conversation.conversation_history.messages)
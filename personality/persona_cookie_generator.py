@@ -23,6 +23,18 @@ Include as many relevant items in each list as you can find in the data.
 The description should be a comprehensive summary of the user's profile.
 """
 
+PERSONA_COOKIE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "description": {"type": "string"},
+        "interests": {"type": "array", "items": {"type": "string"}},
+        "personality_traits": {"type": "array", "items": {"type": "string"}},
+        "career_and_business": {"type": "array", "items": {"type": "string"}},
+        "tags": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["description", "interests", "personality_traits", "career_and_business", "tags"],
+}
+
 def ingest_web_data(user_profile: str):
     artifacts_dir = Path("personality/artifacts")
     user_dir = artifacts_dir / user_profile
@@ -66,7 +78,7 @@ async def generate_persona_cookie(user_profile: str, web_data: list):
     """
     
     try:
-        persona_cookie = await llm.generate_json(prompt)
+        persona_cookie = await llm.generate_json(prompt, schema=PERSONA_COOKIE_SCHEMA)
         if not all(key in persona_cookie for key in ["description", "interests", "personality_traits", "career_and_business", "tags"]):
             raise ValueError("Generated JSON does not match the required structure")
         return persona_cookie
@@ -75,7 +87,7 @@ async def generate_persona_cookie(user_profile: str, web_data: list):
         conversation = Conversation()
         conversation.add_message(ChatMessage(role="system", content=system_prompt))
         chat_engine = ChatEngine(llm=llm, conversation=conversation)
-        response = await chat_engine.chat(prompt)
+        response = await chat_engine.achat(prompt)
         return response
 
 def save_persona_cookie(user_profile: str, persona_cookie: dict):
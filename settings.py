@@ -7,3 +7,78 @@ load_dotenv(override=False)
 
 # API settings
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Session settings
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")  # "memory" or "sqlite"
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+
+# Server settings
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
+# Start serving before the backend has loaded; /ready reports when it has.
+API_FAST_START = os.getenv("API_FAST_START", "false").lower() == "true"
+
+# LLM backend settings
+LLM_BACKEND = os.getenv("LLM_BACKEND", "ollama")  # "ollama", "ollama_chat", "openai", "huggingface" or "router"
+LLM_MODEL = os.getenv("LLM_MODEL", "llama3.1")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE")) if os.getenv("LLM_TEMPERATURE") else None
+# Prompt budget for chat history; the system prompt is always kept and older turns are dropped first.
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "4096"))
+
+# Rolling summary settings; off by default, and SUMMARY_MODEL must name a small, fast model to turn them on.
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "false").lower() == "true"
+SUMMARY_BACKEND = os.getenv("SUMMARY_BACKEND", LLM_BACKEND)
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL")
+# Summarize once the unsummarized turns pass this many tokens, keeping the newest SUMMARY_KEEP_TOKENS verbatim.
+SUMMARY_TRIGGER_TOKENS = int(os.getenv("SUMMARY_TRIGGER_TOKENS", str(CONTEXT_MAX_TOKENS * 3 // 4)))
+SUMMARY_KEEP_TOKENS = int(os.getenv("SUMMARY_KEEP_TOKENS", str(CONTEXT_MAX_TOKENS // 3)))
+
+# Per-session prompt state (HF KV cache, Ollama context) kept across turns, in total tokens; 0 disables it.
+PROMPT_CACHE_MAX_TOKENS = int(os.getenv("PROMPT_CACHE_MAX_TOKENS", "32768"))
+# Prefill the system prompt once per persona and model and start new sessions from a copy of it.
+PREFIX_CACHE_ENABLED = os.getenv("PREFIX_CACHE_ENABLED", "true").lower() == "true"
+
+# Warm-up settings; only the local backends (Ollama and HuggingFace) do any work to warm up.
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_PROMPT = os.getenv("WARMUP_PROMPT", "Hello")
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "300"))
+# How long Ollama keeps the model loaded after a request, in seconds or as a duration like "30m"; -1 keeps it resident.
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "-1")
+OLLAMA_KEEP_ALIVE = int(OLLAMA_KEEP_ALIVE) if OLLAMA_KEEP_ALIVE.lstrip("-").isdigit() else OLLAMA_KEEP_ALIVE
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+# Context length requested from Ollama by the ollama_chat backend; unset uses the model's default.
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX")) if os.getenv("OLLAMA_NUM_CTX") else None
+# Local tokenizer.json (or directory) for the Ollama model; unset looks in the Hugging Face cache.
+TOKENIZER_PATH = os.getenv("TOKENIZER_PATH")
+
+# Router settings, for LLM_BACKEND=router
+ROUTER_BACKENDS = os.getenv("ROUTER_BACKENDS", "ollama:llama3.1,openai:gpt-4o-mini")  # priority order
+ROUTER_HEDGE_AFTER = float(os.getenv("ROUTER_HEDGE_AFTER", "1.0"))  # seconds without a first token before hedging
+ROUTER_PERCENTILE = float(os.getenv("ROUTER_PERCENTILE", "95"))  # latency percentile used to rank backends
+
+# Local model directory or Hub repo id for the huggingface backend, used when LLM_MODEL is neither.
+HF_MODEL_PATH = os.getenv("HF_MODEL_PATH")
+
+# HuggingFace batching settings
+HF_MAX_BATCH_SIZE = int(os.getenv("HF_MAX_BATCH_SIZE", "8"))
+HF_MAX_BATCH_WAIT = float(os.getenv("HF_MAX_BATCH_WAIT", "0.01"))
+# Comma-separated strings that end a HuggingFace generation; they are not included in the reply.
+HF_STOP_SEQUENCES = [s for s in os.getenv("HF_STOP_SEQUENCES", "").split(",") if s]
+# Torch CPU threads for the HuggingFace backend; 0 keeps torch's default of one per core.
+HF_INTRA_OP_THREADS = int(os.getenv("HF_INTRA_OP_THREADS", "0"))
+HF_INTER_OP_THREADS = int(os.getenv("HF_INTER_OP_THREADS", "0"))
+
+# Admission control settings
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "4"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_MAX_QUEUE_PER_CLIENT = int(os.getenv("ADMISSION_MAX_QUEUE_PER_CLIENT", "4"))
+
+# Response cache settings
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR")  # unset keeps the cache in memory only
+RESPONSE_CACHE_MAX_DISK_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_DISK_BYTES", str(256 * 1024 * 1024)))
+RESPONSE_CACHE_ALLOW_SAMPLED = os.getenv("RESPONSE_CACHE_ALLOW_SAMPLED", "false").lower() == "true"
@@ -0,0 +1,236 @@
+"""
+Module for testing the chat API endpoints against a fake backend
+"""
+
+import asyncio
+import json
+import time
+from typing import List
+import pytest
+from fastapi.testclient import TestClient
+import api
+import settings
+from cognition.engines.admission import AdmissionController
+from cognition.llms.base_llm import BaseLLM
+from cognition.llms.registry import LLMRegistry
+from cognition.models.chat_models import ChatMessage
+
+
+class FakeModel(BaseLLM):
+    temperature = 0
+
+    def __init__(self):
+        self.calls = 0
+        self.delay = 0.0
+        self.stream_delay = 0.0
+        self.cancelled = False
+        self.stream_closed = False
+        self.warmup_delay = 0.0
+        self.warmup_error = None
+        self.warmed_with = None
+
+    async def generate(self, messages: List[ChatMessage], session_id=None) -> str:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return f"reply to: {messages[-1].content}"
+
+    async def stream(self, messages: List[ChatMessage], session_id=None):
+        try:
+            for delta in ["reply", " to: ", messages[-1].content]:
+                await asyncio.sleep(self.stream_delay)
+                yield delta
+        finally:
+            self.stream_closed = True
+
+    async def function_call(self, function_name: str, function_args: dict) -> str:
+        raise NotImplementedError
+
+    async def warmup(self, system_prompt: str, prompt: str = "Hello"):
+        await asyncio.sleep(self.warmup_delay)
+        if self.warmup_error is not None:
+            raise self.warmup_error
+        self.warmed_with = (system_prompt, prompt)
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    llm = FakeModel()
+    monkeypatch.setattr(LLMRegistry, "_create", lambda self, backend, model, options: llm)
+    monkeypatch.setattr(settings, "SESSION_BACKEND", "memory")
+    monkeypatch.setattr(settings, "SUMMARY_ENABLED", False)
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_DIR", None)
+    monkeypatch.setattr(settings, "API_FAST_START", False)
+    monkeypatch.setattr(api, "admission_controllers", {})
+    monkeypatch.setattr(api, "ready", False)
+    return llm
+
+
+@pytest.fixture
+def client(fake):
+    with TestClient(api.app) as client:
+        yield client
+
+
+def test_metrics_count_requests_by_endpoint_and_status(client):
+    client.get("/health")
+    client.get("/does-not-exist")
+    body = client.get("/metrics").text
+    assert 'http_requests_total{endpoint="/health",status="200"}' in body
+    assert 'http_requests_total{endpoint="unmatched",status="404"}' in body
+    assert 'http_request_duration_seconds_count{endpoint="/health"}' in body
+    assert "# TYPE llm_request_duration_seconds histogram" in body
+
+
+def test_chat_serves_repeated_deterministic_requests_from_cache(client, fake):
+    history = {"messages": [{"role": "user", "content": "hi"}]}
+    first = client.post("/chat", json=history)
+    second = client.post("/chat", json=history)
+    assert first.headers["X-Cache"] == "MISS" and second.headers["X-Cache"] == "HIT"
+    assert first.json() == second.json()
+    assert second.json()["messages"][1:] == [
+        {"role": "user", "content": "hi"}, {"role": "assistant", "content": "reply to: hi"}]
+    assert fake.calls == 1
+
+
+def test_chat_delta_returns_only_unseen_messages(client):
+    first = client.post("/chat/delta", json={"message": "hi"}).json()
+    assert first["messages"] == [{"index": 2, "role": "assistant", "content": "reply to: hi"}]
+    assert first["last_index"] == 2
+
+    second = client.post("/chat/delta", json={
+        "message": "again", "session_id": first["session_id"], "last_seen_index": first["last_index"]}).json()
+    assert second["session_id"] == first["session_id"]
+    assert second["messages"] == [{"index": 4, "role": "assistant", "content": "reply to: again"}]
+
+
+def test_chat_delta_conflicts_when_client_is_ahead_of_the_server(client, fake):
+    response = client.post("/chat/delta", json={"message": "hi", "session_id": "evicted", "last_seen_index": 6})
+    assert response.status_code == 409
+    detail = response.json()["detail"]
+    assert detail["session_id"] == "evicted" and detail["history_length"] == 1
+    assert fake.calls == 0
+
+
+def test_chat_stream_sends_sse_deltas_then_done(client):
+    response = client.post("/chat/stream", json={"message": "hi"})
+    session_id = response.headers["X-Session-ID"]
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [event for event in response.text.split("\n\n") if event]
+    assert events[:3] == ['data: {"delta": "reply"}', 'data: {"delta": " to: "}', 'data: {"delta": "hi"}']
+    assert events[3] == f'event: done\ndata: {json.dumps({"session_id": session_id})}'
+
+
+def test_websocket_streams_frames_and_keeps_the_session(client):
+    with client.websocket_connect("/chat/ws") as websocket:
+        websocket.send_json({"message": "hi"})
+        frames = [websocket.receive_json() for _ in range(4)]
+        session_id = frames[-1]["session_id"]
+        websocket.send_json({"message": "again", "session_id": session_id})
+        more = [websocket.receive_json() for _ in range(4)]
+    assert [frame["type"] for frame in frames] == ["delta", "delta", "delta", "done"]
+    assert "".join(frame["content"] for frame in frames[:3]) == "reply to: hi"
+    assert more[-1] == {"type": "done", "session_id": session_id}
+    messages = api.session_store.get(session_id).conversation.conversation_history.messages
+    assert [msg.role for msg in messages] == ["system", "user", "assistant", "user", "assistant"]
+
+
+async def call_and_disconnect(path: str, body: dict, disconnect_after: float) -> List[dict]:
+    """Call the app directly over ASGI with a client that goes away `disconnect_after` seconds in."""
+    pending = [{"type": "http.request", "body": json.dumps(body).encode(), "more_body": False}]
+    deadline = time.monotonic() + disconnect_after
+    sent = []
+
+    async def receive():
+        if pending:
+            return pending.pop(0)
+        if time.monotonic() < deadline:
+            await asyncio.sleep(deadline - time.monotonic())
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"host", b"testserver")],
+        "client": ("127.0.0.1", 5000), "server": ("testserver", 80),
+    }
+    await asyncio.wait_for(api.app(scope, receive, send), 5.0)
+    return sent
+
+
+def test_disconnect_cancels_generation_and_answers_499(client, fake):
+    fake.delay = 10.0
+    sent = asyncio.run(call_and_disconnect("/chat-engine", {"message": "hi"}, disconnect_after=0.3))
+    assert sent[0]["type"] == "http.response.start" and sent[0]["status"] == 499
+    assert fake.cancelled
+    controller = api.admission_controllers["FakeModel"]
+    assert controller.active == 0 and controller.queued == 0
+
+
+def test_abandoned_stream_frees_its_session_slot_and_backend_stream(client, fake):
+    # Left alone, the reply would take 3s; everything must be freed well before that.
+    fake.stream_delay = 1.0
+
+    async def main():
+        sent = await call_and_disconnect("/chat/stream", {"message": "hi", "session_id": "s"}, disconnect_after=0.3)
+        # The session can be taken for the next turn right away.
+        async with api.session_store.session("s"):
+            pass
+        return sent
+
+    sent = asyncio.run(asyncio.wait_for(main(), 1.0))
+    bodies = b"".join(message.get("body", b"") for message in sent if message["type"] == "http.response.body")
+    assert b"event: done" not in bodies
+    assert fake.stream_closed
+    controller = api.admission_controllers["FakeModel"]
+    assert controller.active == 0 and controller.queued == 0
+
+
+def test_client_that_leaves_while_queued_for_a_stream_takes_no_slot(client, fake):
+    controller = api.admission_controllers["FakeModel"] = AdmissionController(max_concurrency=1, max_queue=5)
+
+    async def main():
+        holder = await controller.acquire("someone else")
+        sent = await call_and_disconnect("/chat/stream", {"message": "hi"}, disconnect_after=0.3)
+        holder.release()
+        return sent
+
+    sent = asyncio.run(main())
+    assert sent[0]["status"] == 499
+    assert controller.active == 0 and controller.queued == 0
+    assert not fake.stream_closed
+
+
+def test_fast_start_serves_health_while_the_backend_loads(fake, monkeypatch):
+    monkeypatch.setattr(settings, "API_FAST_START", True)
+    fake.warmup_delay = 0.5
+    with TestClient(api.app) as client:
+        assert client.get("/health").status_code == 200
+        assert client.get("/ready").status_code == 503
+        busy = client.post("/chat-engine", json={"message": "hi"})
+        assert busy.status_code == 503 and busy.headers["Retry-After"] == "5"
+        deadline = time.monotonic() + 5.0
+        while client.get("/ready").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert client.get("/ready").json() == {"status": "ready"}
+        assert client.post("/chat-engine", json={"message": "hi"}).status_code == 200
+
+
+def test_backend_is_warmed_up_with_the_persona_before_ready(client, fake):
+    assert fake.warmed_with == (api.system_prompt, settings.WARMUP_PROMPT)
+    assert client.get("/ready").status_code == 200
+
+
+@pytest.mark.parametrize("delay, error", [(0.0, RuntimeError("model not found")), (1.0, None)])
+def test_failed_or_slow_warm_up_does_not_block_readiness(fake, monkeypatch, delay, error):
+    monkeypatch.setattr(settings, "WARMUP_TIMEOUT_SECONDS", 0.1)
+    fake.warmup_delay, fake.warmup_error = delay, error
+    with TestClient(api.app) as client:
+        assert fake.warmed_with is None
+        assert client.get("/ready").status_code == 200
@@ -0,0 +1,70 @@
+"""
+Measure how long the API takes to import and which modules dominate.
+
+Usage:
+    python utils/startup_benchmark.py [--top 15]
+
+Runs `python -X importtime -c "import api"` in a fresh interpreter, prints
+the slowest modules by cumulative import time, then times importing each
+LLM backend on its own so the cost of selecting a backend is visible.
+"""
+import argparse
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parents[1]
+sys.path.insert(0, str(ROOT_DIR))
+
+from cognition.llms import BACKENDS
+
+
+def import_times(statement: str):
+    """Return [(cumulative_us, module)] for every module imported by `statement`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        times.append((int(cumulative), module.strip()))
+    return times
+
+
+def wall_time(statement: str) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", statement], cwd=ROOT_DIR, capture_output=True, check=True)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API import time")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest modules to show")
+    args = parser.parse_args()
+
+    baseline = wall_time("pass")
+    print(f"Interpreter startup: {baseline:.3f}s")
+
+    times = import_times("import api")
+    print(f"import api: {wall_time('import api') - baseline:.3f}s\n")
+    print(f"Top {args.top} modules by cumulative import time:")
+    for cumulative, module in sorted(times, reverse=True)[:args.top]:
+        print(f"  {cumulative / 1e6:8.3f}s  {module}")
+
+    print("\nBackend import cost (on top of `import api`):")
+    for name, (module, _) in BACKENDS.items():
+        try:
+            elapsed = wall_time(f"import api, {module}") - wall_time("import api")
+            print(f"  {name:12s} {elapsed:8.3f}s  ({module})")
+        except subprocess.CalledProcessError:
+            print(f"  {name:12s} {'n/a':>8s}  ({module} failed to import)")
+
+
+if __name__ == "__main__":
+    main()